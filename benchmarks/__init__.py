@@ -0,0 +1 @@
+"""Performance benchmarks for pyscdi against a local mock SCDI server."""
@@ -0,0 +1,344 @@
+"""In-process stand-in for the SCDI HTTP API
+
+Implements the endpoints used by :mod:`pyscdi` with in-memory storage:
+bucket ``?create``/``?delete``/``?meta``/``?list``, bucket listing,
+objects (single part, multipart ``partNumber``/``?complete``, ranged
+GET), timeseries ``PUT``/``?batch``/``?query`` (with count, sum, min,
+max and avg aggregates) and key-value ``?key=``. Latency and error rate can be injected to exercise the
+client's retry and concurrency paths. Compressed request bodies are
+decoded, and JSON responses can be gzip-compressed for clients that
+accept it.
+
+Usage::
+
+    server = MockServer(latency=0.002, error_rate=0.01).start()
+    conn = Scdi('user', 'key', api_url=server.api_url)
+    ...
+    server.stop()
+
+:class:`MockServerProcess` runs the same server in a child process, so
+its allocations and CPU time stay out of the process being measured.
+
+"""
+from __future__ import division, print_function
+import gzip
+import hashlib
+import json
+import multiprocessing
+import random
+import re
+import threading
+import time
+import zlib
+
+try:
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    from urllib.parse import urlsplit, parse_qs
+except ImportError:  # pragma: no cover
+    raise ImportError('benchmarks require Python 3.7+')
+
+_RANGE = re.compile(r'bytes=(\d+)-(\d*)')
+
+_OPS = {
+    'lt': lambda a, b: a < b,
+    'lte': lambda a, b: a <= b,
+    'gt': lambda a, b: a > b,
+    'gte': lambda a, b: a >= b,
+    'eq': lambda a, b: a == b,
+    'ne': lambda a, b: a != b,
+}
+
+
+class _Bucket:
+    def __init__(self, meta):
+        self.meta = meta
+        self.objects = dict()
+        self.uploads = dict()
+        self.rows = []
+        self.kv = dict()
+        ts = [c['name'] for c in meta.get('columns', []) if c.get('type') == 'timestamp']
+        self.ts_column = ts[0] if ts else None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body go out as separate writes
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def _send(self, code, body=b'', headers=None):
+        headers = dict(headers or {})
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+            if (self.server.mock.compress_responses and len(body) > 1024 and
+                    'gzip' in (self.headers.get('Accept-Encoding') or '')):
+                body = gzip.compress(body, 6)
+                headers['Content-Encoding'] = 'gzip'
+        self.send_response(code)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        n = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(n) if n else b''
+        encoding = self.headers.get('Content-Encoding')
+        if encoding == 'gzip':
+            body = gzip.decompress(body)
+        elif encoding == 'deflate':
+            body = zlib.decompress(body)
+        return body
+
+    def _dispatch(self, verb):
+        server = self.server.mock
+        url = urlsplit(self.path)
+        query = parse_qs(url.query, keep_blank_values=True)
+        body = self._read_body()
+        server.requests += 1
+        if server.latency:
+            time.sleep(server.latency)
+        if server.error_rate and random.random() < server.error_rate:
+            return self._send(server.error_status, b'injected error')
+        prefix = urlsplit(server.api_url).path
+        parts = url.path[len(prefix):].split('/', 2)
+        bucketname = parts[1] if len(parts) > 1 else None
+        objectname = parts[2] if len(parts) > 2 else None
+        with server.lock:
+            try:
+                return self._route(server, verb, query, body, bucketname, objectname)
+            except (KeyError, ValueError) as e:
+                return self._send(400, str(e).encode('utf-8'))
+
+    def _route(self, server, verb, query, body, bucketname, objectname):
+        if bucketname is None:
+            return self._send(200, sorted(server.buckets))
+        if 'create' in query and objectname is None:
+            if bucketname in server.buckets:
+                return self._send(409, b'exists')
+            server.buckets[bucketname] = _Bucket(json.loads(body.decode('utf-8') or '{}'))
+            return self._send(200, b'')
+        bucket = server.buckets.get(bucketname)
+        if 'meta' in query:
+            return self._send(200, bucket.meta if bucket is not None else b'')
+        if bucket is None:
+            return self._send(404, b'no such bucket')
+        if 'delete' in query:
+            del server.buckets[bucketname]
+            return self._send(200, b'')
+        if 'list' in query:
+            return self._send(200, [{'name': name, 'size': len(data),
+                                     'etag': etag} for name, (data, etag)
+                                    in sorted(bucket.objects.items())])
+        if objectname is not None:
+            return self._object(bucket, verb, query, body, objectname)
+        if 'key' in query:
+            return self._keyvalue(bucket, verb, body, query['key'][0])
+        if 'batch' in query:
+            bucket.rows.extend(json.loads(body.decode('utf-8')))
+            return self._send(200, b'')
+        if 'query' in query:
+            return self._send(200, self._query(bucket, json.loads(body.decode('utf-8') or '{}')))
+        if verb == 'PUT':
+            bucket.rows.append(json.loads(body.decode('utf-8')))
+            return self._send(200, b'')
+        return self._send(400, b'unsupported request')
+
+    def _object(self, bucket, verb, query, body, name):
+        if 'create' in query:
+            bucket.uploads[name] = dict()
+            return self._send(200, b'')
+        if 'complete' in query:
+            parts = bucket.uploads.pop(name)
+            data = b''.join(parts[n][0] for n in sorted(parts))
+            digest = hashlib.md5(b''.join(bytes.fromhex(parts[n][1]) for n in sorted(parts)))
+            etag = '%s-%d' % (digest.hexdigest(), len(parts))
+            bucket.objects[name] = (data, etag)
+            return self._send(200, b'', {'ETag': '"%s"' % etag})
+        if verb == 'PUT':
+            digest = hashlib.md5(body).hexdigest()
+            expected = self.headers.get('Content-MD5')
+            if expected is not None and expected != digest:
+                return self._send(400, b'md5 mismatch')
+            if 'partNumber' in query:
+                bucket.uploads[name][int(query['partNumber'][0])] = (body, digest)
+            else:
+                bucket.objects[name] = (body, digest)
+            return self._send(200, b'', {'ETag': '"%s"' % digest})
+        if verb == 'DELETE':
+            del bucket.objects[name]
+            return self._send(200, b'')
+        data, etag = bucket.objects[name]
+        match = _RANGE.match(self.headers.get('Range') or '')
+        if match and data and self.server.mock.ranges:
+            start = int(match.group(1))
+            end = min(int(match.group(2) or len(data) - 1), len(data) - 1)
+            return self._send(206, data[start:end + 1], {
+                'Content-Range': 'bytes %d-%d/%d' % (start, end, len(data)),
+                'ETag': '"%s"' % etag})
+        return self._send(200, data, {'ETag': '"%s"' % etag})
+
+    def _keyvalue(self, bucket, verb, body, key):
+        if verb == 'POST':
+            bucket.kv[key] = body
+            return self._send(200, b'')
+        if key not in bucket.kv:
+            return self._send(404, b'no such key')
+        etag = '"%s"' % hashlib.md5(bucket.kv[key]).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            return self._send(304, b'', {'ETag': etag})
+        return self._send(200, bucket.kv[key], {'ETag': etag})
+
+    def _query(self, bucket, payload):
+        ts = bucket.ts_column
+        rows = bucket.rows
+        if ts is not None:
+            if 'fromEpoch' in payload:
+                rows = [r for r in rows if r.get(ts, 0) >= payload['fromEpoch']]
+            if 'toEpoch' in payload:
+                rows = [r for r in rows if r.get(ts, 0) <= payload['toEpoch']]
+            rows = sorted(rows, key=lambda r: r.get(ts, 0))
+        for cond in payload.get('where', []):
+            op = _OPS[cond['op']]
+            rows = [r for r in rows if cond['column'] in r and op(r[cond['column']], cond['value'])]
+        if 'limit' in payload:
+            rows = rows[:payload['limit']]
+        if payload.get('aggregate'):
+            return [self._aggregate(rows, payload['aggregate'])]
+        return rows
+
+    def _aggregate(self, rows, aggregate):
+        out = dict()
+        for spec in aggregate:
+            fn, column = spec['op'], spec.get('column')
+            values = [r[column] for r in rows if r.get(column) is not None] if column else rows
+            if fn == 'count':
+                value = len(values)
+            elif not values:
+                value = None
+            elif fn == 'sum':
+                value = sum(values)
+            elif fn == 'min':
+                value = min(values)
+            elif fn == 'max':
+                value = max(values)
+            elif fn in ('avg', 'mean'):
+                value = sum(values) / len(values)
+            else:
+                raise ValueError('unsupported aggregate: %s' % fn)
+            out[spec.get('as') or '%s(%s)' % (fn, column or '*')] = value
+        return out
+
+
+class MockServer:
+    """A local SCDI stand-in running on a background thread."""
+
+    def __init__(self, host='127.0.0.1', port=0, username='bench', latency=0.0,
+                 error_rate=0.0, error_status=503, compress_responses=False, ranges=True):
+        """
+        Kwargs:
+            host (str): interface to bind.
+            port (int): port to bind, 0 picks a free one.
+            username (str): SCDI username served under ``api_url``.
+            latency (float): seconds added to every request.
+            error_rate (float): fraction of requests answered with
+                error_status.
+            error_status (int): HTTP status of injected errors.
+            compress_responses (bool): gzip JSON responses over 1 KB.
+            ranges (bool): honour Range headers; when False objects are
+                always sent whole with a 200.
+
+        """
+        self.username = username
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.compress_responses = compress_responses
+        self.ranges = ranges
+        self.buckets = dict()
+        self.requests = 0
+        self.lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.mock = self
+        self._thread = None
+        self.api_url = 'http://%s:%d/api/v1/' % self._httpd.server_address[:2]
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='scdi-mock')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+
+
+def _serve(pipe, kwargs):
+    server = MockServer(**kwargs).start()
+    pipe.send((server.username, server.api_url))
+    pipe.recv()
+    server.stop()
+    pipe.send(server.requests)
+
+
+class MockServerProcess:
+    """A :class:`MockServer` running in a child process.
+
+    Takes the same arguments as :class:`MockServer`. The stored data is
+    not reachable from the parent, and ``requests`` is only set once the
+    server is stopped.
+
+    """
+
+    def __init__(self, **kwargs):
+        self._kwargs = kwargs
+        self._pipe = None
+        self._process = None
+        self.username = None
+        self.api_url = None
+        self.requests = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self._pipe, child = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_serve, args=(child, self._kwargs),
+                                                name='scdi-mock')
+        self._process.daemon = True
+        self._process.start()
+        self.username, self.api_url = self._pipe.recv()
+        return self
+
+    def stop(self):
+        self._pipe.send(None)
+        self.requests = self._pipe.recv()
+        self._process.join()
+        self._pipe.close()
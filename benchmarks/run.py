@@ -0,0 +1,250 @@
+"""Benchmarks for pyscdi against the local mock server
+
+Usage::
+
+    python -m benchmarks.run                       # full suite
+    python -m benchmarks.run --quick --only kv     # a subset
+    python -m benchmarks.run --output new.json --compare old.json
+
+Each case reports throughput, latency percentiles and the peak Python
+heap allocation (tracemalloc) of the benchmark process while it runs.
+The mock server runs in a child process, so the peak covers the client
+and the case's own arguments, not the server building its responses. With
+``--compare`` the run fails when a case's throughput drops by more than
+``--threshold`` relative to the baseline file.
+
+"""
+from __future__ import division, print_function
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from pyscdi import Scdi, RetryPolicy
+from .mockserver import MockServerProcess
+
+COLUMNS = [
+    {'name': 'ts', 'type': 'timestamp', 'indexed': True},
+    {'name': 'temp', 'type': 'double', 'indexed': True},
+    {'name': 'remark', 'type': 'varchar', 'indexed': False},
+]
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return None
+    k = min(len(values) - 1, int(round(q / 100.0 * (len(values) - 1))))
+    return values[k]
+
+
+def measure(name, fn, repeat, concurrency=1, nbytes=0, params=None):
+    """Runs fn repeat times on concurrency threads and summarises it."""
+    latencies = []
+
+    def timed(_):
+        t = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    if concurrency == 1:
+        for i in range(repeat):
+            timed(i)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(timed, range(repeat)))
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    result = {
+        'name': name,
+        'params': params or {},
+        'ops': repeat,
+        'seconds': elapsed,
+        'ops_per_sec': repeat / elapsed,
+        'mb_per_sec': nbytes * repeat / elapsed / 1e6,
+        'p50_ms': _percentile(latencies, 50) * 1e3,
+        'p90_ms': _percentile(latencies, 90) * 1e3,
+        'p99_ms': _percentile(latencies, 99) * 1e3,
+        'peak_mb': peak / 1e6,
+    }
+    print('%-40s %9.1f ops/s %8.1f MB/s  p50 %7.2fms  p99 %7.2fms  peak %7.1f MB' % (
+        _case_id(result), result['ops_per_sec'], result['mb_per_sec'],
+        result['p50_ms'], result['p99_ms'], result['peak_mb']))
+    sys.stdout.flush()
+    return result
+
+
+def _ratio(value):
+    return '-' if value is None else '%.2f' % value
+
+
+def _case_id(result):
+    params = ','.join('%s=%s' % kv for kv in sorted(result['params'].items()))
+    return '%s[%s]' % (result['name'], params)
+
+
+def bench_kws(conn, tmpdir, quick):
+    results = []
+    bucket = conn.create_kws_bucket('bench_kws')
+    sizes = [256 * 1024, 4 * 1024 * 1024] if quick else [256 * 1024, 4 * 1024 * 1024, 32 * 1024 * 1024]
+    for size in sizes:
+        path = os.path.join(tmpdir, 'obj_%d' % size)
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+        repeat = max(2, min(20, (64 * 1024 * 1024) // size))
+        for workers in (1, 4):
+            results.append(measure(
+                'put_object', lambda: bucket.put_object('o_%d' % size, path, max_size=1024 * 1024,
+                                                        max_workers=workers),
+                repeat, nbytes=size, params={'size': size, 'workers': workers}))
+        out = os.path.join(tmpdir, 'out')
+        results.append(measure(
+            'get_object', lambda: bucket.get_object('o_%d' % size),
+            repeat, nbytes=size, params={'size': size, 'mode': 'memory'}))
+        for workers in (1, 4):
+            results.append(measure(
+                'get_object_as_file', lambda: bucket.get_object_as_file(
+                    'o_%d' % size, out, max_workers=workers, part_size=1024 * 1024),
+                repeat, nbytes=size, params={'size': size, 'workers': workers}))
+    conn.drop_bucket('bench_kws')
+    return results
+
+
+def bench_timeseries(conn, quick):
+    results = []
+    bucket = conn.create_timeseries_bucket('bench_ts', COLUMNS)
+    counter = [0]
+
+    def rows(n):
+        base = counter[0]
+        counter[0] += n
+        return [{'ts': base + i, 'temp': 20.0 + i % 10, 'remark': 'r%d' % (i % 7)}
+                for i in range(n)]
+
+    for batch in (1, 100, 1000):
+        for concurrency in ((1, 8) if not quick else (1,)):
+            repeat = 200 if batch == 1 else (50 if batch == 100 else 10)
+            payloads = [rows(batch) for _ in range(repeat)]
+            it = iter(payloads)
+            results.append(measure(
+                'add_rows', lambda: bucket.add_rows(next(it)), repeat, concurrency,
+                nbytes=len(json.dumps(payloads[0])), params={'batch': batch, 'concurrency': concurrency}))
+    total = counter[0]
+    for n in (1000, 10000):
+        results.append(measure(
+            'query', lambda: bucket.query(fromEpoch=0, limit=n), 5 if quick else 20,
+            params={'rows': min(n, total)}))
+        results.append(measure(
+            'query_stream', lambda: sum(1 for _ in bucket.query(fromEpoch=0, limit=n, stream=True)),
+            5 if quick else 20, params={'rows': min(n, total)}))
+    aggregate = [{'op': 'count', 'column': 'temp'}, {'op': 'avg', 'column': 'temp'}]
+    results.append(measure(
+        'query_aggregate', lambda: bucket.query(fromEpoch=0, toEpoch=total, aggregate=aggregate),
+        5 if quick else 20, params={'rows': total, 'partitions': 1}))
+    results.append(measure(
+        'query_aggregate', lambda: bucket.query_aggregate(0, total, aggregate,
+                                                          partition=total / 8.0),
+        5 if quick else 20, params={'rows': total, 'partitions': 8}))
+    conn.drop_bucket('bench_ts')
+    return results
+
+
+def bench_keyvalue(conn, quick):
+    results = []
+    bucket = conn.create_keyvalue_bucket('bench_kv')
+    value = os.urandom(1024)
+    keys = ['key%d' % i for i in range(200 if quick else 1000)]
+    for concurrency in (1, 8, 32):
+        results.append(measure(
+            'kv_put_many', lambda: bucket.put_many(dict((k, value) for k in keys),
+                                                   max_workers=concurrency),
+            3, nbytes=len(value) * len(keys), params={'keys': len(keys), 'concurrency': concurrency}))
+        results.append(measure(
+            'kv_get_many', lambda: bucket.get_many(keys, max_workers=concurrency),
+            3, nbytes=len(value) * len(keys), params={'keys': len(keys), 'concurrency': concurrency}))
+    results.append(measure('kv_get', lambda: bucket.get(keys[0]), 200, params={'concurrency': 1}))
+    conn.drop_bucket('bench_kv')
+    return results
+
+
+SUITES = {
+    'kws': lambda conn, tmpdir, quick: bench_kws(conn, tmpdir, quick),
+    'timeseries': lambda conn, tmpdir, quick: bench_timeseries(conn, quick),
+    'kv': lambda conn, tmpdir, quick: bench_keyvalue(conn, quick),
+}
+
+
+def compare(results, baseline, threshold):
+    """Returns the cases whose throughput regressed beyond threshold."""
+    old = dict((_case_id(r), r) for r in baseline)
+    regressions = []
+    for r in results:
+        prev = old.get(_case_id(r))
+        if prev is None:
+            continue
+        change = r['ops_per_sec'] / prev['ops_per_sec'] - 1.0
+        if change < -threshold:
+            regressions.append((_case_id(r), change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--only', action='append', choices=sorted(SUITES),
+                        help='run only this suite (repeatable)')
+    parser.add_argument('--quick', action='store_true', help='smaller payloads and fewer cases')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds of latency injected per request')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of requests answered with HTTP 503')
+    parser.add_argument('--pool-size', type=int, default=32, help='client connection pool size')
+    parser.add_argument('--compression', choices=['gzip', 'deflate'],
+                        help='compress request bodies and ask for compressed responses')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='baseline JSON file from a previous run')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed relative throughput drop against the baseline')
+    args = parser.parse_args(argv)
+
+    results = []
+    with MockServerProcess(latency=args.latency, error_rate=args.error_rate,
+                           compress_responses=args.compression is not None) as server:
+        conn = Scdi(server.username, 'bench', api_url=server.api_url,
+                    pool_maxsize=args.pool_size, compression=args.compression,
+                    retry_policy=RetryPolicy(backoff=0.01, max_backoff=0.1))
+        tmpdir = tempfile.mkdtemp(prefix='pyscdi-bench-')
+        try:
+            for name in args.only or sorted(SUITES):
+                results.extend(SUITES[name](conn, tmpdir, args.quick))
+        finally:
+            for f in os.listdir(tmpdir):
+                os.remove(os.path.join(tmpdir, f))
+            os.rmdir(tmpdir)
+    print('%d requests served, client metrics:' % server.requests)
+    for op, stats in sorted(conn.metrics.snapshot().items()):
+        print('  %-20s %6d requests %5d retries %5d errors  ratio sent %s received %s' % (
+            op, stats['requests'], stats['retries'], stats['errors'],
+            _ratio(stats['sent_ratio']), _ratio(stats['received_ratio'])))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for case, change in regressions:
+            print('REGRESSION %s: throughput %+.0f%%' % (case, change * 100))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
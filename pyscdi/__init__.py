@@ -5,3 +5,10 @@
 """
 from .main import Scdi
 from .main import Kws, Timeseries, Geotemporal, Keyvalue, Tabular
+from .aio import AsyncScdi
+from .writer import BufferedWriter
+from .spool import Spool, SpoolFull
+from .cache import QueryCache, KeyvalueCache
+from .retry import RetryPolicy, RetryBudget
+from .metrics import Metrics
+from .spatial import GridIndex
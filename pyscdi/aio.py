@@ -0,0 +1,541 @@
+"""Asyncio binding for SCDI
+
+The classes in this module mirror :class:`pyscdi.Scdi` and the bucket
+classes, but every network call is a coroutine. All buckets created from
+one :class:`AsyncScdi` share a single ``aiohttp`` connection pool.
+
+Requires ``aiohttp`` (``pip install pyscdi[async]``).
+
+"""
+from __future__ import division, print_function
+from .main import ScdiException, LOGGER
+from .retry import RetryPolicy, CONNECT_TIMEOUT, READ_TIMEOUT, CONNECTION_ERROR
+from .utils import md5_ba, getSize
+from .settings import API_URL
+from .serialization import default_serializer
+import asyncio
+import time
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+
+class AsyncResponse:
+    """A fully read HTTP response."""
+    def __init__(self, status_code, headers, content, loads):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self._loads = loads
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self):
+        return self._loads(self.content)
+
+
+class AsyncScdi:
+    """Asyncio SCDI Connection
+
+        The asyncio counterpart of :class:`pyscdi.Scdi`. Use it as an async
+        context manager, or call :meth:`close` when done.
+
+    """
+
+    def __init__(self, username, api_key, api_url=API_URL, max_connections=100,
+                 max_in_flight=None, retry_policy=None, serializer=None, deadline=None):
+        """Asyncio SCDI connector class.
+
+        Args:
+           username (str): SCDI username.
+           api_key (str): a valid API key.
+           api_url (str): an endpoint to scdi server
+
+        Kwargs:
+           max_connections (int): size of the shared connection pool.
+           max_in_flight (int): maximum number of concurrent requests,
+               defaults to max_connections.
+           retry_policy (RetryPolicy): decides which failed requests are
+               retried and how long to back off.
+           serializer: encodes JSON bodies and decodes JSON responses, see
+               :mod:`pyscdi.serialization`.
+           deadline (float): default limit in seconds on each request,
+               retries, backoff and streamed bodies included.
+
+        """
+        if aiohttp is None:
+            raise ScdiException('aiohttp is required for AsyncScdi')
+        self._username = username
+        self._api_key = api_key
+        self._headers = {
+            'APIKEY': self._api_key,
+            'User-Agent': 'pyscdi/0.2'
+        }
+        self._api_url = api_url
+        self._max_connections = max_connections
+        self._max_in_flight = max_in_flight or max_connections
+        self._retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self._serializer = serializer if serializer is not None else default_serializer()
+        self.deadline = deadline
+        self._s = None
+        self._sem = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        """Closes the shared connection pool."""
+        if self._s is not None:
+            await self._s.close()
+            self._s = None
+
+    def _session(self):
+        # aiohttp sessions must be created inside the running loop
+        if self._s is None:
+            connector = aiohttp.TCPConnector(limit=self._max_connections)
+            self._s = aiohttp.ClientSession(connector=connector)
+            self._sem = asyncio.Semaphore(self._max_in_flight)
+        return self._s
+
+    async def _make_request(self, verb, uri, params=None, data=None, json=None,
+            timeout=60.0, max_retries=None, headers=None, sink=None, deadline=None):
+        if verb not in ['GET', 'POST', 'PUT', 'DELETE']:
+            raise ScdiException('method not supported')
+        session = self._session()
+        retry_count = 0
+        merged_headers = dict(self._headers)
+        if json is not None:
+            data = self._serializer.dumps(json)
+            merged_headers['Content-Type'] = 'application/json'
+        if headers is not None:
+            for k in headers:
+                merged_headers[k] = headers[k]
+        if deadline is None:
+            deadline = self.deadline
+        end = time.time() + deadline if deadline is not None else None
+        # bytes handed to sink; a retry after a partial body would append
+        # the whole body again
+        sunk = 0
+        while True:
+            attempt_timeout = timeout
+            if end is not None:
+                attempt_timeout = min(timeout, end - time.time())
+                if attempt_timeout <= 0:
+                    raise asyncio.TimeoutError('Deadline of %.1fs exceeded' % deadline)
+            # like requests, the timeout bounds connecting and each read, not
+            # the whole transfer; only a deadline bounds that
+            client_timeout = aiohttp.ClientTimeout(
+                total=end - time.time() if end is not None else None,
+                sock_connect=attempt_timeout, sock_read=attempt_timeout)
+            response_headers = None
+            try:
+                async with self._sem:
+                    async with session.request(verb, uri, params=params, headers=merged_headers,
+                                               data=data, timeout=client_timeout) as r:
+                        r.raise_for_status()
+                        if sink is not None:
+                            # stream the body into sink instead of buffering it
+                            loop = asyncio.get_running_loop()
+                            async for chunk in r.content.iter_chunked(1048576):
+                                # sink may block, e.g. on file writes
+                                await loop.run_in_executor(None, sink, chunk)
+                                sunk += len(chunk)
+                            content = b''
+                        else:
+                            content = await r.read()
+                        return AsyncResponse(r.status, r.headers, content,
+                                             self._serializer.loads)
+
+            except aiohttp.ClientResponseError as e:
+                reason = e.status
+                response_headers = e.headers
+                error = e
+
+            except asyncio.TimeoutError as e:
+                # aiohttp >= 3.10 tells sock_connect timeouts apart
+                connect_timeout = getattr(aiohttp, 'ConnectionTimeoutError', ())
+                reason = CONNECT_TIMEOUT if isinstance(e, connect_timeout) else READ_TIMEOUT
+                error = e
+
+            except aiohttp.ClientConnectorError as e:
+                # the request never reached the server
+                reason = CONNECT_TIMEOUT if isinstance(e.os_error, TimeoutError) else CONNECTION_ERROR
+                error = e
+
+            except aiohttp.ClientConnectionError as e:
+                reason = CONNECTION_ERROR
+                error = e
+
+            decision = self._retry_policy.decide(verb, uri, retry_count, reason,
+                                                 headers=response_headers, deadline=end,
+                                                 max_retries=max_retries)
+            if not decision.retry or sunk:
+                if reason in (CONNECT_TIMEOUT, READ_TIMEOUT):
+                    LOGGER.error("Connection timeout!")
+                elif reason == CONNECTION_ERROR:
+                    LOGGER.error("Connection error!")
+                raise error
+            if reason == 403:
+                # resource not ready
+                LOGGER.warning("Bucket not ready. Retrying in %.1fs...", decision.delay)
+            else:
+                LOGGER.warning("Request failed (%s). Retrying in %.1fs...", reason, decision.delay)
+            retry_count += 1
+            await asyncio.sleep(decision.delay)
+
+    async def _create_bucket(self, bucketname, payload, cls):
+        try:
+            uri = self._api_url + self._username + '/' + bucketname + '?create'
+            await self._make_request('POST', uri, json=payload)
+        except aiohttp.ClientResponseError:
+            LOGGER.warning("Bucket %s already exists", bucketname)
+        return cls(self, bucketname)
+
+    async def _get_bucket(self, bucketname, cls):
+        bucket = cls(self, bucketname)
+        if await bucket.get_info() is None:
+            raise ScdiException("Bucket not found")
+        return bucket
+
+    async def create_tabular_bucket(self, bucketname, columns):
+        """Creates a generic tabular bucket.
+
+        Args:
+           bucketname (str): name of the bucket.
+           columns (list): a list of columns.
+
+        """
+        payload = {'type': 'tabular', 'columns': columns}
+        return await self._create_bucket(bucketname, payload, AsyncTabular)
+
+    async def get_tabular_bucket(self, bucketname):
+        """Connects to an existing tabular bucket.
+
+        Args:
+           bucketname (str): name of the bucket.
+
+        """
+        return await self._get_bucket(bucketname, AsyncTabular)
+
+    async def create_timeseries_bucket(self, bucketname, columns):
+        """Creates a new timeseries bucket.
+
+        Args:
+           bucketname (str): name of the bucket.
+           columns (list): a list of columns.
+
+        """
+        payload = {'type': 'timeseries', 'columns': columns}
+        return await self._create_bucket(bucketname, payload, AsyncTimeseries)
+
+    async def get_timeseries_bucket(self, bucketname):
+        """Connects to an existing timeseries bucket.
+
+        Args:
+           bucketname (str): name of the bucket.
+
+        """
+        return await self._get_bucket(bucketname, AsyncTimeseries)
+
+    async def create_geotemporal_bucket(self, bucketname, columns):
+        """Creates a new geotemporal bucket.
+
+        Args:
+           bucketname (str): name of the bucket.
+           columns (list): a list of columns.
+
+        """
+        payload = {'type': 'geotemporal', 'columns': columns}
+        return await self._create_bucket(bucketname, payload, AsyncGeotemporal)
+
+    async def get_geotemporal_bucket(self, bucketname):
+        """Connects to an existing geotemporal bucket.
+
+        Args:
+           bucketname (str): name of the bucket.
+
+        """
+        return await self._get_bucket(bucketname, AsyncGeotemporal)
+
+    async def create_keyvalue_bucket(self, bucketname):
+        """Creates a new key-value bucket.
+
+        Args:
+           bucketname (str): name of the bucket.
+
+        """
+        return await self._create_bucket(bucketname, {'type': 'keyvalue'}, AsyncKeyvalue)
+
+    async def get_keyvalue_bucket(self, bucketname):
+        """Connects to an existing key-value bucket.
+
+        Args:
+           bucketname (str): name of the bucket.
+
+        """
+        return await self._get_bucket(bucketname, AsyncKeyvalue)
+
+    async def create_kws_bucket(self, bucketname):
+        """Creates a new KWS bucket.
+
+        Args:
+           bucketname (str): name of the bucket.
+
+        """
+        return await self._create_bucket(bucketname, {'type': 'object'}, AsyncKws)
+
+    async def get_kws_bucket(self, bucketname):
+        """Connects to an existing KWS bucket.
+
+        Args:
+           bucketname (str): name of the bucket.
+
+        """
+        return await self._get_bucket(bucketname, AsyncKws)
+
+    async def drop_bucket(self, bucketname):
+        """Removes an existing bucket.
+
+        Args:
+           bucketname (str): name of the bucket.
+
+        """
+        uri = self._api_url + self._username + '/' + bucketname + '?delete'
+        return await self._make_request('DELETE', uri)
+
+    async def get_buckets(self):
+        """Get all buckets."""
+        uri = self._api_url + self._username
+        r = await self._make_request('GET', uri)
+        if r.status_code == 200:
+            return r.json()
+        else:
+            return []
+
+
+class AsyncBaseBucket:
+    """Base class for asyncio bucket"""
+    def __init__(self, conn, bucketname):
+        self._conn = conn
+        self._bucketname = bucketname
+        self._api_url = conn._api_url
+
+    async def get_info(self):
+        uri = self._api_url + self._conn._username + '/' + self._bucketname + '?meta'
+        r = await self._conn._make_request('GET', uri)
+        if len(r.content) > 1:
+            return r.json()
+        else:
+            return None
+
+    async def list_objects(self):
+        """List objects in a bucket."""
+        uri = self._api_url + self._conn._username + '/' + self._bucketname + '?list'
+        r = await self._conn._make_request('GET', uri)
+        if r.status_code == 200:
+            return r.json()
+        else:
+            return []
+
+
+class AsyncKws(AsyncBaseBucket):
+    """Asyncio KWS Bucket"""
+    async def _put_part(self, objectName, partNumber, byteArr, md5hex=None):
+        if md5hex is None:
+            # hashing a part would stall every coroutine on the loop
+            md5hex = await asyncio.get_running_loop().run_in_executor(None, md5_ba, byteArr)
+        headers = {'Content-MD5': md5hex, 'Content-Length': str(len(byteArr))}
+        uri = self._api_url + self._conn._username + '/' + self._bucketname + '/' + objectName
+        await self._conn._make_request('PUT', uri, params={'partNumber': partNumber},
+                                       data=byteArr, headers=headers)
+
+    async def get_object_as_file(self, objectName, filename):
+        """Downloads an object as a file
+
+        Args:
+            objectName (str): name of the object.
+            filename (str): the output file.
+
+        """
+        uri = self.get_object_url(objectName)
+        with open(filename, 'wb') as f:
+            await self._conn._make_request('GET', uri, sink=f.write)
+
+    async def get_object(self, objectName):
+        """Downloads an object as bytes
+
+        Args:
+            objectName (str): name of the object.
+
+        Returns:
+            bytes.
+        """
+        r = await self._conn._make_request('GET', self.get_object_url(objectName))
+        return r.content
+
+    def get_object_url(self, objectName):
+        """Gets the object URL.
+
+        Args:
+            objectName (str): name of the object.
+
+        Returns:
+            str.
+        """
+        uri = self._api_url + self._conn._username + '/' + self._bucketname + '/' + objectName
+        return uri
+
+    async def put_object(self, objectName, path, max_size=3000000, max_workers=4):
+        """Uploads a file to an object.
+
+        Large files are uploaded as parts of max_size bytes, at most
+        max_workers at a time.
+
+        Args:
+            objectName (str): name of the object.
+            path (str): location of the file to upload
+
+        Kwargs:
+            max_size (int): part size in bytes.
+            max_workers (int): number of parts uploaded concurrently.
+
+        Returns:
+            str. HTTP Response text.
+        """
+        loop = asyncio.get_running_loop()
+        size = int(getSize(path))
+        uri = self.get_object_url(objectName)
+
+        def read_part(offset):
+            with open(path, 'rb') as fh:
+                fh.seek(offset)
+                data = fh.read(max_size)
+            return data, md5_ba(data)
+
+        if size < max_size:
+            # do single part upload; the file is read once and the buffer
+            # read is hashed, both off the event loop
+            data, md5hex = await loop.run_in_executor(None, read_part, 0)
+            headers = {'Content-MD5': md5hex, 'Content-Length': str(len(data))}
+            r = await self._conn._make_request('PUT', uri, data=data, headers=headers)
+            return r.text
+
+        # do multipart upload
+        await self._conn._make_request('POST', uri + '?create')
+        sem = asyncio.Semaphore(max(1, int(max_workers)))
+
+        async def upload(partNo, offset):
+            # the semaphore bounds how many parts are held in memory
+            async with sem:
+                data, md5hex = await loop.run_in_executor(None, read_part, offset)
+                await self._put_part(objectName, partNo, data, md5hex)
+
+        await asyncio.gather(*[upload(partNo, offset) for partNo, offset
+                               in enumerate(range(0, size, max_size), 1)])
+        r = await self._conn._make_request('POST', uri + '?complete')
+        return r.text
+
+    async def delete_object(self, objectName):
+        """Deletes an object.
+
+        Args:
+            objectName (str): name of the object.
+        """
+        r = await self._conn._make_request('DELETE', self.get_object_url(objectName))
+        return r.text
+
+
+class AsyncTimeseries(AsyncBaseBucket):
+    async def add_row(self, payload):
+        """Adds a row to the timeseries bucket.
+
+        Args:
+            payload (dict): row data
+
+        Returns:
+            str. HTTP Response text.
+        """
+        uri = self._api_url + self._conn._username + '/' + self._bucketname
+        r = await self._conn._make_request('PUT', uri, json=payload)
+        return r.text
+
+    async def add_rows(self, payload):
+        """Adds multiple rows to the timeseries bucket.
+
+        Args:
+            payload (list): rows of data
+
+        Returns:
+            str. HTTP Response text.
+        """
+        uri = self._api_url + self._conn._username + '/' + self._bucketname
+        r = await self._conn._make_request('POST', uri + '?batch', json=payload)
+        return r.text
+
+    async def query(self, fromEpoch=None, toEpoch=None, limit=None, where=None, aggregate=None):
+        """Queries data
+
+        Kwargs:
+            fromEpoch (float): Begin time (epoch) time
+            toEpoch (float): End time (epoch) time
+            limit (int): Maximum number of records returned
+            where (list): a list of where filter
+            aggregate (list): a list of aggregate filter
+
+        Returns:
+            list. List of returned rows.
+        """
+        uri = self._api_url + self._conn._username + '/' + self._bucketname
+        payload = dict()
+        if fromEpoch is not None: payload['fromEpoch'] = fromEpoch
+        if toEpoch is not None: payload['toEpoch'] = toEpoch
+        if limit is not None: payload['limit'] = limit
+        if where is not None: payload['where'] = where
+        if aggregate is not None: payload['aggregate'] = aggregate
+        r = await self._conn._make_request('POST', uri + '?query', json=payload)
+        if len(r.content) > 1:
+            return r.json()
+        return []
+
+
+class AsyncGeotemporal(AsyncTimeseries):
+    pass
+
+
+class AsyncTabular(AsyncTimeseries):
+    pass
+
+
+class AsyncKeyvalue(AsyncBaseBucket):
+    async def put(self, key, value):
+        """Puts a key-value pair
+
+        Args:
+            key (str): key string
+            value (bytes): bytes
+
+        """
+        uri = self._api_url + self._conn._username + '/' + self._bucketname
+        r = await self._conn._make_request('POST', uri, params={'key': key}, data=value)
+        return r.content
+
+    async def get(self, key):
+        """Gets a value of a given key
+
+        Args:
+            key (str): key string
+
+        Returns:
+            bytes. Value of a key.
+
+        """
+        uri = self._api_url + self._conn._username + '/' + self._bucketname
+        r = await self._conn._make_request('GET', uri, params={'key': key})
+        return r.content
@@ -0,0 +1,225 @@
+"""Client-side caches"""
+from __future__ import division, print_function
+import collections
+import json
+import threading
+import time
+
+from .serialization import to_jsonable
+
+_MISSING = object()
+
+
+class LRUCache:
+    """A thread-safe LRU cache bounded by entry count and total bytes.
+
+    Entries expire after ``ttl`` seconds (or a per-entry TTL given to
+    :meth:`set`). Hit, miss and eviction counters are available through
+    :meth:`stats`.
+
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=None, ttl=None):
+        """
+        Kwargs:
+            max_entries (int): maximum number of entries.
+            max_bytes (int): maximum total size of the entries.
+            ttl (float): default time-to-live in seconds, None for no expiry.
+
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """Returns the cached value of key, or default when absent or expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= time.time():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, size=1, ttl=_MISSING):
+        """Stores value under key.
+
+        Kwargs:
+            size (int): size of the value in bytes.
+            ttl (float): time-to-live overriding the cache default.
+
+        """
+        if ttl is _MISSING:
+            ttl = self.ttl
+        expires = None if ttl is None else time.time() + ttl
+        with self._lock:
+            # an older value must not outlive a newer one that is too big
+            if key in self._data:
+                self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._data[key] = (value, size, expires)
+            self._bytes += size
+            while (len(self._data) > self.max_entries or
+                   (self.max_bytes is not None and self._bytes > self.max_bytes)):
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def pop(self, key):
+        """Removes key from the cache."""
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self):
+        """Removes all entries."""
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        self._bytes -= self._data.pop(key)[1]
+
+    def stats(self):
+        """Returns a snapshot of the cache counters.
+
+        Returns:
+            dict. hits, misses, evictions, entries and bytes.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self._data), 'bytes': self._bytes}
+
+
+class QueryCache(LRUCache):
+    """Cache for ``Timeseries.query`` responses.
+
+    Responses are keyed on the bucket and a canonical form of the query
+    payload. A window whose ``toEpoch`` is more than ``immutable_after``
+    seconds in the past is assumed not to change any more and is kept for
+    ``immutable_ttl`` seconds instead of ``ttl``. Writes that backfill
+    such old windows are not detected.
+
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64000000, ttl=5.0,
+                 immutable_after=300.0, immutable_ttl=3600.0):
+        """
+        Kwargs:
+            max_entries (int): maximum number of cached responses.
+            max_bytes (int): maximum total size of cached responses.
+            ttl (float): time-to-live of recent windows in seconds.
+            immutable_after (float): age of toEpoch after which a window is
+                treated as immutable, None to disable.
+            immutable_ttl (float): time-to-live of immutable windows.
+
+        """
+        LRUCache.__init__(self, max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+        self.immutable_after = immutable_after
+        self.immutable_ttl = immutable_ttl
+
+    def key(self, uri, payload):
+        """Returns the cache key of a query."""
+        return uri + ' ' + json.dumps(payload, sort_keys=True, separators=(',', ':'),
+                                      default=to_jsonable)
+
+    def ttl_for(self, payload):
+        """Returns the time-to-live of a query's response."""
+        toEpoch = payload.get('toEpoch')
+        if toEpoch is not None and not isinstance(toEpoch, (int, float)):
+            toEpoch = to_jsonable(toEpoch)
+        if (self.immutable_after is not None and isinstance(toEpoch, (int, float)) and
+                toEpoch < time.time() - self.immutable_after):
+            return self.immutable_ttl
+        return self.ttl
+
+
+# missing holds the 404 response of a key the server does not have
+_Entry = collections.namedtuple('_Entry', 'value missing etag modified fresh_until')
+
+
+class KeyvalueCache(LRUCache):
+    """Read-through cache for ``Keyvalue.get``.
+
+    Values are bounded by total bytes with LRU eviction and are fresh for
+    ``ttl`` seconds. Keys the server reports as missing are remembered
+    for ``negative_ttl`` seconds. Stale entries that carry an ETag or
+    Last-Modified validator are kept so they can be revalidated with a
+    conditional request instead of downloading the value again.
+
+    """
+
+    def __init__(self, max_bytes=32000000, max_entries=100000, ttl=60.0, negative_ttl=5.0):
+        """
+        Kwargs:
+            max_bytes (int): maximum total size of cached values.
+            max_entries (int): maximum number of cached keys.
+            ttl (float): freshness of a cached value in seconds.
+            negative_ttl (float): freshness of a missing key in seconds.
+
+        """
+        LRUCache.__init__(self, max_entries=max_entries, max_bytes=max_bytes, ttl=None)
+        self.entry_ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.revalidations = 0
+        self.not_modified = 0
+
+    def lookup(self, key):
+        """Returns the entry of key, fresh or stale, or None."""
+        return self.get(key)
+
+    def is_fresh(self, entry):
+        return entry.fresh_until > time.time()
+
+    def store(self, key, value, headers=None):
+        """Caches a value and its validators."""
+        headers = headers or {}
+        etag = headers.get('ETag')
+        modified = headers.get('Last-Modified')
+        entry = _Entry(value, None, etag, modified, time.time() + self.entry_ttl)
+        # entries without validators are useless once stale
+        ttl = None if (etag or modified) else self.entry_ttl
+        self.set(key, entry, size=len(value) + len(key), ttl=ttl)
+
+    def store_missing(self, key, response):
+        """Caches the 404 response of a missing key."""
+        entry = _Entry(None, response, None, None, time.time() + self.negative_ttl)
+        self.set(key, entry, size=len(key), ttl=self.negative_ttl)
+
+    def revalidated(self, key, entry):
+        """Marks a stale entry fresh again after a 304 response."""
+        with self._lock:
+            self.not_modified += 1
+        self.set(key, entry._replace(fresh_until=time.time() + self.entry_ttl),
+                 size=len(entry.value) + len(key), ttl=None)
+
+    def conditional_headers(self, entry):
+        """Returns the headers revalidating a stale entry."""
+        headers = {}
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.modified:
+            headers['If-Modified-Since'] = entry.modified
+        if headers:
+            with self._lock:
+                self.revalidations += 1
+        return headers
+
+    def stats(self):
+        stats = LRUCache.stats(self)
+        stats['revalidations'] = self.revalidations
+        stats['not_modified'] = self.not_modified
+        return stats
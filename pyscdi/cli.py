@@ -0,0 +1,384 @@
+"""Command line interface
+
+Usage::
+
+    pyscdi ingest mybucket readings-2017.csv readings-2018.csv
+    pyscdi ingest --workers 8 --batch-size 2000 --checkpoint load.ckpt mybucket data.jsonl.gz
+
+``ingest`` streams CSV, JSON-lines or JSON array files (optionally
+gzipped, ``-`` for stdin) into a timeseries, geotemporal or tabular bucket. Values are
+coerced to the column types of the bucket, and ``add_rows`` batches are
+sent from a pool of worker processes. With ``--checkpoint`` the number of
+leading batches known to be written is saved as the load progresses, so
+running the same command again after an interruption skips them; stdin
+cannot be checkpointed.
+Credentials are read from ``--username``/``--api-key`` or the
+``SCDI_USERNAME``/``SCDI_API_KEY`` environment variables.
+
+"""
+from __future__ import division, print_function
+import argparse
+import csv
+import datetime
+import gzip
+import io
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from .main import Scdi, Timeseries
+from .settings import API_URL
+from .serialization import to_jsonable, iter_array
+
+LOGGER = logging.getLogger('scdi')
+
+
+def _number(value):
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            return float(value)
+    return value
+
+
+def _timestamp(value):
+    try:
+        return _number(value)
+    except ValueError:
+        # ISO 8601, naive values taken as UTC
+        return to_jsonable(datetime.datetime.fromisoformat(value))
+
+
+def _boolean(value):
+    if isinstance(value, str):
+        if value.lower() in ('1', 'true', 't', 'yes', 'y'):
+            return True
+        if value.lower() in ('0', 'false', 'f', 'no', 'n'):
+            return False
+        raise ValueError('not a boolean: %r' % value)
+    return bool(value)
+
+
+_COERCE = {
+    'timestamp': _timestamp,
+    'double': lambda v: float(v),
+    'float': lambda v: float(v),
+    'int': lambda v: int(v),
+    'integer': lambda v: int(v),
+    'bigint': lambda v: int(v),
+    'boolean': _boolean,
+    'varchar': lambda v: v if isinstance(v, str) else str(v),
+}
+
+
+def coercers(columns):
+    """Maps column names to functions converting input values."""
+    return dict((c['name'], _COERCE[c.get('type')]) for c in columns
+                if c.get('type') in _COERCE)
+
+
+def coerce_row(row, coerce):
+    """Converts the values of a row to the column types.
+
+    Empty and null values are dropped; columns of unknown type and
+    unknown columns are passed through.
+    """
+    out = dict()
+    for name, value in row.items():
+        if value is None or value == '':
+            continue
+        fn = coerce.get(name)
+        if fn is not None:
+            try:
+                value = fn(value)
+            except (TypeError, ValueError):
+                raise ValueError('column %s: cannot convert %r' % (name, value))
+        out[name] = value
+    return out
+
+
+def _open(path):
+    if path == '-':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def _format(path, fmt):
+    if fmt is not None:
+        return fmt
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    return 'json' if name.endswith('.json') else 'csv'
+
+
+def _json_lines(lines):
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+
+def _json_rows(f, chunk_size=65536):
+    """Rows of a JSON array, decoded incrementally, or of JSON lines."""
+    head = f.read(chunk_size)
+    if head.lstrip().startswith('['):
+        chunks = itertools.chain([head], iter(lambda: f.read(chunk_size), ''))
+        return iter_array(c.encode('utf-8') for c in chunks)
+    # complete the line cut by the first read
+    return _json_lines(itertools.chain(io.StringIO(head + f.readline()), f))
+
+
+def read_rows(paths, fmt=None):
+    """Yields the rows of CSV, JSON-lines or JSON array files one at a
+    time. The 'json' format reads either a JSON array or JSON lines."""
+    for path in paths:
+        f = _open(path)
+        try:
+            kind = _format(path, fmt)
+            if kind == 'csv':
+                rows = csv.DictReader(f)
+            elif kind == 'jsonl':
+                rows = _json_lines(f)
+            else:
+                rows = _json_rows(f)
+            for row in rows:
+                yield row
+        finally:
+            if path != '-':
+                f.close()
+
+
+def batches(rows, batch_size):
+    """Groups rows into lists of batch_size."""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Checkpoint:
+    """Number of leading batches of a load known to be written.
+
+    The checkpoint is a small JSON file replaced atomically whenever the
+    count advances. It only applies to a load of the same files, unchanged,
+    into the same bucket with the same batch size.
+
+    """
+
+    def __init__(self, filename, bucketname, paths, batch_size):
+        self.filename = filename
+        self.header = {
+            'bucket': bucketname,
+            'inputs': [self._identity(p) for p in paths],
+            'batch_size': batch_size,
+        }
+        self.done = 0
+
+    @staticmethod
+    def _identity(path):
+        st = os.stat(path)
+        return [os.path.abspath(path), st.st_size, st.st_mtime]
+
+    def load(self):
+        """Reads a previous checkpoint, returns the batches to skip."""
+        if not os.path.exists(self.filename):
+            return 0
+        try:
+            with open(self.filename) as f:
+                state = json.load(f)
+        except ValueError:
+            return 0
+        if state.get('header') != json.loads(json.dumps(self.header)):
+            LOGGER.warning("Checkpoint %s is for a different load, starting over", self.filename)
+            return 0
+        self.done = state['done']
+        return self.done
+
+    def save(self, done):
+        self.done = done
+        tmp = self.filename + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'header': self.header, 'done': done}, f)
+        os.replace(tmp, self.filename)
+
+    def remove(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+
+_worker = None
+
+
+def _init_worker(username, api_key, api_url, bucketname, columns, compression):
+    global _worker
+    conn = Scdi(username, api_key, api_url=api_url, compression=compression)
+    _worker = (Timeseries(conn, bucketname), coercers(columns))
+
+
+def _send_batch(index, rows):
+    bucket, coerce = _worker
+    bucket.add_rows([coerce_row(row, coerce) for row in rows])
+    return index, len(rows)
+
+
+class _Progress:
+    def __init__(self, interval, out):
+        self.interval = interval
+        self.out = out
+        self.rows = 0
+        self.start = self._last = time.time()
+
+    def add(self, n):
+        self.rows += n
+        now = time.time()
+        if self.interval and now - self._last >= self.interval:
+            self._last = now
+            self.report('')
+
+    def report(self, prefix):
+        elapsed = max(time.time() - self.start, 1e-9)
+        print('%s%d rows in %.1fs, %.0f rows/s' % (prefix, self.rows, elapsed, self.rows / elapsed),
+              file=self.out)
+        self.out.flush()
+
+
+def ingest(conn, bucketname, paths, fmt=None, workers=4, batch_size=1000,
+           checkpoint=None, progress=10.0, out=sys.stderr):
+    """Loads rows from files into a bucket through a process pool.
+
+    Args:
+        conn (Scdi): connection; its credentials, URL and compression
+            setting are used by the worker processes.
+        bucketname (str): a timeseries, geotemporal or tabular bucket.
+        paths (list): CSV, JSON-lines or JSON array files, ``-`` for
+            stdin.
+
+    Kwargs:
+        fmt (str): 'csv', 'jsonl' or 'json' (an array or JSON lines);
+            guessed from the file name if None.
+        workers (int): number of worker processes.
+        batch_size (int): rows per ``add_rows`` request.
+        checkpoint (str): file recording the progress of the load; not
+            supported with stdin, which may differ on the next run.
+        progress (float): seconds between progress reports, 0 disables.
+        out: stream receiving progress reports.
+
+    Returns:
+        int. Number of rows written by this run.
+
+    Raises:
+        ValueError: a checkpoint was given for stdin.
+    """
+    if checkpoint and '-' in paths:
+        raise ValueError('stdin cannot be resumed from a checkpoint')
+    columns = Timeseries(conn, bucketname).get_columns()
+    ckpt = Checkpoint(checkpoint, bucketname, paths, batch_size) if checkpoint else None
+    skip = ckpt.load() if ckpt is not None else 0
+    if skip:
+        print('resuming after %d batches' % skip, file=out)
+
+    report = _Progress(progress, out)
+    done = skip
+    completed = set()
+    pending = set()
+    workers = max(1, int(workers))
+    executor = ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker,
+        initargs=(conn._username, conn._api_key, conn._api_url, bucketname, columns,
+                  conn._compression))
+
+    def collect(futures):
+        nonlocal done
+        for f in futures:
+            index, n = f.result()
+            completed.add(index)
+            report.add(n)
+        # only the contiguous prefix of written batches is safe to skip
+        advanced = done
+        while done in completed:
+            completed.remove(done)
+            done += 1
+        if ckpt is not None and done != advanced:
+            ckpt.save(done)
+
+    try:
+        for index, batch in enumerate(batches(read_rows(paths, fmt), batch_size)):
+            if index < skip:
+                continue
+            # bound the rows held in memory to a few batches per worker
+            if len(pending) >= 2 * workers:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+            pending.add(executor.submit(_send_batch, index, batch))
+        finished, pending = wait(pending)
+        collect(finished)
+    except BaseException:
+        for f in pending:
+            f.cancel()
+        raise
+    finally:
+        executor.shutdown(wait=True)
+    if ckpt is not None:
+        ckpt.remove()
+    report.report('done: ')
+    return report.rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='pyscdi', description='SCDI command line tools')
+    parser.add_argument('--username', default=os.environ.get('SCDI_USERNAME'),
+                        help='SCDI username (default: $SCDI_USERNAME)')
+    parser.add_argument('--api-key', default=os.environ.get('SCDI_API_KEY'),
+                        help='API key (default: $SCDI_API_KEY)')
+    parser.add_argument('--api-url', default=API_URL, help='SCDI API endpoint')
+    commands = parser.add_subparsers(dest='command')
+
+    p = commands.add_parser('ingest', help='load CSV or JSON files into a bucket')
+    p.add_argument('bucket', help='timeseries, geotemporal or tabular bucket')
+    p.add_argument('files', nargs='+', help="input files, '-' for stdin")
+    p.add_argument('--format', choices=['csv', 'jsonl', 'json'],
+                   help='input format, guessed from the file extension by default')
+    p.add_argument('--workers', type=int, default=4, help='number of worker processes')
+    p.add_argument('--batch-size', type=int, default=1000, help='rows per add_rows request')
+    p.add_argument('--checkpoint', help='resume from and record progress in this file')
+    p.add_argument('--compression', choices=['gzip', 'deflate'],
+                   help='compress add_rows request bodies')
+    p.add_argument('--progress', type=float, default=10.0,
+                   help='seconds between progress reports, 0 to disable')
+    args = parser.parse_args(argv)
+
+    if args.command is None:
+        parser.print_help()
+        return 2
+    if not args.username or not args.api_key:
+        parser.error('--username and --api-key (or SCDI_USERNAME and SCDI_API_KEY) are required')
+    if args.checkpoint and '-' in args.files:
+        parser.error('--checkpoint cannot be used with stdin')
+
+    logging.basicConfig(level=logging.WARNING)
+    conn = Scdi(args.username, args.api_key, api_url=args.api_url, compression=args.compression)
+    try:
+        ingest(conn, args.bucket, args.files, fmt=args.format, workers=args.workers,
+               batch_size=args.batch_size, checkpoint=args.checkpoint, progress=args.progress)
+    except KeyboardInterrupt:
+        print('interrupted', file=sys.stderr)
+        return 130
+    except Exception as e:
+        print('ingest failed: %s' % e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""Columnar (NumPy) representation of query results"""
+from __future__ import division, print_function
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+# SCDI column type -> (numpy dtype, fill value for missing entries)
+DTYPES = {
+    'timestamp': ('float64', float('nan')),
+    'double': ('float64', float('nan')),
+    'varchar': (object, ''),
+}
+
+
+def _infer(values):
+    for v in values:
+        if v is not None and (isinstance(v, bool) or not isinstance(v, (int, float))):
+            return DTYPES['varchar']
+    return DTYPES['double']
+
+
+def to_columns(rows, columns=None):
+    """Converts row dicts into one masked array per column.
+
+    Rows are consumed one at a time into per-column value lists, so a
+    generator of decoded rows is never held as a whole.
+
+    Args:
+        rows (iterable): rows as returned by ``Timeseries.query``.
+
+    Kwargs:
+        columns (list): column definitions from ``get_columns()``; their
+            types select the dtypes. Columns not in the schema (e.g.
+            aggregate results) are inferred from the values.
+
+    Returns:
+        dict. Column name -> ``numpy.ma.MaskedArray``, masked where a row
+        has no value for the column.
+    """
+    if np is None:
+        raise ImportError('numpy is required for columnar results')
+    types = dict((c['name'], c.get('type')) for c in (columns or []))
+    names = [c['name'] for c in (columns or [])]
+    buffers = dict((name, []) for name in names)
+    n = 0
+    for row in rows:
+        for name in row:
+            if name not in buffers:
+                # a column first seen here is missing from earlier rows
+                types.setdefault(name, None)
+                names.append(name)
+                buffers[name] = [None] * n
+        for name, values in buffers.items():
+            values.append(row.get(name))
+        n += 1
+
+    result = dict()
+    for name in names:
+        values = buffers.pop(name)
+        dtype, fill = DTYPES.get(types[name]) or _infer(values)
+        mask = np.fromiter((v is None for v in values), dtype=bool, count=len(values))
+        if mask.any():
+            values = [fill if v is None else v for v in values]
+        try:
+            data = np.array(values, dtype=dtype)
+        except (TypeError, ValueError):
+            # e.g. a timestamp column returned as strings
+            data = np.array(values, dtype=object)
+        result[name] = np.ma.masked_array(data, mask=mask)
+    return result
@@ -1,25 +1,155 @@
 from __future__ import division, print_function
-from .utils import md5, md5_ba, getSize
+from .utils import md5_ba, getSize, RateLimiter, compress, objectEtag, combineMd5s
 from .settings import API_URL
+from .writer import BufferedWriter
+from .spool import Spool
+from .columnar import to_columns
+from .cache import LRUCache
+from .retry import RetryPolicy, CONNECT_TIMEOUT, READ_TIMEOUT, CONNECTION_ERROR
+from .metrics import Metrics
+from .serialization import default_serializer, iter_array
+from .manifest import UploadManifest
+from .planner import AggregatePlan, NotDecomposable
+from .spatial import GridIndex, tiles, tile_where
+from concurrent.futures import ThreadPoolExecutor, FIRST_EXCEPTION, wait
+import collections
+import fnmatch
+import json
 import requests
 import logging
+import os
+import queue
+import threading
 import time
 
 LOGGER = logging.getLogger('scdi')
-RETRY_DELAY = 5.0
 
 class ScdiException(Exception):
     pass
 
+def _wait_all(futures):
+    """Waits for futures, cancelling the rest and re-raising on the first error."""
+    done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+    for f in not_done:
+        f.cancel()
+    for f in futures:
+        if f.done() and not f.cancelled():
+            f.result()
+
+def _bulk(fn, calls, max_workers, rate_limit):
+    """Runs fn over argument tuples concurrently, returning results in order.
+
+    A call that raises yields its exception instead of a result.
+    """
+    limiter = RateLimiter(rate_limit) if rate_limit else None
+
+    def call(args):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            return fn(*args)
+        except Exception as e:
+            return e
+
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        return list(executor.map(call, calls))
+    finally:
+        executor.shutdown(wait=True)
+
+def _time_partitions(fromEpoch, toEpoch, length, where, ts_column, align=False):
+    """Splits ``[fromEpoch, toEpoch]`` into half-open partitions of ``length`` seconds.
+
+    Returns a non-empty list of (start, end, where) tuples. Every
+    partition but the last excludes its end with a ``lt`` condition
+    appended to a copy of where. With align, partition edges fall on
+    multiples of length.
+    """
+    if not length > 0:
+        raise ScdiException("Partition length must be positive")
+    base = (fromEpoch // length) * length if align else fromEpoch
+    partitions = []
+    start = fromEpoch
+    k = 1
+    while True:
+        end = min(base + k * length, toEpoch)
+        part_where = list(where or [])
+        if end < toEpoch:
+            # both query bounds are inclusive; the next partition owns end
+            part_where.append({'column': ts_column, 'op': 'lt', 'value': end})
+        partitions.append((start, end, part_where))
+        if end >= toEpoch:
+            return partitions
+        start = end
+        k += 1
+
+def _sent_size(request):
+    """Size of a prepared request body in bytes."""
+    if request is None or request.body is None:
+        return 0
+    try:
+        return len(request.body)
+    except TypeError:
+        return int(request.headers.get('Content-Length') or 0)
+
+def _received_size(r, stream):
+    """Wire and decoded sizes of a response body, without consuming a stream."""
+    if stream:
+        n = int(r.headers.get('Content-Length') or 0)
+        return n, n
+    decoded = len(r.content or b'')
+    try:
+        wire = r.raw.tell()
+    except (AttributeError, ValueError):
+        wire = 0
+    return wire or decoded, decoded
+
+def _verify_etag(r, expected):
+    """Checks the ETag of an upload response against the local digest."""
+    etag = r.headers.get('ETag')
+    if etag and etag.strip('"') != expected:
+        raise ScdiException('ETag mismatch: server %s, local %s' % (etag, expected))
+
+def _remote_entry(entry):
+    """Maps a list_objects entry to {name: (size, etag)}."""
+    if not isinstance(entry, dict):
+        return {entry: (None, None)}
+    name = entry.get('name', entry.get('key', entry.get('objectName')))
+    size = entry.get('size', entry.get('length'))
+    etag = entry.get('etag', entry.get('ETag', entry.get('md5')))
+    return {name: (size, etag.strip('"') if etag else None)}
+
+def _unchanged(remote, path, part_size):
+    """Tells whether a listed object matches a local file."""
+    if remote is None:
+        return False
+    size, etag = remote
+    if size is None or etag is None or int(size) != os.stat(path).st_size:
+        return False
+    return objectEtag(path, part_size) == etag
+
 class Scdi:
     """SCDI Connection
 
         This provides a connection to the SCDI cloud services. The connection
         object is required when managing a bucket.
 
+        A single connection may be shared by many threads. Requests reuse
+        keep-alive connections from a pool of up to ``pool_maxsize``
+        connections per host; size it to the number of threads sharing the
+        connection. ``_make_request`` merges headers into a fresh dict per
+        call and never mutates connection state, and the caches, retry
+        budget and metadata attached to the connection are lock-protected.
+
+        Every request is recorded in ``metrics`` (a
+        :class:`pyscdi.metrics.Metrics`) under the name of the operation.
+
     """
 
-    def __init__(self, username, api_key, api_url=API_URL):
+    def __init__(self, username, api_key, api_url=API_URL, query_cache=None,
+                 meta_ttl=None, retry_policy=None, pool_connections=10,
+                 pool_maxsize=10, pool_block=False, serializer=None, compression=None,
+                 compress_threshold=1024, compress_level=6, deadline=None):
         """SCDI connector class.
 
         Args:
@@ -27,52 +157,146 @@ class Scdi:
            api_key (str): a valid API key.
            api_url (str): an endpoint to scdi server
 
+        Kwargs:
+           query_cache (QueryCache): cache for timeseries query results,
+               shared by all buckets of this connection.
+           meta_ttl (float): cache bucket info, schemas and listings for
+               this many seconds; None disables the metadata cache.
+           retry_policy (RetryPolicy): decides which failed requests are
+               retried and how long to back off.
+           pool_connections (int): number of hosts with a connection pool.
+           pool_maxsize (int): keep-alive connections kept per host.
+           pool_block (bool): when all pooled connections are busy, wait for
+               one instead of opening a throwaway connection.
+           serializer: encodes JSON bodies and decodes JSON responses, see
+               :mod:`pyscdi.serialization`; defaults to orjson when
+               installed, the json module otherwise.
+           compression (str): 'gzip' or 'deflate' to compress JSON request
+               bodies, such as add_rows batches and queries; None sends
+               them as is. Compressed responses are always accepted.
+           compress_threshold (int): compress bodies of at least this size.
+           compress_level (int): compression level, 1 (fast) to 9 (small).
+           deadline (float): default limit in seconds on each request,
+               retries and backoff included; None waits as long as the
+               retry policy allows. Streamed downloads are bounded until
+               their headers arrive.
+
         """
         self._username = username
         self._api_key = api_key
         self._headers = {
             'APIKEY': self._api_key,
-            'User-Agent': 'pyscdi/0.2'
+            'User-Agent': 'pyscdi/0.2',
+            'Accept-Encoding': 'gzip, deflate'
         }
         self._s = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_connections,
+                                                pool_maxsize=pool_maxsize,
+                                                pool_block=pool_block)
+        self._s.mount('http://', adapter)
+        self._s.mount('https://', adapter)
         self._api_url = api_url
+        self._query_cache = query_cache
+        self._meta_cache = LRUCache(ttl=meta_ttl) if meta_ttl is not None else None
+        self._retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.metrics = Metrics()
+        self._serializer = serializer if serializer is not None else default_serializer()
+        if compression not in (None, 'gzip', 'deflate'):
+            raise ScdiException('unsupported compression: %s' % compression)
+        self._compression = compression
+        self._compress_threshold = compress_threshold
+        self._compress_level = compress_level
+        self.deadline = deadline
 
     def _make_request(self, verb, uri, params=None, data=None, json=None,
-            timeout=60.0, max_retries=10, stream=None, headers=None):
+            timeout=60.0, max_retries=None, stream=None, headers=None, deadline=None,
+            op='request', encoded=False):
         if verb not in ['GET', 'POST', 'PUT', 'DELETE']:
             raise ScdiException('method not supported')
         retry_count = 0
         merged_headers = dict(self._headers)
+        raw_size = None
+        compress_time = 0.0
+        if json is not None:
+            # encode once, retries resend the same bytes
+            data = json if encoded else self._serializer.dumps(json)
+            merged_headers['Content-Type'] = 'application/json'
+            if self._compression is not None and len(data) >= self._compress_threshold:
+                t = time.time()
+                raw_size = len(data)
+                data = compress(data, self._compression, self._compress_level)
+                compress_time = time.time() - t
+                merged_headers['Content-Encoding'] = self._compression
         if headers is not None:
             for k in headers:
                 merged_headers[k] = headers[k]
-        while retry_count < max_retries:
+        # deadline bounds the whole call, retries and backoff included
+        if deadline is None:
+            deadline = self.deadline
+        start = time.time()
+        end = start + deadline if deadline is not None else None
+        while True:
+            attempt_timeout = timeout
+            if end is not None:
+                attempt_timeout = min(timeout, end - time.time())
+                if attempt_timeout <= 0:
+                    error = requests.exceptions.Timeout('Deadline of %.1fs exceeded' % deadline)
+                    self.metrics.record(op, verb, uri, READ_TIMEOUT, time.time() - start,
+                                        retries=retry_count, error=error)
+                    raise error
+            response_headers = None
+            sent = received = 0
             try:
                 r = self._s.request(verb, uri, params=params, headers=merged_headers,
-                                    data=data, json=json, timeout=timeout, stream=stream)
+                                    data=data, timeout=attempt_timeout, stream=stream)
                 LOGGER.debug('req time: %.2fs', r.elapsed.total_seconds())
                 r.raise_for_status()
+                received, raw_received = _received_size(r, stream)
+                self.metrics.record(op, verb, uri, r.status_code, time.time() - start,
+                                    _sent_size(r.request), received, retries=retry_count,
+                                    raw_bytes_sent=raw_size, raw_bytes_received=raw_received,
+                                    compress_time=compress_time)
                 return r
 
             except requests.exceptions.HTTPError as e:
-                status_code = e.response.status_code
-                # resource not ready
-                # LOGGER.debug('status_code = {}'.format(status_code))
-                if status_code == 403:
-                    LOGGER.warn("Bucket not ready. Retrying in %.1fs...", RETRY_DELAY)
-                    retry_count += 1
-                    time.sleep(RETRY_DELAY)
-                    continue
-                else:
-                    raise e
+                reason = e.response.status_code
+                response_headers = e.response.headers
+                sent = _sent_size(e.response.request)
+                received = _received_size(e.response, stream)[0]
+                e.response.close()
+                error = e
+
+            except requests.exceptions.ConnectTimeout as e:
+                reason = CONNECT_TIMEOUT
+                error = e
 
             except requests.exceptions.Timeout as e:
-                LOGGER.error("Connection timeout!")
-                raise e
+                reason = READ_TIMEOUT
+                error = e
 
             except requests.exceptions.ConnectionError as e:
-                LOGGER.error("Connection error!")
-                raise e
+                reason = CONNECTION_ERROR
+                error = e
+
+            decision = self._retry_policy.decide(verb, uri, retry_count, reason,
+                                                 headers=response_headers, deadline=end,
+                                                 max_retries=max_retries)
+            if not decision.retry:
+                self.metrics.record(op, verb, uri, reason, time.time() - start, sent, received,
+                                    retries=retry_count, error=error, raw_bytes_sent=raw_size,
+                                    compress_time=compress_time)
+                if reason in (CONNECT_TIMEOUT, READ_TIMEOUT):
+                    LOGGER.error("Connection timeout!")
+                elif reason == CONNECTION_ERROR:
+                    LOGGER.error("Connection error!")
+                raise error
+            if reason == 403:
+                # resource not ready
+                LOGGER.warning("Bucket not ready. Retrying in %.1fs...", decision.delay)
+            else:
+                LOGGER.warning("Request failed (%s). Retrying in %.1fs...", reason, decision.delay)
+            retry_count += 1
+            time.sleep(decision.delay)
 
     def create_tabular_bucket(self, bucketname, columns):
         """Creates a generic tabular bucket.
@@ -87,10 +311,11 @@ class Scdi:
             payload = dict()
             payload['type'] = 'tabular'
             payload['columns'] = columns
-            r = self._make_request('POST', uri, json=payload)
+            r = self._make_request('POST', uri, json=payload, op='create_bucket')
             r.raise_for_status()
         except requests.exceptions.HTTPError as e:
             LOGGER.warn("Bucket %s already exists", bucketname)
+        self.invalidate_metadata(bucketname)
         return Tabular(self, bucketname)
 
     def get_tabular_bucket(self, bucketname):
@@ -118,10 +343,11 @@ class Scdi:
             payload = dict()
             payload['type'] = 'timeseries'
             payload['columns'] = columns
-            r = self._make_request('POST', uri, json=payload)
+            r = self._make_request('POST', uri, json=payload, op='create_bucket')
             r.raise_for_status()
         except requests.exceptions.HTTPError as e:
             LOGGER.warn("Bucket %s already exists", bucketname)
+        self.invalidate_metadata(bucketname)
         return Timeseries(self, bucketname)
 
     def get_timeseries_bucket(self, bucketname):
@@ -149,10 +375,11 @@ class Scdi:
             payload = dict()
             payload['type'] = 'geotemporal'
             payload['columns'] = columns
-            r = self._make_request('POST', uri, json=payload)
+            r = self._make_request('POST', uri, json=payload, op='create_bucket')
             r.raise_for_status()
         except requests.exceptions.HTTPError as e:
             LOGGER.warn("Bucket %s already exists", bucketname)
+        self.invalidate_metadata(bucketname)
         return Geotemporal(self, bucketname)
 
     def get_geotemporal_bucket(self, bucketname):
@@ -167,29 +394,36 @@ class Scdi:
             raise ScdiException("Bucket not found")
         return bucket
 
-    def create_keyvalue_bucket(self, bucketname):
+    def create_keyvalue_bucket(self, bucketname, cache=None):
         """Creates a new key-value bucket.
 
         Args:
            bucketname (str): name of the bucket.
 
+        Kwargs:
+           cache (KeyvalueCache): optional read-through cache.
+
         """
         try:
             uri = self._api_url + self._username + '/' + bucketname + '?create'
-            r = self._make_request('POST', uri, json={'type': 'keyvalue'})
+            r = self._make_request('POST', uri, json={'type': 'keyvalue'}, op='create_bucket')
             r.raise_for_status()
         except requests.exceptions.HTTPError as e:
             LOGGER.warn("Bucket %s already exists", bucketname)
-        return Keyvalue(self, bucketname)
+        self.invalidate_metadata(bucketname)
+        return Keyvalue(self, bucketname, cache=cache)
 
-    def get_keyvalue_bucket(self, bucketname):
+    def get_keyvalue_bucket(self, bucketname, cache=None):
         """Connects to an existing key-value bucket.
 
         Args:
            bucketname (str): name of the bucket.
 
+        Kwargs:
+           cache (KeyvalueCache): optional read-through cache.
+
         """
-        bucket = Keyvalue(self, bucketname)
+        bucket = Keyvalue(self, bucketname, cache=cache)
         if bucket.get_info() is None:
             raise ScdiException("Bucket not found")
         return bucket
@@ -203,10 +437,11 @@ class Scdi:
         """
         try:
             uri = self._api_url + self._username + '/' + bucketname + '?create'
-            r = self._make_request('POST', uri, json={'type': 'object'})
+            r = self._make_request('POST', uri, json={'type': 'object'}, op='create_bucket')
             r.raise_for_status()
         except requests.exceptions.HTTPError as e:
             LOGGER.warn("Bucket %s already exists", bucketname)
+        self.invalidate_metadata(bucketname)
         return Kws(self, bucketname)
 
     def get_kws_bucket(self, bucketname):
@@ -229,18 +464,54 @@ class Scdi:
 
         """
         uri = self._api_url + self._username + '/' + bucketname + '?delete'
-        r = self._make_request('DELETE', uri)
+        r = self._make_request('DELETE', uri, op='drop_bucket')
         r.raise_for_status()
+        self.invalidate_metadata(bucketname)
         return r
 
-    def get_buckets(self):
-        """Get all buckets."""
+    def get_buckets(self, refresh=False):
+        """Get all buckets.
+
+        Kwargs:
+           refresh (bool): bypass the metadata cache.
+
+        """
         uri = self._api_url + self._username
-        r = self._make_request('GET', uri)
-        if r.status_code == 200:
-            return r.json()
-        else:
-            return []
+        content = self._get_metadata(('buckets',), uri, refresh)
+        return self._serializer.loads(content) if content else []
+
+    def invalidate_metadata(self, bucketname=None):
+        """Drops cached metadata.
+
+        Kwargs:
+           bucketname (str): drop only the entries of this bucket (and the
+               bucket listing); None drops everything.
+
+        """
+        cache = self._meta_cache
+        if cache is None:
+            return
+        if bucketname is None:
+            cache.clear()
+            return
+        cache.pop(('buckets',))
+        cache.pop(('meta', bucketname))
+        cache.pop(('list', bucketname))
+
+    _METADATA_OPS = {'buckets': 'get_buckets', 'meta': 'get_info', 'list': 'list_objects'}
+
+    def _get_metadata(self, key, uri, refresh=False):
+        """GETs uri through the metadata cache, returns the body of a 200."""
+        cache = self._meta_cache
+        if cache is not None and not refresh:
+            content = cache.get(key)
+            if content is not None:
+                return content
+        r = self._make_request('GET', uri, op=self._METADATA_OPS[key[0]])
+        content = r.content if r.status_code == 200 else b''
+        if cache is not None:
+            cache.set(key, content, size=len(content))
+        return content
 
 
 class BaseBucket:
@@ -250,44 +521,124 @@ class BaseBucket:
         self._bucketname = bucketname
         self._api_url = conn._api_url
 
-    def get_info(self):
+    def get_info(self, refresh=False):
+        """Gets the bucket metadata.
+
+        Kwargs:
+            refresh (bool): bypass the connection's metadata cache.
+
+        """
         uri = self._api_url + self._conn._username + '/' + self._bucketname + '?meta'
-        r = self._conn._make_request('GET', uri)
-        if len(r.text) > 1:
-            return r.json()
+        content = self._conn._get_metadata(('meta', self._bucketname), uri, refresh)
+        if len(content) > 1:
+            return self._conn._serializer.loads(content)
         else:
             return None
 
-    def list_objects(self):
-        """List objects in a bucket."""
+    def list_objects(self, refresh=False):
+        """List objects in a bucket.
+
+        Kwargs:
+            refresh (bool): bypass the connection's metadata cache.
+
+        """
         uri = self._api_url + self._conn._username + '/' + self._bucketname + '?list'
-        r = self._conn._make_request('GET', uri)
-        if r.status_code == 200:
-            return r.json()
-        else:
-            return []
+        content = self._conn._get_metadata(('list', self._bucketname), uri, refresh)
+        return self._conn._serializer.loads(content) if content else []
 
 class Kws(BaseBucket):
     """KWS Bucket"""
-    def _put_part(self, objectName, partNumber, byteArr):
-        md5hex = md5_ba(byteArr)
+    def _put_part(self, objectName, partNumber, byteArr, md5hex=None):
+        if md5hex is None:
+            md5hex = md5_ba(byteArr)
         headers = {'APIKEY': self._conn._api_key, 'Content-MD5': md5hex, 'Content-Length': str(len(byteArr))}
         uri = self._api_url + self._conn._username + '/' + self._bucketname + '/' + objectName
+        # not streamed: the (empty) body is read so the connection goes
+        # back to the pool before the worker takes the next part
         r = self._conn._make_request('PUT', uri, params={'partNumber': partNumber},
-                                stream=True, data=byteArr, headers=headers)
-        r.raise_for_status()
+                                data=byteArr, headers=headers, op='put_part')
+        try:
+            r.raise_for_status()
+        finally:
+            r.close()
+        return md5hex
 
-    def get_object_as_file(self, objectName, filename):
+    def get_object_as_file(self, objectName, filename, chunk_size=1048576,
+                           max_workers=1, part_size=8388608):
         """Downloads an object as a file
 
+        The body is streamed to disk chunk by chunk, so the object is never
+        held in memory as a whole. With max_workers > 1 the object is
+        split into byte ranges of part_size which are fetched in parallel
+        into a preallocated file. Servers that ignore the Range header
+        fall back to a single streamed download.
+
         Args:
             objectName (str): name of the object.
             filename (str): the output file.
 
+        Kwargs:
+            chunk_size (int): size of the chunks written to disk.
+            max_workers (int): number of ranges downloaded concurrently.
+            part_size (int): size of each byte range.
+
         """
-        data = self.get_object(objectName)
-        with open(filename, 'wb') as f:
-            f.write(data)
+        uri = self._api_url + self._conn._username + '/' + self._bucketname + '/' + objectName
+        if max_workers <= 1:
+            r = self._conn._make_request('GET', uri, stream=True, op='get_object')
+            try:
+                with open(filename, 'wb') as f:
+                    for chunk in r.iter_content(chunk_size):
+                        f.write(chunk)
+            finally:
+                r.close()
+            return
+
+        # the first range also tells us the total size of the object
+        headers = {'Range': 'bytes=0-%d' % (part_size - 1), 'Accept-Encoding': 'identity'}
+        r = self._conn._make_request('GET', uri, stream=True, headers=headers,
+                                     op='get_object_range')
+        try:
+            content_range = r.headers.get('Content-Range', '')
+            if r.status_code != 206 or '/' not in content_range:
+                # range not supported, the whole object is in this response
+                with open(filename, 'wb') as f:
+                    for chunk in r.iter_content(chunk_size):
+                        f.write(chunk)
+                return
+            total = int(content_range.rsplit('/', 1)[1])
+            with open(filename, 'wb') as f:
+                f.truncate(total)
+
+            def fetch(start):
+                end = min(start + part_size, total) - 1
+                headers = {'Range': 'bytes=%d-%d' % (start, end), 'Accept-Encoding': 'identity'}
+                rr = self._conn._make_request('GET', uri, stream=True, headers=headers,
+                                              op='get_object_range')
+                try:
+                    if rr.status_code != 206:
+                        raise ScdiException('range request not honoured')
+                    self._write_range(rr, filename, start, chunk_size)
+                finally:
+                    rr.close()
+
+            executor = ThreadPoolExecutor(max_workers=max_workers)
+            try:
+                futures = [executor.submit(fetch, start)
+                           for start in range(part_size, total, part_size)]
+                self._write_range(r, filename, 0, chunk_size)
+                _wait_all(futures)
+            finally:
+                executor.shutdown(wait=True)
+        finally:
+            r.close()
+
+    def _write_range(self, r, filename, offset, chunk_size):
+        """Streams a ranged response into filename starting at offset."""
+        with open(filename, 'r+b') as f:
+            f.seek(offset)
+            for chunk in r.iter_content(chunk_size):
+                f.write(chunk)
 
     def get_object(self, objectName):
         """Downloads an object as bytes
@@ -299,7 +650,7 @@ class Kws(BaseBucket):
             bytes.
         """
         uri = self._api_url + self._conn._username + '/' + self._bucketname + '/' + objectName
-        r = self._conn._make_request('GET', uri)
+        r = self._conn._make_request('GET', uri, op='get_object')
         r.raise_for_status()
         return r.content
 
@@ -315,64 +666,212 @@ class Kws(BaseBucket):
         uri = self._api_url + self._conn._username + '/' + self._bucketname + '/' + objectName
         return uri
 
-    def put_object(self, objectName, path, max_size=3000000):
+    def put_object(self, objectName, path, max_size=3000000, max_workers=4, checkpoint=None):
         """Uploads a file to an object.
 
-        The object will be split into chunks of max_size (or smaller) and
-        each chunk will be uploaded one by one.
+        Files smaller than max_size are sent in a single request. Larger
+        files are split into parts of max_size bytes which are uploaded
+        concurrently by up to max_workers threads. Each worker reads its
+        part into a reusable buffer, so memory use stays near
+        max_workers * max_size regardless of the file size. A worker holds
+        a pooled connection only while its part is sent; with fewer than
+        max_workers connections in the pool the extra workers wait for
+        one (``pool_block``) or use throwaway connections.
+
+        With checkpoint, acknowledged parts of a multipart upload are
+        recorded in a local manifest file. Calling put_object again with
+        the same object, file, part size and checkpoint after a failure
+        resumes the upload: parts whose local MD5 still matches the
+        manifest are not sent again. The manifest is removed once the
+        upload completes.
 
         Args:
             objectName (str): name of the object.
             path (str): location of the file to upload
 
         Kwargs:
-            max_size (int):
+            max_size (int): part size in bytes.
+            max_workers (int): number of parts uploaded concurrently.
+            checkpoint (str): location of the upload manifest.
 
         Returns:
             str. HTTP Response text.
         """
         flenght = getSize(path)
         if int(flenght) < max_size:
-            # do single part upload
-            md5hex = md5(path)
-            headers = {'APIKEY': self._conn._api_key, 'Content-MD5': md5hex, 'Content-Length': flenght}
+            # do single part upload; the file is read once, then hashed
+            # and sent from the same buffer
+            buf = bytearray(int(flenght))
+            with open(path, 'rb') as fh:
+                n = fh.readinto(buf)
+            body = memoryview(buf)[:n]
+            md5hex = md5_ba(body)
+            headers = {'APIKEY': self._conn._api_key, 'Content-MD5': md5hex, 'Content-Length': str(n)}
             uri = self._api_url + self._conn._username + '/' + self._bucketname + '/' + objectName
             r = self._conn._make_request('PUT', uri, stream=True,
-                                         data=open(path, 'rb'), headers=headers)
+                                         data=body, headers=headers, op='put_object')
             r.raise_for_status()
+            _verify_etag(r, md5hex)
+            self._conn.invalidate_metadata(self._bucketname)
             return r.text
 
         else:
             # do multipart upload
-            uri = self._api_url + self._conn._username + '/' + self._bucketname + '/' + objectName + '?create'
-            r = self._conn._make_request('POST', uri)
-            r.raise_for_status()
+            manifest = None
+            if checkpoint is not None:
+                manifest = UploadManifest(checkpoint, self._bucketname, objectName, path, max_size)
+            if manifest is not None and manifest.load():
+                LOGGER.info("Resuming upload of %s, %d parts already sent",
+                            objectName, len(manifest.parts))
+                manifest.resume()
+            else:
+                uri = self._api_url + self._conn._username + '/' + self._bucketname + '/' + objectName + '?create'
+                r = self._conn._make_request('POST', uri, op='create_upload')
+                r.raise_for_status()
+                if manifest is not None:
+                    manifest.start()
 
-            partNo = 1
-            with open(path, 'rb') as fh:
-                ba = bytes(fh.read())
-                while len(ba) > max_size:
-                    self._put_part(objectName, partNo, ba[:max_size])
-                    partNo += 1
-                    ba = ba[max_size:]
-                # leftover bytes
-                if len(ba) > 0:
-                    self._put_part(objectName, partNo, ba)
-
-            uri = self._api_url + self._conn._username + '/' + self._bucketname + '/' + objectName + '?complete'
-            r = self._conn._make_request('POST', uri)
-            r.raise_for_status()
+            try:
+                md5s = self._put_parts(objectName, path, int(flenght), max_size, max_workers,
+                                       manifest)
+
+                uri = self._api_url + self._conn._username + '/' + self._bucketname + '/' + objectName + '?complete'
+                r = self._conn._make_request('POST', uri, op='complete_upload')
+                r.raise_for_status()
+                _verify_etag(r, combineMd5s(md5s))
+            finally:
+                if manifest is not None:
+                    manifest.close()
+            if manifest is not None:
+                manifest.remove()
+            self._conn.invalidate_metadata(self._bucketname)
             return r.text
 
+    def _put_parts(self, objectName, path, size, part_size, max_workers, manifest=None):
+        """Uploads all parts of a file through a bounded worker pool.
+
+        Parts already recorded in manifest are skipped when their local
+        MD5 still matches; newly acknowledged parts are added to it.
+        Each part is read from disk once and hashed in place.
+
+        Returns:
+            list. MD5 hex digests of the parts, in part order.
+        """
+        max_workers = max(1, int(max_workers))
+        acked = dict(manifest.parts) if manifest is not None else {}
+        # one (file handle, buffer) slot per worker; a part is read into
+        # the slot's buffer and sent as a memoryview slice of it
+        slots = queue.Queue()
+        for _ in range(max_workers):
+            slots.put((open(path, 'rb'), memoryview(bytearray(part_size))))
+
+        def upload(partNo, offset):
+            fh, buf = slots.get()
+            try:
+                fh.seek(offset)
+                n = fh.readinto(buf[:min(part_size, size - offset)])
+                md5hex = md5_ba(buf[:n])
+                if acked.get(partNo) == md5hex:
+                    return md5hex
+                self._put_part(objectName, partNo, buf[:n], md5hex)
+                if manifest is not None:
+                    manifest.add(partNo, md5hex)
+                return md5hex
+            finally:
+                slots.put((fh, buf))
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = [executor.submit(upload, partNo, offset)
+                       for partNo, offset in enumerate(range(0, size, part_size), 1)]
+            _wait_all(futures)
+            return [f.result() for f in futures]
+        finally:
+            executor.shutdown(wait=True)
+            while not slots.empty():
+                slots.get()[0].close()
+
+    def sync_directory(self, local_dir, prefix='', max_workers=4, dry_run=False,
+                       include=None, exclude=None, progress=None, max_size=3000000):
+        """Uploads new and changed files of a directory tree.
+
+        Local files are compared with ``list_objects`` by size and, when
+        sizes match, by MD5/ETag (including the multipart ETag format of
+        files larger than max_size). Only files that differ are uploaded,
+        max_workers at a time.
+
+        Args:
+            local_dir (str): directory to upload.
+
+        Kwargs:
+            prefix (str): prepended to the relative path of each file to
+                form the object name.
+            max_workers (int): number of files uploaded concurrently.
+            dry_run (bool): only report what would be uploaded.
+            include (list): glob patterns on relative paths; when given
+                only matching files are considered.
+            exclude (list): glob patterns on relative paths to skip.
+            progress (callable): called as ``progress(done, total, name,
+                action)`` after each file, action being 'upload',
+                'skip' or 'error'.
+            max_size (int): part size passed to put_object.
+
+        Returns:
+            dict. 'uploaded', 'skipped' (lists of object names) and
+            'failed' (object name -> exception).
+        """
+        remote = dict()
+        for entry in self.list_objects(refresh=True):
+            remote.update(_remote_entry(entry))
+
+        files = []
+        for root, dirs, names in os.walk(local_dir):
+            dirs.sort()
+            for name in sorted(names):
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, local_dir).replace(os.sep, '/')
+                if include and not any(fnmatch.fnmatch(rel, p) for p in include):
+                    continue
+                if exclude and any(fnmatch.fnmatch(rel, p) for p in exclude):
+                    continue
+                files.append((prefix + rel, path))
+
+        result = {'uploaded': [], 'skipped': [], 'failed': {}}
+        lock = threading.Lock()
+        done = [0]
+
+        def sync(objectName, path):
+            try:
+                if _unchanged(remote.get(objectName), path, max_size):
+                    action = 'skip'
+                    result['skipped'].append(objectName)
+                else:
+                    action = 'upload'
+                    if not dry_run:
+                        self.put_object(objectName, path, max_size=max_size, max_workers=1)
+                    result['uploaded'].append(objectName)
+            except Exception as e:
+                LOGGER.error("Failed to sync %s: %s", objectName, e)
+                action = 'error'
+                result['failed'][objectName] = e
+            with lock:
+                done[0] += 1
+                if progress is not None:
+                    progress(done[0], len(files), objectName, action)
+
+        _bulk(sync, files, max_workers, None)
+        return result
+
     def delete_object(self, objectName):
         """Deletes an object.
 
         Args:
             objectName (str): name of the object.
         """
-        uri = self._api_url + self._conn._username + '/' + self._bucketName + '/' + objectName
-        r = self._conn._make_request('DELETE', uri)
+        uri = self._api_url + self._conn._username + '/' + self._bucketname + '/' + objectName
+        r = self._conn._make_request('DELETE', uri, op='delete_object')
         r.raise_for_status()
+        self._conn.invalidate_metadata(self._bucketname)
         return r.text
 
 class Timeseries(BaseBucket):
@@ -386,25 +885,88 @@ class Timeseries(BaseBucket):
             str. HTTP Response text.
         """
         uri = self._api_url + self._conn._username + '/' + self._bucketname
-        r = self._conn._make_request('PUT', uri, json=payload)
+        r = self._conn._make_request('PUT', uri, json=payload, op='add_row')
         r.raise_for_status()
         return r.text
 
-    def add_rows(self, payload):
+    def add_rows(self, payload, max_retries=None, deadline=None):
         """Adds multiple rows to the timeseries bucket.
 
         Args:
             payload (list): rows of data
 
+        Kwargs:
+            max_retries (int): overrides the retry policy's max_retries.
+            deadline (float): give up after this many seconds, retries
+                included.
+
         Returns:
             str. HTTP Response text.
         """
+        return self._add_batch(payload, False, max_retries, deadline)
+
+    def _add_batch(self, body, encoded, max_retries=None, deadline=None):
+        # encoded: body is a JSON array already encoded by the serializer
         uri = self._api_url + self._conn._username + '/' + self._bucketname
-        r = self._conn._make_request('POST', uri + '?batch', json=payload)
+        r = self._conn._make_request('POST', uri + '?batch', json=body, op='add_rows',
+                                     max_retries=max_retries, deadline=deadline,
+                                     encoded=encoded)
         r.raise_for_status()
         return r.text
 
-    def query(self, fromEpoch=None, toEpoch=None, limit=None, where=None, aggregate=None):
+    def buffered_writer(self, **kwargs):
+        """Creates a background writer that batches rows for this bucket.
+
+        Kwargs:
+            see :class:`pyscdi.writer.BufferedWriter`.
+
+        Returns:
+            BufferedWriter.
+        """
+        return BufferedWriter(self, **kwargs)
+
+    def spool(self, directory, **kwargs):
+        """Creates a durable on-disk spool for writes to this bucket.
+
+        Args:
+            directory (str): spool directory.
+
+        Kwargs:
+            see :class:`pyscdi.spool.Spool`.
+
+        Returns:
+            Spool.
+        """
+        return Spool(self, directory, **kwargs)
+
+    def get_columns(self):
+        """Gets the column definitions of the bucket.
+
+        Returns:
+            list. Column definitions as given to ``create_*_bucket``.
+        """
+        info = self.get_info()
+        if info is None:
+            raise ScdiException("Bucket not found")
+        return info.get('columns', [])
+
+    def _timestamp_column(self):
+        for column in self.get_columns():
+            if column.get('type') == 'timestamp':
+                return column['name']
+        raise ScdiException("Bucket has no timestamp column")
+
+    def _query_payload(self, fromEpoch=None, toEpoch=None, limit=None, where=None, aggregate=None):
+        payload = dict()
+        if fromEpoch is not None: payload['fromEpoch'] = fromEpoch
+        if toEpoch is not None: payload['toEpoch'] = toEpoch
+        if limit is not None: payload['limit'] = limit
+        if where is not None: payload['where'] = where
+        if aggregate is not None: payload['aggregate'] = aggregate
+        return payload
+
+    def query(self, fromEpoch=None, toEpoch=None, limit=None, where=None, aggregate=None,
+              columnar=False, stream=False):
         """Queries data
 
         Kwargs:
@@ -413,30 +975,378 @@ class Timeseries(BaseBucket):
             limit (int): Maximum number of records returned
             where (list): a list of where filter
             aggregate (list): a list of aggregate filter
+            columnar (bool): return one NumPy masked array per column,
+                typed from the bucket's column schema (requires numpy);
+                rows are decoded into the columns one at a time, without
+                building the list of rows
+            stream (bool): return a generator decoding rows while the
+                response is read, so the response is never held in
+                memory as a whole; the request is sent when iteration
+                starts and bypasses the query cache
 
         Returns:
-            list. List of returned rows.
+            list. List of returned rows, or dict of columns if columnar,
+            or a generator of rows if stream.
         """
         uri = self._api_url + self._conn._username + '/' + self._bucketname
-        payload = dict()
-        if fromEpoch is not None: payload['fromEpoch'] = fromEpoch
-        if toEpoch is not None: payload['toEpoch'] = toEpoch
-        if limit is not None: payload['limit'] = limit
-        if where is not None: payload['where'] = where
-        if aggregate is not None: payload['aggregate'] = aggregate
-        r = self._conn._make_request('POST', uri + '?query', json=payload)
+        payload = self._query_payload(fromEpoch, toEpoch, limit, where, aggregate)
+        if stream:
+            if columnar:
+                raise ScdiException("columnar is not supported with stream")
+            return self._stream_rows(uri, payload)
+        cache = self._conn._query_cache
+        if columnar:
+            columns = self.get_columns()
+            if cache is None:
+                return to_columns(self._stream_rows(uri, payload), columns)
+        if cache is not None:
+            key = cache.key(uri, payload)
+            content = cache.get(key)
+        if cache is None or content is None:
+            content = self._fetch_query(payload)
+            if cache is not None:
+                cache.set(key, content, size=len(content), ttl=cache.ttl_for(payload))
+        if columnar:
+            return to_columns(iter_array(content[i:i + 65536]
+                                         for i in range(0, len(content), 65536)), columns)
+        return self._decode_rows(content)
+
+    def _fetch_query(self, payload):
+        uri = self._api_url + self._conn._username + '/' + self._bucketname
+        r = self._conn._make_request('POST', uri + '?query', json=payload, op='query')
         r.raise_for_status()
-        if len(r.text) > 1:
-            return r.json()
-        return []
+        return r.content
+
+    def _stream_rows(self, uri, payload, chunk_size=65536):
+        # the request is sent on first iteration, so a generator that is
+        # dropped unstarted never holds a pooled connection
+        r = self._conn._make_request('POST', uri + '?query', json=payload, stream=True,
+                                     op='query')
+        try:
+            for row in iter_array(r.iter_content(chunk_size)):
+                yield row
+        finally:
+            r.close()
+
+    def _decode_rows(self, content):
+        return self._conn._serializer.loads(content) if len(content) > 1 else []
+
+    def query_aggregate(self, fromEpoch, toEpoch, aggregate, where=None, partition=604800,
+                        max_workers=4, ts_column=None):
+        """Runs an aggregate query as concurrent partial queries.
+
+        ``[fromEpoch, toEpoch]`` is split into half-open partitions of
+        ``partition`` seconds which are aggregated by separate requests,
+        up to ``max_workers`` at a time, and the partial results are
+        merged locally. This keeps each request well inside the request timeout
+        on long ranges. count, sum, min, max and mean (as sum / count)
+        are decomposable, see :mod:`pyscdi.planner`; any other aggregate
+        is sent as a single :meth:`query`.
+
+        Args:
+            fromEpoch (float): Begin time (epoch) time
+            toEpoch (float): End time (epoch) time
+            aggregate (list): a list of aggregate filter
+
+        Kwargs:
+            where (list): a list of where filter
+            partition (float): partition length in seconds
+            max_workers (int): number of partitions queried concurrently
+            ts_column (str): timestamp column, looked up when omitted
+
+        Returns:
+            list. Aggregate rows, as returned by :meth:`query`.
+        """
+        try:
+            plan = AggregatePlan(aggregate)
+        except NotDecomposable as e:
+            LOGGER.debug("Single aggregate query: %s", e)
+            plan = None
+        if plan is None or toEpoch - fromEpoch <= partition:
+            return self.query(fromEpoch=fromEpoch, toEpoch=toEpoch, where=where,
+                              aggregate=aggregate)
+        if ts_column is None:
+            ts_column = self._timestamp_column()
+        calls = _time_partitions(fromEpoch, toEpoch, partition, where, ts_column)
+        executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+        try:
+            futures = [executor.submit(self.query, fromEpoch=s, toEpoch=e, where=w,
+                                       aggregate=plan.partial) for s, e, w in calls]
+            _wait_all(futures)
+        finally:
+            executor.shutdown(wait=True)
+        try:
+            return plan.merge([f.result() for f in futures])
+        except NotDecomposable as e:
+            LOGGER.warning("Cannot merge partial aggregates, querying at once: %s", e)
+            return self.query(fromEpoch=fromEpoch, toEpoch=toEpoch, where=where,
+                              aggregate=aggregate)
+
+    def query_iter(self, fromEpoch, toEpoch=None, window=3600, page_size=None,
+                   where=None, aggregate=None, prefetch=2, ts_column=None):
+        """Lazily iterates over the rows of a large query.
+
+        By default ``[fromEpoch, toEpoch]`` is split into half-open windows
+        of ``window`` seconds which are queried one by one, with up to
+        ``prefetch`` windows fetched ahead in background threads while the
+        caller consumes the current one. With ``page_size`` the range is
+        instead read in pages of at most ``page_size`` rows, each starting
+        at the last timestamp seen; pages are read sequentially.
+
+        Args:
+            fromEpoch (float): Begin time (epoch) time
+
+        Kwargs:
+            toEpoch (float): End time (epoch) time, required for windows
+            window (float): window length in seconds
+            page_size (int): read by pages of this many rows instead
+            where (list): a list of where filter
+            aggregate (list): a list of aggregate filter, applied per window
+            prefetch (int): number of windows fetched ahead
+            ts_column (str): timestamp column, looked up when omitted
+
+        Returns:
+            generator. Rows in time order.
+        """
+        if page_size is not None:
+            if aggregate is not None:
+                raise ScdiException("aggregate is not supported with page_size")
+            return self._query_pages(fromEpoch, toEpoch, page_size, where, ts_column)
+        if toEpoch is None:
+            raise ScdiException("toEpoch is required for windowed queries")
+        if ts_column is None:
+            ts_column = self._timestamp_column()
+        return self._query_windows(fromEpoch, toEpoch, window, where, aggregate,
+                                   prefetch, ts_column)
+
+    def _query_windows(self, fromEpoch, toEpoch, window, where, aggregate, prefetch, ts_column):
+        bounds = _time_partitions(fromEpoch, toEpoch, window, where, ts_column)
+        executor = ThreadPoolExecutor(max_workers=max(1, prefetch))
+        pending = collections.deque()
+        try:
+            for i in range(len(bounds)):
+                # keep the current window plus `prefetch` more in flight
+                while len(pending) <= prefetch and len(pending) + i < len(bounds):
+                    s, e, w = bounds[i + len(pending)]
+                    pending.append(executor.submit(self.query, fromEpoch=s, toEpoch=e,
+                                                   where=w, aggregate=aggregate))
+                for row in pending.popleft().result():
+                    yield row
+        finally:
+            for f in pending:
+                f.cancel()
+            executor.shutdown(wait=False)
+
+    def _query_pages(self, fromEpoch, toEpoch, page_size, where, ts_column):
+        if ts_column is None:
+            ts_column = self._timestamp_column()
+        # rows already yielded at the current timestamp, for tie-breaking
+        seen = set()
+        last_ts = fromEpoch
+        while True:
+            rows = self.query(fromEpoch=last_ts, toEpoch=toEpoch, limit=page_size, where=where)
+            new = 0
+            for row in rows:
+                ts = row[ts_column]
+                key = json.dumps(row, sort_keys=True)
+                if ts == last_ts and key in seen:
+                    continue
+                if ts != last_ts:
+                    last_ts = ts
+                    seen = set()
+                seen.add(key)
+                new += 1
+                yield row
+            if len(rows) < page_size:
+                return
+            if new == 0:
+                raise ScdiException("More than page_size rows share timestamp %s" % last_ts)
+
+    def follow(self, fromEpoch=None, where=None, lag=0.0, page_size=None, target_rows=100,
+               min_interval=1.0, max_interval=30.0, ts_column=None, stop=None):
+        """Yields rows as they arrive, like ``tail -f``.
+
+        Every poll queries only from the watermark, the latest timestamp
+        seen (minus ``lag``), so its cost grows with the new rows rather
+        than with a fixed window. Bounds are inclusive, so rows at the
+        watermark are told apart by their content and never yielded
+        twice. The query cache is bypassed.
+
+        The time between polls follows the observed arrival rate, aiming
+        at ``target_rows`` rows per poll within ``[min_interval,
+        max_interval]``, and doubles while polls come back empty or fail.
+
+        Kwargs:
+            fromEpoch (float): Begin time (epoch) time, defaults to now
+            where (list): a list of where filter
+            lag (float): also re-read this many seconds before the
+                watermark, to catch rows that arrive out of order; full
+                pages are followed from their last timestamp
+            page_size (int): maximum rows per request; full pages are
+                followed by another poll straight away. A full page of a
+                single timestamp is re-read without the limit, and the
+                next page starts past it with a ``gt`` where filter
+            target_rows (int): rows per poll the interval aims for
+            min_interval (float): shortest time between polls in seconds
+            max_interval (float): longest time between polls in seconds
+            ts_column (str): timestamp column, looked up when omitted
+            stop (threading.Event): ends the generator once set
+
+        Returns:
+            generator. New rows in time order, until stopped or closed.
+        """
+        if ts_column is None:
+            ts_column = self._timestamp_column()
+        watermark = time.time() if fromEpoch is None else fromEpoch
+        # fingerprints of yielded rows that a later poll can return again
+        seen = dict()
+        rate = None
+        interval = min_interval
+        last_poll = time.time()
+        arrived = 0
+        # while catching up on full pages, where the next page starts
+        resume = None
+        # a timestamp whose rows were all read; the next page starts past it
+        after = None
+        while stop is None or not stop.is_set():
+            start = watermark - lag if resume is None else resume
+            resume = None
+            conditions = where
+            if after is not None:
+                conditions = (where or []) + [{'column': ts_column, 'op': 'gt', 'value': after}]
+                after = None
+            payload = self._query_payload(fromEpoch=start, limit=page_size, where=conditions)
+            try:
+                rows = self._decode_rows(self._fetch_query(payload))
+                full = page_size is not None and len(rows) >= page_size
+                tie = full and rows[-1].get(ts_column, start) == start
+                if tie:
+                    # the page holds a single timestamp, and may not hold
+                    # all of its rows; read them without a limit
+                    payload = self._query_payload(fromEpoch=start, toEpoch=start,
+                                                  where=conditions)
+                    rows = self._decode_rows(self._fetch_query(payload))
+            except requests.exceptions.RequestException as e:
+                LOGGER.warning("Follow poll failed: %s", e)
+                rows = None
+            now = time.time()
+            for row in rows or ():
+                ts = row.get(ts_column)
+                if ts is None:
+                    continue
+                key = json.dumps(row, sort_keys=True)
+                if key in seen:
+                    continue
+                seen[key] = ts
+                watermark = max(watermark, ts)
+                arrived += 1
+                yield row
+            for key in [k for k, ts in seen.items() if ts < watermark - lag]:
+                del seen[key]
+
+            if rows is not None and full:
+                if tie:
+                    resume = after = start
+                else:
+                    resume = rows[-1].get(ts_column, start)
+                # catching up on a backlog, lag only applies to the first page
+                continue
+            elapsed = max(now - last_poll, 1e-3)
+            last_poll = now
+            if arrived:
+                observed = arrived / elapsed
+                rate = observed if rate is None else 0.7 * rate + 0.3 * observed
+                interval = target_rows / rate
+                arrived = 0
+            else:
+                interval *= 2
+            interval = min(max(interval, min_interval), max_interval)
+            if stop is not None:
+                stop.wait(interval)
+            else:
+                time.sleep(interval)
 
 class Geotemporal(Timeseries):
-    pass
+    def query_bbox(self, min_lat, min_lng, max_lat, max_lng, fromEpoch=None, toEpoch=None,
+                   where=None, tile_size=0.1, window=None, max_workers=4, max_tiles=1024,
+                   lat_column='lat', lng_column='lng', ts_column=None, index=False,
+                   cell_size=0.01):
+        """Queries the rows inside a bounding box, tile by tile.
+
+        The box is covered by grid-aligned tiles of ``tile_size`` degrees,
+        and with ``window`` the time range by windows of ``window``
+        seconds aligned to multiples of it. Each tile and window is a
+        separate query, run up to ``max_workers`` at a time. Because
+        tiles and windows are aligned, overlapping boxes and ranges repeat
+        the same requests, which the connection's query cache answers
+        locally.
+
+        Args:
+            min_lat (float): southern edge
+            min_lng (float): western edge
+            max_lat (float): northern edge
+            max_lng (float): eastern edge
+
+        Kwargs:
+            fromEpoch (float): Begin time (epoch) time
+            toEpoch (float): End time (epoch) time, required with window
+            where (list): a list of further where filter
+            tile_size (float): tile size in degrees
+            window (float): window length in seconds, None for one window
+            max_workers (int): number of tiles queried concurrently
+            max_tiles (int): refuse to send more requests than this
+            lat_column (str): name of the latitude column
+            lng_column (str): name of the longitude column
+            ts_column (str): timestamp column, looked up when omitted
+            index (bool): return a :class:`pyscdi.spatial.GridIndex`
+            cell_size (float): cell size of the index in degrees
+
+        Returns:
+            list. Rows inside the box in time order, or a GridIndex of
+            them if index.
+        """
+        if min_lat > max_lat or min_lng > max_lng:
+            raise ScdiException("Invalid bounding box")
+        if window is not None and (fromEpoch is None or toEpoch is None):
+            raise ScdiException("fromEpoch and toEpoch are required with window")
+        if ts_column is None:
+            ts_column = self._timestamp_column()
+        grid = tiles(min_lat, min_lng, max_lat, max_lng, tile_size)
+        if window is None:
+            windows = [(fromEpoch, toEpoch, list(where or []))]
+        else:
+            windows = _time_partitions(fromEpoch, toEpoch, window, where, ts_column, align=True)
+        if len(grid) * len(windows) > max_tiles:
+            raise ScdiException("Query needs %d requests, more than max_tiles; use larger "
+                                "tiles or windows" % (len(grid) * len(windows)))
+
+        def fetch(tile, start, end, window_where):
+            return self.query(fromEpoch=start, toEpoch=end,
+                              where=tile_where(tile, lat_column, lng_column) + window_where)
+
+        executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+        try:
+            futures = [executor.submit(fetch, tile, start, end, w)
+                       for tile in grid for start, end, w in windows]
+            _wait_all(futures)
+        finally:
+            executor.shutdown(wait=True)
+        rows = [row for f in futures for row in f.result()
+                if min_lat <= row.get(lat_column, min_lat - 1) <= max_lat and
+                min_lng <= row.get(lng_column, min_lng - 1) <= max_lng]
+        rows.sort(key=lambda row: row.get(ts_column, 0))
+        if index:
+            return GridIndex(rows, cell_size, lat_column, lng_column)
+        return rows
 
 class Tabular(Timeseries):
     pass
 
 class Keyvalue(BaseBucket):
+    def __init__(self, conn, bucketname, cache=None):
+        BaseBucket.__init__(self, conn, bucketname)
+        self._cache = cache
+
     def put(self, key, value):
         """Puts a key-value pair
 
@@ -446,13 +1356,22 @@ class Keyvalue(BaseBucket):
 
         """
         uri = self._api_url + self._conn._username + '/' + self._bucketname
-        r = self._conn._make_request('POST', uri, params={'key' : key}, data=value)
+        r = self._conn._make_request('POST', uri, params={'key' : key}, data=value, op='kv_put')
         r.raise_for_status()
+        if self._cache is not None:
+            if isinstance(value, bytes):
+                self._cache.store(key, value, r.headers)
+            else:
+                self._cache.pop(key)
         return r.content
 
     def get(self, key):
         """Gets a value of a given key
 
+        With a :class:`pyscdi.cache.KeyvalueCache` attached, fresh values
+        and missing keys are answered locally, and stale values are
+        revalidated with a conditional request.
+
         Args:
             key (str): key string
 
@@ -461,6 +1380,71 @@ class Keyvalue(BaseBucket):
 
         """
         uri = self._api_url + self._conn._username + '/' + self._bucketname
-        r = self._conn._make_request('GET', uri, params={'key' : key})
-        r.raise_for_status()
+        cache = self._cache
+        if cache is None:
+            r = self._conn._make_request('GET', uri, params={'key' : key}, op='kv_get')
+            r.raise_for_status()
+            return r.content
+
+        entry = cache.lookup(key)
+        headers = None
+        if entry is not None:
+            if cache.is_fresh(entry):
+                if entry.missing is not None:
+                    # a new error per hit: raising a shared instance
+                    # would grow its traceback on every lookup
+                    r = entry.missing
+                    raise requests.exceptions.HTTPError(
+                        '%s Client Error: %s for url: %s' % (r.status_code, r.reason, r.url),
+                        response=r)
+                return entry.value
+            if entry.missing is None:
+                headers = cache.conditional_headers(entry)
+        try:
+            r = self._conn._make_request('GET', uri, params={'key' : key}, headers=headers,
+                                         op='kv_get')
+            r.raise_for_status()
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                cache.store_missing(key, e.response)
+            raise e
+        if r.status_code == 304:
+            cache.revalidated(key, entry)
+            return entry.value
+        cache.store(key, r.content, r.headers)
         return r.content
+
+    def get_many(self, keys, max_workers=8, rate_limit=None):
+        """Gets the values of many keys concurrently
+
+        Args:
+            keys (list): key strings
+
+        Kwargs:
+            max_workers (int): number of concurrent requests
+            rate_limit (float): maximum requests per second
+
+        Returns:
+            list. Values in the order of keys. A key whose request failed
+            holds the raised exception instead of its value.
+
+        """
+        return _bulk(self.get, [(key,) for key in keys], max_workers, rate_limit)
+
+    def put_many(self, mapping, max_workers=8, rate_limit=None):
+        """Puts many key-value pairs concurrently
+
+        Args:
+            mapping (dict): key string -> bytes, or a list of pairs
+
+        Kwargs:
+            max_workers (int): number of concurrent requests
+            rate_limit (float): maximum requests per second
+
+        Returns:
+            list. Responses in the order of the pairs. A pair whose request
+            failed holds the raised exception instead.
+
+        """
+        pairs = mapping.items() if hasattr(mapping, 'items') else mapping
+        return _bulk(self.put, list(pairs), max_workers, rate_limit)
@@ -0,0 +1,114 @@
+"""Local checkpoint manifests for resumable multipart uploads"""
+from __future__ import division, print_function
+import json
+import os
+import threading
+
+
+class UploadManifest:
+    """Journal of the parts of a multipart upload acknowledged so far.
+
+    The manifest is a JSON-lines file. The first line describes the
+    upload (bucket, object, file size and mtime, part size), and every
+    following line records one acknowledged part and its MD5. Lines are
+    appended and flushed as parts complete, so an interrupted upload
+    loses at most the parts in flight.
+
+    """
+
+    def __init__(self, filename, bucketname, objectName, path, part_size):
+        """
+        Args:
+            filename (str): location of the manifest file.
+            bucketname (str): name of the bucket.
+            objectName (str): name of the object.
+            path (str): the file being uploaded.
+            part_size (int): part size in bytes.
+
+        """
+        st = os.stat(path)
+        self.filename = filename
+        self.header = {
+            'bucket': bucketname,
+            'object': objectName,
+            'path': os.path.abspath(path),
+            'size': st.st_size,
+            'mtime': st.st_mtime,
+            'part_size': part_size,
+        }
+        self.parts = dict()
+        # end of the last complete line read by load()
+        self._end = None
+        self._fh = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Reads acknowledged parts from an existing manifest.
+
+        Returns:
+            bool. True when a manifest for the same upload of the same,
+            unmodified file was found.
+        """
+        if not os.path.exists(self.filename):
+            return False
+        parts = dict()
+        with open(self.filename, 'rb') as f:
+            line = f.readline()
+            try:
+                header = json.loads(line.decode('utf-8'))
+            except ValueError:
+                return False
+            if header != self.header or not line.endswith(b'\n'):
+                return False
+            end = f.tell()
+            for line in iter(f.readline, b''):
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError('incomplete line')
+                    entry = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    # a torn last line from an interrupted write
+                    break
+                parts[entry['part']] = entry['md5']
+                end = f.tell()
+        self.parts = parts
+        self._end = end
+        return True
+
+    def start(self):
+        """Starts a new manifest, discarding any previous one."""
+        self.parts = dict()
+        self._open('w')
+        self._write(self.header)
+
+    def resume(self):
+        """Reopens the loaded manifest for appending."""
+        # drop a torn last line so new entries start on a line of their own
+        with open(self.filename, 'r+b') as f:
+            f.truncate(self._end)
+        self._open('a')
+
+    def add(self, partNumber, md5hex):
+        """Records an acknowledged part."""
+        with self._lock:
+            self.parts[partNumber] = md5hex
+            self._write({'part': partNumber, 'md5': md5hex})
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def remove(self):
+        """Deletes the manifest once the upload is complete."""
+        self.close()
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def _open(self, mode):
+        self.close()
+        self._fh = open(self.filename, mode)
+
+    def _write(self, entry):
+        self._fh.write(json.dumps(entry) + '\n')
+        self._fh.flush()
@@ -0,0 +1,166 @@
+"""Per-operation request metrics"""
+from __future__ import division, print_function
+import bisect
+import logging
+import threading
+
+LOGGER = logging.getLogger('scdi')
+
+# upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """A fixed-bucket histogram."""
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, q):
+        """Estimates the q-th percentile (0-100) as a bucket upper bound."""
+        if self.count == 0:
+            return None
+        rank = q / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'buckets': list(zip(self.bounds + (float('inf'),), self.counts)),
+        }
+
+
+class _OpStats:
+    def __init__(self, bounds):
+        self.latency = Histogram(bounds)
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.raw_bytes_sent = 0
+        self.raw_bytes_received = 0
+        self.compress_seconds = 0.0
+        self.status = dict()
+
+
+class Metrics:
+    """Collects latency, bytes, retries and statuses per operation.
+
+    Every :class:`pyscdi.Scdi` has one as ``conn.metrics``. Call
+    :meth:`snapshot` for the current numbers, or register a callback with
+    :meth:`add_callback` to export each request as it completes.
+
+    """
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self._bounds = bounds
+        self._ops = dict()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def add_callback(self, fn):
+        """Registers fn to be called with a dict describing every request.
+
+        The dict holds op, verb, uri, status, latency, bytes_sent,
+        bytes_received, raw_bytes_sent, raw_bytes_received, compress_time,
+        retries and error.
+        """
+        self._callbacks.append(fn)
+
+    def remove_callback(self, fn):
+        self._callbacks.remove(fn)
+
+    def record(self, op, verb, uri, status, latency, bytes_sent=0, bytes_received=0,
+               retries=0, error=None, raw_bytes_sent=None, raw_bytes_received=None,
+               compress_time=0.0):
+        """Records one completed (or failed) request.
+
+        bytes_sent and bytes_received count bytes on the wire; the raw_*
+        counterparts count them before compression and after decoding,
+        and default to the wire sizes.
+        """
+        if raw_bytes_sent is None:
+            raw_bytes_sent = bytes_sent
+        if raw_bytes_received is None:
+            raw_bytes_received = bytes_received
+        with self._lock:
+            stats = self._ops.get(op)
+            if stats is None:
+                stats = self._ops[op] = _OpStats(self._bounds)
+            stats.requests += 1
+            stats.latency.observe(latency)
+            stats.retries += retries
+            stats.bytes_sent += bytes_sent
+            stats.bytes_received += bytes_received
+            stats.raw_bytes_sent += raw_bytes_sent
+            stats.raw_bytes_received += raw_bytes_received
+            stats.compress_seconds += compress_time
+            stats.status[status] = stats.status.get(status, 0) + 1
+            if error is not None:
+                stats.errors += 1
+        if self._callbacks:
+            event = dict(op=op, verb=verb, uri=uri, status=status, latency=latency,
+                         bytes_sent=bytes_sent, bytes_received=bytes_received,
+                         raw_bytes_sent=raw_bytes_sent, raw_bytes_received=raw_bytes_received,
+                         compress_time=compress_time, retries=retries, error=error)
+            for fn in list(self._callbacks):
+                try:
+                    fn(event)
+                except Exception:
+                    LOGGER.exception("Metrics callback failed")
+
+    def snapshot(self):
+        """Returns the metrics collected so far.
+
+        Returns:
+            dict. Operation name -> requests, errors, retries, bytes_sent,
+            bytes_received, raw_bytes_sent, raw_bytes_received,
+            compress_seconds, the sent/received compression ratios (raw
+            size over wire size), status (code -> count) and latency
+            histogram.
+        """
+        with self._lock:
+            return dict((op, {
+                'requests': s.requests,
+                'errors': s.errors,
+                'retries': s.retries,
+                'bytes_sent': s.bytes_sent,
+                'bytes_received': s.bytes_received,
+                'raw_bytes_sent': s.raw_bytes_sent,
+                'raw_bytes_received': s.raw_bytes_received,
+                'compress_seconds': s.compress_seconds,
+                'sent_ratio': s.raw_bytes_sent / s.bytes_sent if s.bytes_sent else None,
+                'received_ratio': (s.raw_bytes_received / s.bytes_received
+                                   if s.bytes_received else None),
+                'status': dict(s.status),
+                'latency': s.latency.snapshot(),
+            }) for op, s in self._ops.items())
+
+    def reset(self):
+        """Clears all collected metrics."""
+        with self._lock:
+            self._ops = dict()
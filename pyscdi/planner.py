@@ -0,0 +1,169 @@
+"""Splitting aggregate queries into partial aggregates
+
+SCDI does not document the shape of ``aggregate`` specs or of their
+results, so the planner works from conventions:
+
+* an aggregate is a dict naming its function under one of
+  :data:`FUNCTION_KEYS` and its column under one of :data:`COLUMN_KEYS`,
+  optionally with an alias under one of :data:`ALIAS_KEYS`;
+* a result row holds each aggregate under its alias, or under a key
+  built by one of :data:`RESULT_KEYS`. Any other field of a result row
+  is taken as a group-by value.
+
+Specs using any other function, or results the planner cannot read, are
+not decomposable and are answered by a single request instead.
+
+"""
+from __future__ import division, print_function
+import json
+
+FUNCTION_KEYS = ('op', 'function', 'func', 'aggregate', 'type')
+COLUMN_KEYS = ('column', 'field', 'col')
+ALIAS_KEYS = ('as', 'alias', 'label')
+RESULT_KEYS = ('{fn}({col})', '{fn}_{col}', '{col}_{fn}', '{fn}')
+
+MEANS = ('mean', 'avg', 'average')
+DECOMPOSABLE = ('count', 'sum', 'min', 'max') + MEANS
+
+
+class NotDecomposable(Exception):
+    pass
+
+
+def _first(spec, keys):
+    for k in keys:
+        if k in spec:
+            return k, spec[k]
+    return None, None
+
+
+class _Aggregate:
+    def __init__(self, spec):
+        if not isinstance(spec, dict):
+            raise NotDecomposable('aggregate %r is not a dict' % (spec,))
+        self.spec = spec
+        self.fn_key, fn = _first(spec, FUNCTION_KEYS)
+        if not isinstance(fn, str) or fn.lower() not in DECOMPOSABLE:
+            raise NotDecomposable('aggregate %r is not decomposable' % (spec,))
+        self.fn = fn
+        self.column = _first(spec, COLUMN_KEYS)[1]
+        self.alias = _first(spec, ALIAS_KEYS)[1]
+        # keys of the partial aggregates this one is merged from
+        self.parts = None
+
+    @property
+    def kind(self):
+        fn = self.fn.lower()
+        return 'mean' if fn in MEANS else fn
+
+    def partial(self, fn):
+        """The spec computing fn over the same column, without alias."""
+        spec = dict((k, v) for k, v in self.spec.items() if k not in ALIAS_KEYS)
+        spec[self.fn_key] = fn
+        return spec
+
+    def result_key(self, fmt):
+        """Key of this aggregate in result rows, given the key format."""
+        if self.alias is not None:
+            return self.alias
+        col = '*' if self.column is None and '(' in fmt else self.column
+        return fmt.format(fn=self.fn, col=col)
+
+
+def _key(spec):
+    return json.dumps(spec, sort_keys=True)
+
+
+class AggregatePlan:
+    """Rewrites an aggregate for partitions and merges the partial results.
+
+    Usage::
+
+        plan = AggregatePlan(aggregate)      # raises NotDecomposable
+        partials = [bucket.query(..., aggregate=plan.partial) for ...]
+        rows = plan.merge(partials)
+
+    Means are computed as sum / count; count, sum, min and max merge as
+    themselves.
+
+    """
+
+    def __init__(self, aggregate):
+        if not isinstance(aggregate, list) or not aggregate:
+            raise NotDecomposable('aggregate must be a non-empty list')
+        self.items = [_Aggregate(spec) for spec in aggregate]
+        # partial aggregates actually sent, deduplicated, with the user's
+        # items first so their aliases are kept
+        self.partial = []
+        self._partials = dict()
+        for item in self.items:
+            if item.kind == 'mean':
+                item.parts = [self._add(item.partial('sum'), 'sum'),
+                              self._add(item.partial('count'), 'count')]
+            else:
+                item.parts = [self._add(item.spec, item.kind)]
+
+    def _add(self, spec, kind):
+        key = _key(spec)
+        if key not in self._partials:
+            self._partials[key] = (_Aggregate(spec), kind)
+            self.partial.append(spec)
+        return key
+
+    def _locate(self, row):
+        """Finds the key format of result rows."""
+        for fmt in RESULT_KEYS:
+            if all(agg.result_key(fmt) in row for agg, _ in self._partials.values()):
+                return fmt
+        raise NotDecomposable('cannot find aggregates in result %r' % (row,))
+
+    def merge(self, partials):
+        """Merges the results of the partial aggregates.
+
+        Args:
+            partials (list): one list of result rows per partition.
+
+        Returns:
+            list. Result rows, one per group, in order of first appearance.
+        """
+        rows = [row for result in partials for row in result]
+        if not rows:
+            return []
+        fmt = self._locate(rows[0])
+        keys = dict((k, agg.result_key(fmt)) for k, (agg, _) in self._partials.items())
+        fields = set(keys.values())
+        groups = dict()
+        for row in rows:
+            if not all(v in row for v in fields):
+                raise NotDecomposable('cannot find aggregates in result %r' % (row,))
+            group = dict((k, v) for k, v in row.items() if k not in fields)
+            gkey = _key(group)
+            if gkey not in groups:
+                groups[gkey] = (group, dict())
+            acc = groups[gkey][1]
+            for k, (_, kind) in self._partials.items():
+                acc[k] = _combine(kind, acc.get(k), row[keys[k]])
+        out = []
+        for group, acc in groups.values():
+            row = dict(group)
+            for item in self.items:
+                if item.kind == 'mean':
+                    total, count = acc[item.parts[0]], acc[item.parts[1]]
+                    value = total / count if count and total is not None else None
+                else:
+                    value = acc[item.parts[0]]
+                row[item.result_key(fmt)] = value
+            out.append(row)
+        return out
+
+
+def _combine(kind, a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if kind in ('count', 'sum'):
+        return a + b
+    if kind == 'min':
+        return min(a, b)
+    return max(a, b)
@@ -0,0 +1,152 @@
+"""Retry policies for SCDI requests"""
+from __future__ import division, print_function
+import collections
+import email.utils
+import random
+import threading
+import time
+
+# failure kinds reported to RetryPolicy.decide besides HTTP statuses
+CONNECT_TIMEOUT = 'connect_timeout'
+READ_TIMEOUT = 'read_timeout'
+CONNECTION_ERROR = 'connection_error'
+
+RetryDecision = collections.namedtuple(
+    'RetryDecision', 'verb uri attempt reason retry delay')
+RetryDecision.__doc__ = """The outcome of :meth:`RetryPolicy.decide`.
+
+    ``reason`` is the HTTP status code or failure kind, ``retry`` whether
+    the request is sent again and ``delay`` the sleep before it.
+"""
+
+
+class RetryBudget:
+    """Caps the number of retries per time window.
+
+    Shared by every request of a connection, so a struggling server sees
+    at most ``max_retries`` retries every ``window`` seconds on top of
+    the regular traffic.
+
+    """
+
+    def __init__(self, max_retries=100, window=60.0):
+        self.max_retries = max_retries
+        self.window = window
+        self._times = collections.deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Takes one retry from the budget, returns False when exhausted."""
+        now = time.time()
+        with self._lock:
+            while self._times and self._times[0] <= now - self.window:
+                self._times.popleft()
+            if len(self._times) >= self.max_retries:
+                return False
+            self._times.append(now)
+            return True
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter.
+
+    Requests failing with one of ``retry_statuses``, or with a connect
+    timeout, are retried for every verb. Read timeouts, other connection
+    errors and ``idempotent_statuses`` are retried only for
+    ``idempotent_verbs``, since the server may already have applied the
+    request. A ``Retry-After`` header raises the delay to at least the
+    value it asks for.
+
+    """
+
+    def __init__(self, max_retries=10, backoff=0.5, max_backoff=10.0, jitter=True,
+                 retry_statuses=(403, 429, 503), idempotent_statuses=(500, 502, 504),
+                 idempotent_verbs=('GET', 'DELETE'), budget=None, listeners=None):
+        """
+        Kwargs:
+            max_retries (int): maximum number of retries per request.
+            backoff (float): base delay in seconds, doubled on every retry.
+            max_backoff (float): upper bound of the backoff delay.
+            jitter (bool): draw the delay uniformly from [0, backoff].
+            retry_statuses (tuple): HTTP statuses retried for any verb.
+            idempotent_statuses (tuple): HTTP statuses retried for
+                idempotent verbs only.
+            idempotent_verbs (tuple): verbs that are safe to resend.
+            budget (RetryBudget): shared cap on retries per time window.
+            listeners (list): callables receiving every RetryDecision.
+
+        """
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.retry_statuses = set(retry_statuses)
+        self.idempotent_statuses = set(idempotent_statuses)
+        self.idempotent_verbs = set(idempotent_verbs)
+        self.budget = budget
+        self.listeners = list(listeners or [])
+
+    def add_listener(self, fn):
+        """Registers fn to be called with every RetryDecision."""
+        self.listeners.append(fn)
+
+    def _retryable(self, verb, reason):
+        if reason in self.retry_statuses or reason == CONNECT_TIMEOUT:
+            return True
+        if verb in self.idempotent_verbs:
+            return reason in self.idempotent_statuses or reason in (READ_TIMEOUT, CONNECTION_ERROR)
+        return False
+
+    def delay(self, attempt, headers=None):
+        """Returns the sleep before retry number attempt (0-based)."""
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        retry_after = parse_retry_after((headers or {}).get('Retry-After'))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def decide(self, verb, uri, attempt, reason, headers=None, deadline=None,
+               max_retries=None):
+        """Decides whether a failed request is retried.
+
+        Args:
+            verb (str): HTTP verb of the request.
+            uri (str): request URI.
+            attempt (int): number of retries made so far.
+            reason: HTTP status code, or one of CONNECT_TIMEOUT,
+                READ_TIMEOUT and CONNECTION_ERROR.
+
+        Kwargs:
+            headers (dict): response headers, for Retry-After.
+            deadline (float): absolute time after which no retry is made.
+            max_retries (int): overrides the policy's max_retries.
+
+        Returns:
+            RetryDecision.
+        """
+        limit = self.max_retries if max_retries is None else max_retries
+        delay = self.delay(attempt, headers)
+        retry = (attempt < limit and self._retryable(verb, reason) and
+                 (deadline is None or time.time() + delay < deadline))
+        if retry and self.budget is not None:
+            retry = self.budget.acquire()
+        decision = RetryDecision(verb, uri, attempt, reason, retry, delay if retry else 0.0)
+        for fn in self.listeners:
+            fn(decision)
+        return decision
+
+
+def parse_retry_after(value):
+    """Parses a Retry-After header into seconds, or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parsed = email.utils.parsedate_tz(value)
+    if parsed is None:
+        return None
+    return max(0.0, email.utils.mktime_tz(parsed) - time.time())
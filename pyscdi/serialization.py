@@ -0,0 +1,178 @@
+"""JSON serializers for request and response bodies
+
+A serializer turns request payloads into bytes once, before they are
+sent, and decodes response bodies. :func:`default_serializer` picks
+``orjson`` when it is installed and falls back to the standard library.
+Both serializers accept NumPy scalars and arrays, ``datetime``/``date``
+values and ``numpy.datetime64``; dates and times are sent as epoch
+seconds, naive datetimes being taken as UTC. NaN and infinite floats,
+which JSON cannot represent, are sent as ``null``. :func:`iter_array` decodes
+a JSON array incrementally from a stream of chunks.
+
+"""
+from __future__ import division, print_function
+import calendar
+import codecs
+import datetime
+import itertools
+import json
+import math
+import re
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def _epoch(value):
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            return calendar.timegm(value.timetuple()) + value.microsecond / 1e6
+        return value.timestamp()
+    return calendar.timegm(value.timetuple())
+
+
+def to_jsonable(obj):
+    """Converts values json cannot encode natively.
+
+    Used as the ``default`` hook of the serializers.
+    """
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return _epoch(obj)
+    if np is not None:
+        if isinstance(obj, np.datetime64):
+            return obj.astype('datetime64[us]').astype('int64') / 1e6
+        if isinstance(obj, np.ndarray):
+            if obj.dtype.kind == 'M':
+                return (obj.astype('datetime64[us]').astype('int64') / 1e6).tolist()
+            return obj.tolist()
+        if isinstance(obj, np.generic):
+            return obj.item()
+    raise TypeError('Object of type %s is not JSON serializable' % type(obj).__name__)
+
+
+def _finite(obj):
+    """Replaces NaN and infinities with None, as orjson encodes them."""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return dict((k, _finite(v)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return [_finite(v) for v in obj]
+    return obj
+
+
+def _finite_jsonable(obj):
+    return _finite(to_jsonable(obj))
+
+
+class JsonSerializer:
+    """Serializer based on the standard library json module."""
+    name = 'json'
+
+    def dumps(self, obj):
+        try:
+            text = json.dumps(obj, default=to_jsonable, allow_nan=False, separators=(',', ':'))
+        except ValueError:
+            # rare: rewrite the payload only when it holds NaN or infinities
+            text = json.dumps(_finite(obj), default=_finite_jsonable, allow_nan=False,
+                              separators=(',', ':'))
+        return text.encode('utf-8')
+
+    def loads(self, data):
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return json.loads(data)
+
+
+class OrjsonSerializer:
+    """Serializer based on orjson."""
+    name = 'orjson'
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError('orjson is not installed')
+        # datetimes go through to_jsonable so they become epoch seconds
+        self._option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj):
+        return orjson.dumps(obj, default=to_jsonable, option=self._option)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+def default_serializer():
+    """Returns the fastest available serializer."""
+    if orjson is not None:
+        return OrjsonSerializer()
+    return JsonSerializer()
+
+
+_WS = re.compile(r'[ \t\n\r]*')
+# what may follow an element: a separator, with whitespace around it
+_AFTER = re.compile(r'[ \t\n\r]*([,\]])[ \t\n\r]*')
+_START, _FIRST, _VALUE, _DONE = range(4)
+
+
+def iter_array(chunks, encoding='utf-8'):
+    """Yields the elements of a JSON array as they are decoded.
+
+    Chunks are decoded into a rolling buffer from which each element is
+    parsed by the json module's scanner once it is complete, so only the
+    undecoded tail of the input is held at a time. An empty input yields
+    nothing.
+
+    Args:
+        chunks (iterable): bytes of the JSON text, in any split.
+
+    Raises:
+        ValueError: the input is not a well-formed JSON array.
+    """
+    scan = json.JSONDecoder().scan_once
+    text = codecs.getincrementaldecoder(encoding)()
+    state = _START
+    buf, pos = '', 0
+    for chunk in itertools.chain(chunks, [None]):
+        final = chunk is None
+        buf = buf[pos:] + text.decode(b'' if final else chunk, final)
+        pos = _WS.match(buf).end()
+        if state == _START and pos < len(buf):
+            if buf[pos] != '[':
+                raise ValueError('expected a JSON array')
+            pos = _WS.match(buf, pos + 1).end()
+            state = _FIRST
+        if state == _FIRST and pos < len(buf):
+            if buf[pos] == ']':
+                pos = _WS.match(buf, pos + 1).end()
+                state = _DONE
+            else:
+                state = _VALUE
+        while state == _VALUE and pos < len(buf):
+            try:
+                value, end = scan(buf, pos)
+            except (StopIteration, ValueError):
+                if final:
+                    raise ValueError('invalid JSON array element at %r' % buf[pos:pos + 20])
+                break
+            # a number cut by a chunk boundary ("2." of "2.5") scans
+            # early; complete elements are followed by , or ]
+            m = _AFTER.match(buf, end)
+            if m is None:
+                if final:
+                    raise ValueError('expected , or ] at %r' % buf[end:end + 20])
+                break
+            pos = m.end()
+            if m.group(1) == ']':
+                state = _DONE
+            yield value
+        if state == _DONE and pos < len(buf):
+            raise ValueError('extra data after the JSON array')
+    if state in (_FIRST, _VALUE):
+        raise ValueError('truncated JSON array')
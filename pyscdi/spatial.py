@@ -0,0 +1,173 @@
+"""Grid tiling and a local spatial index for geotemporal rows"""
+from __future__ import division, print_function
+import collections
+import math
+
+# mean Earth radius in meters
+EARTH_RADIUS = 6371008.8
+# meters per degree of latitude
+DEGREE = math.pi * EARTH_RADIUS / 180.0
+
+
+def haversine(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in meters."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _edge(i, size):
+    # the same edge is computed for both neighbouring tiles
+    return round(i * size, 10)
+
+
+def _index(x, size):
+    # 0.3 / 0.1 is 2.999...; rounding keeps a value on a tile edge in the
+    # tile that starts there
+    return int(math.floor(round(x / size, 9)))
+
+
+def tiles(min_lat, min_lng, max_lat, max_lng, tile_size):
+    """Grid-aligned tiles covering a bounding box.
+
+    Tiles are aligned to multiples of tile_size so that overlapping boxes
+    share tiles, and are half-open: ``[lat0, lat1) x [lng0, lng1)``.
+
+    Returns:
+        list. (lat0, lng0, lat1, lng1) tuples.
+    """
+    out = []
+    for i in range(_index(min_lat, tile_size), _index(max_lat, tile_size) + 1):
+        for j in range(_index(min_lng, tile_size), _index(max_lng, tile_size) + 1):
+            out.append((_edge(i, tile_size), _edge(j, tile_size),
+                        _edge(i + 1, tile_size), _edge(j + 1, tile_size)))
+    return out
+
+
+def tile_where(tile, lat_column='lat', lng_column='lng'):
+    """Where filter selecting the rows of a tile."""
+    lat0, lng0, lat1, lng1 = tile
+    return [
+        {'column': lat_column, 'op': 'gte', 'value': lat0},
+        {'column': lat_column, 'op': 'lt', 'value': lat1},
+        {'column': lng_column, 'op': 'gte', 'value': lng0},
+        {'column': lng_column, 'op': 'lt', 'value': lng1},
+    ]
+
+
+class GridIndex:
+    """In-memory grid index over rows with a latitude and a longitude.
+
+    Rows are bucketed into square cells of ``cell_size`` degrees, so box
+    lookups only scan the cells they overlap and nearest-neighbour
+    lookups search rings of cells outwards from the query point.
+
+    Usage::
+
+        index = bucket.query_bbox(13.5, 100.3, 14.0, 100.9, index=True)
+        index.within(13.7, 100.5, 13.8, 100.6)
+        index.nearest(13.75, 100.5, k=5)
+
+    """
+
+    def __init__(self, rows=(), cell_size=0.01, lat_column='lat', lng_column='lng'):
+        """
+        Kwargs:
+            rows (iterable): initial rows.
+            cell_size (float): cell size in degrees.
+            lat_column (str): name of the latitude column.
+            lng_column (str): name of the longitude column.
+
+        """
+        self.cell_size = cell_size
+        self.lat_column = lat_column
+        self.lng_column = lng_column
+        self._cells = collections.defaultdict(list)
+        self._count = 0
+        self._extent = None
+        for row in rows:
+            self.add(row)
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for cell in self._cells.values():
+            for row in cell:
+                yield row
+
+    def _cell(self, lat, lng):
+        return (int(math.floor(lat / self.cell_size)), int(math.floor(lng / self.cell_size)))
+
+    def add(self, row):
+        """Adds a row; rows without coordinates are ignored."""
+        lat, lng = row.get(self.lat_column), row.get(self.lng_column)
+        if lat is None or lng is None:
+            return
+        i, j = self._cell(lat, lng)
+        self._cells[(i, j)].append(row)
+        self._count += 1
+        if self._extent is None:
+            self._extent = [i, j, i, j]
+        else:
+            e = self._extent
+            e[0], e[1], e[2], e[3] = min(e[0], i), min(e[1], j), max(e[2], i), max(e[3], j)
+
+    def within(self, min_lat, min_lng, max_lat, max_lng):
+        """Rows inside a bounding box, bounds included."""
+        out = []
+        i0, j0 = self._cell(min_lat, min_lng)
+        i1, j1 = self._cell(max_lat, max_lng)
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                for row in self._cells.get((i, j), ()):
+                    if (min_lat <= row[self.lat_column] <= max_lat and
+                            min_lng <= row[self.lng_column] <= max_lng):
+                        out.append(row)
+        return out
+
+    def nearest(self, lat, lng, k=1, max_distance=None):
+        """The k rows closest to a point.
+
+        Args:
+            lat (float): latitude of the point.
+            lng (float): longitude of the point.
+
+        Kwargs:
+            k (int): number of rows.
+            max_distance (float): ignore rows further than this, in meters.
+
+        Returns:
+            list. (distance in meters, row) tuples, closest first.
+        """
+        if not self._count or k < 1:
+            return []
+        ci, cj = self._cell(lat, lng)
+        e = self._extent
+        # rings before the first one reaching the occupied cells are empty
+        first = max(0, e[0] - ci, ci - e[2], e[1] - cj, cj - e[3])
+        last = max(abs(ci - e[0]), abs(ci - e[2]), abs(cj - e[1]), abs(cj - e[3]))
+        found = []
+        for r in range(first, last + 1):
+            for i in range(max(ci - r, e[0]), min(ci + r, e[2]) + 1):
+                if abs(i - ci) == r:
+                    cols = range(max(cj - r, e[1]), min(cj + r, e[3]) + 1)
+                else:
+                    cols = [j for j in (cj - r, cj + r) if e[1] <= j <= e[3]]
+                for j in cols:
+                    for row in self._cells.get((i, j), ()):
+                        d = haversine(lat, lng, row[self.lat_column], row[self.lng_column])
+                        if max_distance is None or d <= max_distance:
+                            found.append((d, row))
+            found.sort(key=lambda x: x[0])
+            del found[k:]
+            # rows outside the rings searched so far are at least this far
+            band = min(90.0, abs(lat) + (r + 1) * self.cell_size)
+            bound = r * self.cell_size * DEGREE * math.cos(math.radians(band))
+            if max_distance is not None and bound > max_distance:
+                break
+            if len(found) == k and found[-1][0] <= bound:
+                break
+        return found
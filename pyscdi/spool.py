@@ -0,0 +1,406 @@
+"""Durable on-disk spool for timeseries writes"""
+from __future__ import division, print_function
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+
+LOGGER = logging.getLogger('scdi')
+
+FSYNC_POLICIES = ('always', 'interval', 'never')
+POSITION = 'replay.pos'
+# seconds the drainer lets the active segment fill before taking it
+LINGER = 0.5
+REJECTED = 'rejected.jsonl'
+
+
+class SpoolFull(Exception):
+    pass
+
+
+def is_transient(error):
+    """Whether a failed write may succeed later."""
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return False
+
+
+class Spool:
+    """Write-ahead spool that keeps rows on disk while SCDI is unreachable.
+
+    :meth:`add_rows` sends rows straight to the bucket while the spool is
+    empty. When a write fails with a connection error, a timeout, a 429
+    or a 5xx, the rows are appended to the spool instead, and so are all
+    writes after them until the backlog is replayed. With ``defer`` every
+    write goes through the spool.
+
+    The spool is a directory of segment files holding one JSON array of
+    rows per line. A background thread replays segments in order through
+    ``add_rows`` in batches of up to ``batch_rows`` rows, backing off
+    while the endpoint stays unavailable, and deletes each segment once
+    it is replayed. Its position within the current segment is saved
+    after every batch, so a restarted process resumes where the previous
+    one stopped; rows are delivered at least once. Batches the server
+    rejects outright are moved to ``rejected.jsonl``.
+
+    Usage::
+
+        spool = bucket.spool('/var/spool/scdi/readings')
+        spool.add_rows(rows)
+        ...
+        spool.close()
+
+    """
+
+    def __init__(self, bucket, directory, segment_bytes=8000000, max_bytes=256000000,
+                 on_full='raise', fsync='interval', fsync_interval=1.0, batch_rows=5000,
+                 retry_interval=1.0, max_retry_interval=60.0, defer=False,
+                 direct_deadline=5.0):
+        """
+        Args:
+            bucket (Timeseries): the bucket to write to.
+            directory (str): spool directory, created if missing.
+
+        Kwargs:
+            segment_bytes (int): start a new segment file after this size.
+            max_bytes (int): maximum size of the spool on disk.
+            on_full (str): 'raise' raises :class:`SpoolFull` when
+                max_bytes is reached, 'drop_oldest' discards the oldest
+                segment to make room.
+            fsync (str): 'always' syncs every append, 'interval' at most
+                every fsync_interval seconds, 'never' leaves it to the OS.
+            fsync_interval (float): seconds between syncs for 'interval'.
+            batch_rows (int): maximum rows per replayed ``add_rows``.
+            retry_interval (float): first back-off after a failed replay.
+            max_retry_interval (float): longest back-off in seconds.
+            defer (bool): spool every write instead of trying it first.
+            direct_deadline (float): seconds a direct write may take
+                before its rows are spooled; direct writes are not
+                retried, the replay thread retries them.
+
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError('unsupported fsync policy: %s' % fsync)
+        if on_full not in ('raise', 'drop_oldest'):
+            raise ValueError('unsupported on_full policy: %s' % on_full)
+        self._bucket = bucket
+        self._serializer = bucket._conn._serializer
+        self.directory = directory
+        self._segment_bytes = segment_bytes
+        self._max_bytes = max_bytes
+        self._on_full = on_full
+        self._fsync = fsync
+        self._fsync_interval = fsync_interval
+        self._batch_rows = batch_rows
+        self._retry_interval = retry_interval
+        self._max_retry_interval = max_retry_interval
+        self._defer = defer
+        self.direct_deadline = direct_deadline
+
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._fh = None
+        self._active = None
+        self._active_since = None
+        self._reading = None
+        self._last_sync = time.time()
+        self.rows_spooled = 0
+        self.rows_replayed = 0
+        self.rows_rejected = 0
+        self.rows_dropped = 0
+        self.bytes_replayed = 0
+        self.replay_seconds = 0.0
+        self.last_error = None
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        # segments left by a previous process are replayed first
+        self._segments = sorted(f for f in os.listdir(directory) if f.endswith('.seg'))
+        self._sizes = dict((f, os.path.getsize(self._path(f))) for f in self._segments)
+        self._next = int(self._segments[-1][:-4]) + 1 if self._segments else 0
+        # a position left by a crash after its segment was removed must
+        # not match a new segment of the same name
+        replayed = self._position().get('segment')
+        if replayed:
+            self._next = max(self._next, int(replayed[:-4]) + 1)
+        self._thread = threading.Thread(target=self._run, name='scdi-spool')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    @property
+    def pending_bytes(self):
+        """Bytes of spooled rows not yet replayed, including replayed
+        parts of the current segment."""
+        with self._lock:
+            return sum(self._sizes.values())
+
+    @property
+    def backlog(self):
+        """Whether writes go to the spool: it holds rows not replayed yet,
+        or every write is deferred."""
+        with self._lock:
+            return self._defer or bool(self._segments)
+
+    def stats(self):
+        """Spool and replay counters.
+
+        Returns:
+            dict. Including the replay throughput in rows and bytes per
+            second of time spent sending.
+        """
+        with self._lock:
+            seconds = self.replay_seconds
+            return {
+                'segments': len(self._segments),
+                'pending_bytes': sum(self._sizes.values()),
+                'rows_spooled': self.rows_spooled,
+                'rows_replayed': self.rows_replayed,
+                'rows_rejected': self.rows_rejected,
+                'rows_dropped': self.rows_dropped,
+                'bytes_replayed': self.bytes_replayed,
+                'replay_rows_per_sec': self.rows_replayed / seconds if seconds else None,
+                'replay_bytes_per_sec': self.bytes_replayed / seconds if seconds else None,
+                'last_error': self.last_error,
+            }
+
+    def add_row(self, payload):
+        """Writes or spools a row."""
+        self.add_rows([payload])
+
+    def add_rows(self, rows):
+        """Writes rows to the bucket, spooling them if it is unavailable.
+
+        Args:
+            rows (list): rows of data
+
+        Raises:
+            SpoolFull: the spool reached max_bytes with on_full='raise'.
+            requests.HTTPError: the bucket rejected the rows.
+        """
+        if not rows:
+            return
+        if not self.backlog:
+            try:
+                self._bucket.add_rows(rows, max_retries=0, deadline=self.direct_deadline)
+                return
+            except Exception as e:
+                if not is_transient(e):
+                    raise
+                LOGGER.warning("Spooling %d rows: %s", len(rows), e)
+                self.last_error = e
+        self.append(rows)
+
+    def append(self, rows):
+        """Appends rows to the spool without trying to send them."""
+        rows = list(rows)
+        self._append(self._serializer.dumps(rows), len(rows))
+
+    def _append(self, body, nrows):
+        # body: the rows as a JSON array encoded by the serializer
+        line = body + b'\n'
+        with self._lock:
+            self._make_room(len(line))
+            if self._fh is None or self._sizes[self._active] >= self._segment_bytes:
+                self._rotate()
+            self._fh.write(line)
+            self._fh.flush()
+            self._sizes[self._active] += len(line)
+            self.rows_spooled += nrows
+            self._sync(self._fsync == 'always' or (
+                self._fsync == 'interval' and time.time() - self._last_sync >= self._fsync_interval))
+            self._changed.notify_all()
+
+    def _make_room(self, n):
+        while sum(self._sizes.values()) + n > self._max_bytes:
+            victims = [s for s in self._segments if s != self._reading and s != self._active]
+            if self._on_full == 'raise' or not victims:
+                raise SpoolFull('spool %s holds %d bytes' % (self.directory,
+                                                            sum(self._sizes.values())))
+            victim = victims[0]
+            with open(self._path(victim), 'rb') as f:
+                dropped = sum(len(self._serializer.loads(line)) for line in f if line.strip())
+            LOGGER.error("Spool full, dropping segment %s with %d rows", victim, dropped)
+            self.rows_dropped += dropped
+            self._remove(victim)
+
+    def _rotate(self):
+        self._close_active()
+        self._active = '%012d.seg' % self._next
+        self._next += 1
+        self._fh = open(self._path(self._active), 'ab')
+        self._active_since = time.time()
+        self._segments.append(self._active)
+        self._sizes[self._active] = 0
+        if self._fsync == 'always':
+            self._sync_dir()
+
+    def _close_active(self):
+        if self._fh is not None:
+            self._sync(self._fsync != 'never')
+            self._fh.close()
+            self._fh = None
+            self._active = None
+
+    def _sync(self, force):
+        if force and self._fh is not None:
+            os.fsync(self._fh.fileno())
+            self._last_sync = time.time()
+
+    def _sync_dir(self):
+        if hasattr(os, 'O_DIRECTORY'):
+            fd = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _remove(self, name):
+        self._segments.remove(name)
+        del self._sizes[name]
+        os.remove(self._path(name))
+
+    def flush(self):
+        """Syncs the current segment to disk."""
+        with self._lock:
+            self._sync(True)
+
+    def drain(self, timeout=None):
+        """Waits until every spooled row is replayed.
+
+        Returns:
+            bool. False if the timeout expired first.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._lock:
+            while self._segments:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._changed.wait(remaining)
+        return True
+
+    def close(self):
+        """Stops the replay thread; spooled rows stay on disk."""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        with self._lock:
+            self._changed.notify_all()
+        self._thread.join()
+        with self._lock:
+            self._close_active()
+
+    def _next_segment(self):
+        """Oldest segment to replay, closing the active one if needed."""
+        with self._lock:
+            while not self._stop.is_set():
+                if not self._segments:
+                    self._changed.wait(1.0)
+                    continue
+                name = self._segments[0]
+                if name == self._active:
+                    linger = self._active_since + LINGER - time.time()
+                    if linger > 0:
+                        self._changed.wait(linger)
+                        continue
+                    self._close_active()
+                self._reading = name
+                return name
+            return None
+
+    def _position(self):
+        try:
+            with open(self._path(POSITION)) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _load_position(self, name):
+        pos = self._position()
+        return pos['offset'] if pos.get('segment') == name else 0
+
+    def _save_position(self, name, offset):
+        tmp = self._path(POSITION + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'segment': name, 'offset': offset}, f)
+        os.replace(tmp, self._path(POSITION))
+
+    def _read_batches(self, name):
+        """Yields (rows, offset after them, bytes) from a segment."""
+        with open(self._path(name), 'rb') as f:
+            f.seek(self._load_position(name))
+            rows, size = [], 0
+            for line in f:
+                if not line.endswith(b'\n'):
+                    LOGGER.warning("Skipping torn record at the end of %s", name)
+                    break
+                try:
+                    rows.extend(self._serializer.loads(line))
+                except ValueError:
+                    LOGGER.error("Skipping corrupt record in %s", name)
+                    continue
+                size += len(line)
+                if len(rows) >= self._batch_rows:
+                    yield rows, f.tell(), size
+                    rows, size = [], 0
+            if rows:
+                yield rows, f.tell(), size
+
+    def _replay(self, rows, nbytes):
+        """Sends a batch until it succeeds, is rejected or the spool stops."""
+        delay = self._retry_interval
+        while not self._stop.is_set():
+            t = time.time()
+            try:
+                self._bucket.add_rows(rows)
+            except Exception as e:
+                self.last_error = e
+                if not is_transient(e):
+                    LOGGER.error("Replay of %d rows rejected: %s", len(rows), e)
+                    with open(self._path(REJECTED), 'ab') as f:
+                        f.write(self._serializer.dumps(rows) + b'\n')
+                    with self._lock:
+                        self.rows_rejected += len(rows)
+                    return True
+                LOGGER.warning("Replay failed, retrying in %.1fs: %s", delay, e)
+                self._stop.wait(delay)
+                delay = min(delay * 2, self._max_retry_interval)
+                continue
+            with self._lock:
+                self.replay_seconds += time.time() - t
+                self.rows_replayed += len(rows)
+                self.bytes_replayed += nbytes
+            return True
+        return False
+
+    def _run(self):
+        while not self._stop.is_set():
+            name = self._next_segment()
+            if name is None:
+                return
+            for rows, offset, nbytes in self._read_batches(name):
+                if not self._replay(rows, nbytes):
+                    return
+                self._save_position(name, offset)
+            with self._lock:
+                self._reading = None
+                if name in self._sizes:
+                    self._remove(name)
+                if os.path.exists(self._path(POSITION)):
+                    os.remove(self._path(POSITION))
+                self._changed.notify_all()
@@ -1,32 +1,94 @@
+import gzip
 import hashlib
+import zlib
 import codecs
 import os
+import threading
+import time
 
-def md5(fname, block_size=4096):
+def md5(fname, block_size=1048576):
     hash_md5 = hashlib.md5()
+    buf = memoryview(bytearray(block_size))
     with open(fname, "rb") as f:
-        for chunk in iter(lambda: f.read(block_size), b""):
-            hash_md5.update(chunk)
+        for n in iter(lambda: f.readinto(buf), 0):
+            hash_md5.update(buf[:n])
     return hash_md5.hexdigest()
 
-def md5_ba(ba, block_size=4096):
+def md5_ba(ba, block_size=1048576):
+    # memoryview slices hash the buffer in place, without copies
     hash_md5 = hashlib.md5()
-    for i in range(0, len(ba), block_size):
-        hash_md5.update(ba[i:min(len(ba), i+block_size)])
+    mv = memoryview(ba)
+    for i in range(0, len(mv), block_size):
+        hash_md5.update(mv[i:i+block_size])
     return hash_md5.hexdigest()
 
 def getSize(filename):
     st = os.stat(filename)
     return str(st.st_size)
 
+def combineMd5s(md5s):
+    hex_data = codecs.decode(''.join(md5s), 'hex')
+    hmd5 = hashlib.md5()
+    hmd5.update(hex_data)
+    return hmd5.hexdigest() + '-' + str(len(md5s))
+
 def multipartMd5(files):
     md5s = []
     for f in files:
         md5s.append(md5(f))
-    hex_data = codecs.decode(''.join(md5s), 'hex')
-    hmd5 = hashlib.md5()
-    hmd5.update(hex_data)
-    return hmd5.hexdigest() + '-' + str(len(files))
+    return combineMd5s(md5s)
+
+def objectEtag(fname, part_size, block_size=1048576):
+    """ETag of a file uploaded by Kws.put_object with max_size=part_size.
+
+    Plain MD5 for single part uploads, multipart format otherwise.
+    """
+    size = os.stat(fname).st_size
+    if size < part_size:
+        return md5(fname, block_size)
+    md5s = []
+    with open(fname, "rb") as f:
+        for _ in range(0, size, part_size):
+            hash_md5 = hashlib.md5()
+            remaining = part_size
+            while remaining > 0:
+                chunk = f.read(min(block_size, remaining))
+                if not chunk:
+                    break
+                hash_md5.update(chunk)
+                remaining -= len(chunk)
+            md5s.append(hash_md5.hexdigest())
+    return combineMd5s(md5s)
+
+def compress(data, encoding='gzip', level=6):
+    """Compresses bytes for the given HTTP Content-Encoding."""
+    if encoding == 'gzip':
+        return gzip.compress(data, level)
+    if encoding == 'deflate':
+        return zlib.compress(data, level)
+    raise ValueError('unsupported encoding: %s' % encoding)
 
 def readPartBytes(filename, partSize, partNumber):
     totalSize = os.stat(filename)
+
+class RateLimiter:
+    """Thread-safe token bucket allowing `rate` calls per second."""
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self._tokens = self.burst
+        self._last = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a call is allowed."""
+        while True:
+            with self._lock:
+                now = time.time()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
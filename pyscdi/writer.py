@@ -0,0 +1,220 @@
+"""Background batching writer for timeseries buckets"""
+from __future__ import division, print_function
+import logging
+import queue
+import threading
+import time
+
+from .spool import is_transient
+
+LOGGER = logging.getLogger('scdi')
+
+_STOP = object()
+
+
+class BufferedWriter:
+    """Coalesces single rows into ``add_rows`` batches.
+
+    Rows are queued by :meth:`add_row` and written by a background thread
+    through the bucket's ``?batch`` endpoint whenever ``max_rows`` rows or
+    ``max_bytes`` bytes are pending, or the oldest pending row has waited
+    ``max_latency`` seconds. When ``max_queue`` rows are waiting,
+    :meth:`add_row` blocks until the writer catches up.
+
+    Usage::
+
+        with bucket.buffered_writer(max_rows=1000) as w:
+            for reading in readings:
+                w.add_row(reading)
+
+    """
+
+    def __init__(self, bucket, max_rows=500, max_bytes=1000000, max_latency=1.0,
+                 max_queue=10000, on_flush=None, spool=None):
+        """
+        Args:
+            bucket (Timeseries): the bucket to write to.
+
+        Kwargs:
+            max_rows (int): flush after this many rows.
+            max_bytes (int): flush after this many bytes of JSON.
+            max_latency (float): flush rows older than this many seconds.
+            max_queue (int): maximum number of rows waiting in the queue.
+            on_flush (callable): called as ``on_flush(rows, error)`` after
+                every flush; error is None when the batch was written,
+                or spooled behind a backlog.
+                A row that cannot be serialized is dropped and reported
+                on its own, with the serializer's error.
+            spool (Spool): rows of flushes that fail with a transient
+                error are appended to this :class:`pyscdi.spool.Spool`
+                instead of being dropped, and so are all flushes while
+                it holds a backlog, so they are not sent ahead of it.
+
+        """
+        self._bucket = bucket
+        self._max_rows = max_rows
+        self._max_bytes = max_bytes
+        self._max_latency = max_latency
+        self._on_flush = on_flush
+        self._spool = spool
+        self._q = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        # add_row calls past the closed check whose row is not queued yet
+        self._putting = 0
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.rows_spooled = 0
+        self.flushes = 0
+        self.last_error = None
+        self._thread = threading.Thread(target=self._run, name='scdi-writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_row(self, payload, block=True, timeout=None):
+        """Queues a row.
+
+        Args:
+            payload (dict): row data
+
+        Kwargs:
+            block (bool): wait for room in a full queue.
+            timeout (float): maximum time to wait, raises ``queue.Full``.
+
+        """
+        with self._lock:
+            if self._closed:
+                raise ValueError('writer is closed')
+            self._putting += 1
+        try:
+            self._q.put(payload, block, timeout)
+        finally:
+            with self._lock:
+                self._putting -= 1
+                if not self._putting:
+                    self._idle.notify_all()
+
+    def flush(self):
+        """Writes all queued rows and waits until they are sent.
+
+        Does nothing once the writer is closed, as closing flushes.
+        """
+        done = threading.Event()
+        with self._lock:
+            # nothing is read from the queue after _STOP
+            if self._closed:
+                return
+            self._q.put(done)
+        done.wait()
+
+    def close(self):
+        """Flushes the queue and stops the background thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            # rows that passed the closed check are queued before _STOP
+            while self._putting:
+                self._idle.wait()
+            self._q.put(_STOP)
+        self._thread.join()
+
+    def _write(self, rows, encoded):
+        error = None
+        # the rows were encoded one by one to measure them, join them
+        # instead of encoding the batch again
+        body = b'[' + b','.join(encoded) + b']'
+        if self._spool is not None and self._spool.backlog:
+            # behind spooled rows, and without waiting on a server that
+            # is likely still down
+            try:
+                self._spool._append(body, len(rows))
+                self.rows_spooled += len(rows)
+            except Exception as e:
+                LOGGER.error("Failed to spool %d rows: %s", len(rows), e)
+                self.last_error = error = e
+                self.rows_failed += len(rows)
+            self.flushes += 1
+            self._notify(rows, error)
+            return
+        try:
+            if self._spool is not None:
+                # fail fast, the spool replays with retries
+                self._bucket._add_batch(body, True, max_retries=0,
+                                        deadline=self._spool.direct_deadline)
+            else:
+                self._bucket._add_batch(body, True)
+            self.rows_written += len(rows)
+        except Exception as e:
+            self.last_error = error = e
+            if self._spool is not None and is_transient(e):
+                try:
+                    self._spool._append(body, len(rows))
+                    self.rows_spooled += len(rows)
+                    LOGGER.warning("Spooled %d rows: %s", len(rows), e)
+                except Exception as spool_error:
+                    LOGGER.error("Failed to spool %d rows: %s", len(rows), spool_error)
+                    self.rows_failed += len(rows)
+            else:
+                LOGGER.error("Failed to write %d rows: %s", len(rows), e)
+                self.rows_failed += len(rows)
+        self.flushes += 1
+        self._notify(rows, error)
+
+    def _reject(self, row, error):
+        """Reports a row that cannot be serialized as a failed flush."""
+        LOGGER.error("Dropping row that cannot be serialized: %s", error)
+        self.last_error = error
+        self.rows_failed += 1
+        self._notify([row], error)
+
+    def _notify(self, rows, error):
+        if self._on_flush is not None:
+            try:
+                self._on_flush(rows, error)
+            except Exception:
+                # the writer thread must survive a failing callback
+                LOGGER.exception("on_flush callback failed")
+
+    def _run(self):
+        rows = []
+        encoded = []
+        size = 0
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.time())
+            try:
+                item = self._q.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is None or item is _STOP or isinstance(item, threading.Event):
+                # latency deadline, explicit flush or shutdown
+                if rows:
+                    self._write(rows, encoded)
+                rows, encoded, size, deadline = [], [], 0, None
+                if item is _STOP:
+                    return
+                if item is not None:
+                    item.set()
+                continue
+            try:
+                data = self._bucket._conn._serializer.dumps(item)
+            except Exception as e:
+                # one bad row must not kill the thread or its batch
+                self._reject(item, e)
+                continue
+            if not rows:
+                deadline = time.time() + self._max_latency
+            rows.append(item)
+            encoded.append(data)
+            size += len(data)
+            if len(rows) >= self._max_rows or size >= self._max_bytes:
+                self._write(rows, encoded)
+                rows, encoded, size, deadline = [], [], 0, None
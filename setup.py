@@ -11,4 +11,12 @@ setup(name='pyscdi',
       install_requires=[
           'requests'
       ],
+      extras_require={
+          'async': ['aiohttp'],
+          'numpy': ['numpy'],
+          'fast': ['orjson'],
+      },
+      entry_points={
+          'console_scripts': ['pyscdi = pyscdi.cli:main'],
+      },
       zip_safe=False)
@@ -0,0 +1,159 @@
+"""Asyncio client against the mock server"""
+from __future__ import division, print_function
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from benchmarks.mockserver import MockServer
+from pyscdi.retry import RetryPolicy
+
+try:
+    import aiohttp
+    from pyscdi.aio import AsyncScdi
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+COLUMNS = [{'name': 'ts', 'type': 'timestamp'}, {'name': 'temp', 'type': 'double'}]
+
+
+class _StallingHandler(BaseHTTPRequestHandler):
+    """Sends part of a body, then stalls until the client gives up."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests += 1
+        self.send_response(200)
+        self.send_header('Content-Length', '200000')
+        self.end_headers()
+        self.wfile.write(b'x' * 1000)
+        self.wfile.flush()
+        time.sleep(1.0)
+
+
+@unittest.skipIf(aiohttp is None, 'aiohttp is not installed')
+class AsyncScdiTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockServer().start()
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp)
+
+    def _run(self, fn, **kwargs):
+        async def main():
+            async with AsyncScdi(self.server.username, 'key', api_url=self.server.api_url,
+                                 **kwargs) as conn:
+                return await fn(conn)
+        return asyncio.run(main())
+
+    def test_timeseries(self):
+        async def work(conn):
+            bucket = await conn.create_timeseries_bucket('series', COLUMNS)
+            await bucket.add_rows([{'ts': i, 'temp': i / 2.0} for i in range(10)])
+            await bucket.add_row({'ts': 10, 'temp': 5.0})
+            self.assertEqual((await bucket.get_info())['columns'], COLUMNS)
+            self.assertIn('series', await conn.get_buckets())
+            return (await bucket.query(fromEpoch=3, toEpoch=5),
+                    await bucket.query(fromEpoch=100),
+                    await bucket.query(aggregate=[{'op': 'count', 'column': 'temp'}]))
+        rows, empty, count = self._run(work)
+        self.assertEqual(rows, [{'ts': 3, 'temp': 1.5}, {'ts': 4, 'temp': 2.0},
+                                {'ts': 5, 'temp': 2.5}])
+        self.assertEqual(empty, [])
+        self.assertEqual(list(count[0].values()), [11])
+
+    def test_keyvalue(self):
+        async def work(conn):
+            bucket = await conn.create_keyvalue_bucket('kv')
+            values = dict(('k%d' % i, os.urandom(100 * i)) for i in range(20))
+            await asyncio.gather(*[bucket.put(k, v) for k, v in values.items()])
+            got = await asyncio.gather(*[bucket.get(k) for k in values])
+            self.assertEqual(got, list(values.values()))
+            with self.assertRaises(aiohttp.ClientResponseError):
+                await bucket.get('missing')
+        self._run(work, max_connections=4)
+
+    def test_objects(self):
+        data = os.urandom(10 * 1000 + 7)
+        path = os.path.join(self.tmp, 'data.bin')
+        with open(path, 'wb') as f:
+            f.write(data)
+        out = os.path.join(self.tmp, 'out.bin')
+
+        async def work(conn):
+            bucket = await conn.create_kws_bucket('objects')
+            await bucket.put_object('multi.bin', path, max_size=1000, max_workers=3)
+            await bucket.put_object('single.bin', path, max_size=len(data) + 1)
+            await bucket.get_object_as_file('multi.bin', out)
+            single = await bucket.get_object('single.bin')
+            names = [o['name'] for o in await bucket.list_objects()]
+            await bucket.delete_object('single.bin')
+            return single, names, [o['name'] for o in await bucket.list_objects()]
+
+        single, names, remaining = self._run(work)
+        with open(out, 'rb') as f:
+            self.assertEqual(f.read(), data)
+        self.assertEqual(single, data)
+        self.assertEqual(names, ['multi.bin', 'single.bin'])
+        self.assertEqual(remaining, ['multi.bin'])
+        self.assertTrue(self.server.buckets['objects'].objects['multi.bin'][1].endswith('-11'))
+
+    def test_retries(self):
+        decisions = []
+
+        def recover(decision):
+            decisions.append(decision)
+            if len(decisions) == 2:
+                self.server.error_rate = 0.0
+
+        async def work(conn):
+            bucket = await conn.create_keyvalue_bucket('kv')
+            await bucket.put('k', b'v')
+            self.server.error_rate = 1.0
+            return await bucket.get('k')
+
+        policy = RetryPolicy(backoff=0.01, listeners=[recover])
+        self.assertEqual(self._run(work, retry_policy=policy), b'v')
+        self.assertEqual([d.retry for d in decisions], [True, True])
+
+    def test_deadline(self):
+        self.server.error_rate = 1.0
+
+        async def work(conn):
+            t = time.time()
+            with self.assertRaises((aiohttp.ClientResponseError, asyncio.TimeoutError)):
+                await conn.get_buckets()
+            return time.time() - t
+
+        policy = RetryPolicy(max_retries=1000, backoff=0.05, jitter=False)
+        self.assertLess(self._run(work, retry_policy=policy, deadline=0.3), 0.6)
+
+    def test_streamed_body_is_not_retried(self):
+        httpd = ThreadingHTTPServer(('127.0.0.1', 0), _StallingHandler)
+        httpd.daemon_threads = True
+        httpd.requests = 0
+        thread = threading.Thread(target=httpd.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(httpd.server_close)
+        self.addCleanup(httpd.shutdown)
+        uri = 'http://%s:%d/obj' % httpd.server_address[:2]
+        chunks = []
+
+        async def work(conn):
+            with self.assertRaises(asyncio.TimeoutError):
+                await conn._make_request('GET', uri, timeout=0.2, sink=chunks.append)
+
+        self._run(work, retry_policy=RetryPolicy(backoff=0.01))
+        # a retry would append the body again after the partial one
+        self.assertEqual(httpd.requests, 1)
+        self.assertEqual(sum(len(c) for c in chunks), 1000)
@@ -0,0 +1,127 @@
+"""Client-side caches against the mock server"""
+from __future__ import division, print_function
+import datetime
+import time
+import unittest
+
+import requests
+
+from benchmarks.mockserver import MockServer
+from pyscdi import Scdi
+from pyscdi.cache import KeyvalueCache, QueryCache
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+COLUMNS = [{'name': 'timestamp', 'type': 'timestamp'}, {'name': 'value', 'type': 'int'}]
+
+
+class QueryCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockServer().start()
+        self.cache = QueryCache()
+        self.conn = Scdi(self.server.username, 'key', api_url=self.server.api_url,
+                         query_cache=self.cache)
+        self.bucket = self.conn.create_timeseries_bucket('series', COLUMNS)
+        self.bucket.add_rows([{'timestamp': i, 'value': i} for i in range(10)])
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _query_twice(self, **kwargs):
+        first = self.bucket.query(**kwargs)
+        requests = self.server.requests
+        self.assertEqual(self.bucket.query(**kwargs), first)
+        self.assertEqual(self.server.requests, requests)
+        return first
+
+    def test_repeated_query_is_served_from_cache(self):
+        self.assertEqual(len(self._query_twice(fromEpoch=5)), 5)
+
+    def test_datetime_bounds(self):
+        rows = self._query_twice(toEpoch=datetime.datetime(1970, 1, 1, 0, 0, 3))
+        self.assertEqual([r['timestamp'] for r in rows], [0, 1, 2, 3])
+        self.assertEqual(self.cache.ttl_for({'toEpoch': datetime.datetime(1970, 1, 2)}),
+                         self.cache.immutable_ttl)
+
+    @unittest.skipIf(np is None, 'numpy is not installed')
+    def test_numpy_bounds(self):
+        rows = self._query_twice(fromEpoch=np.int64(5), limit=np.int32(2))
+        self.assertEqual([r['timestamp'] for r in rows], [5, 6])
+
+
+class KeyvalueCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockServer().start()
+        self.conn = Scdi(self.server.username, 'key', api_url=self.server.api_url)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _bucket(self, **kwargs):
+        self.cache = KeyvalueCache(**kwargs)
+        return self.conn.create_keyvalue_bucket('kv', cache=self.cache)
+
+    def _store(self, key, value):
+        # changes the value behind the client's back
+        self.server.buckets['kv'].kv[key] = value
+
+    def _requests(self, fn, *args):
+        before = self.server.requests
+        result = fn(*args)
+        return result, self.server.requests - before
+
+    def test_fresh_values_are_served_locally(self):
+        bucket = self._bucket(ttl=60)
+        self._store('a', b'1')
+        self.assertEqual(self._requests(bucket.get, 'a'), (b'1', 1))
+        self._store('a', b'2')
+        self.assertEqual(self._requests(bucket.get, 'a'), (b'1', 0))
+        bucket.put('a', b'3')
+        self.assertEqual(self._requests(bucket.get, 'a'), (b'3', 0))
+
+    def test_stale_values_are_revalidated(self):
+        bucket = self._bucket(ttl=0.05)
+        self._store('a', b'x' * 1000)
+        bucket.get('a')
+        time.sleep(0.1)
+        self.assertEqual(self._requests(bucket.get, 'a'), (b'x' * 1000, 1))
+        stats = self.cache.stats()
+        self.assertEqual((stats['revalidations'], stats['not_modified']), (1, 1))
+        # fresh again after the 304
+        self.assertEqual(self._requests(bucket.get, 'a'), (b'x' * 1000, 0))
+        time.sleep(0.1)
+        self._store('a', b'y')
+        self.assertEqual(self._requests(bucket.get, 'a'), (b'y', 1))
+        stats = self.cache.stats()
+        self.assertEqual((stats['revalidations'], stats['not_modified']), (2, 1))
+
+    def test_missing_keys_are_cached_until_they_expire(self):
+        bucket = self._bucket(negative_ttl=0.1)
+        errors = []
+        for _ in range(3):
+            with self.assertRaises(requests.exceptions.HTTPError) as ctx:
+                bucket.get('missing')
+            errors.append(ctx.exception)
+        self.assertEqual(self.server.requests, 2)  # create and the first get
+        self.assertEqual([e.response.status_code for e in errors], [404] * 3)
+        # every hit raises its own error
+        self.assertEqual(len(set(map(id, errors))), 3)
+        self._store('missing', b'now')
+        with self.assertRaises(requests.exceptions.HTTPError):
+            bucket.get('missing')
+        time.sleep(0.15)
+        self.assertEqual(self._requests(bucket.get, 'missing'), (b'now', 1))
+
+    def test_value_too_large_to_cache_drops_the_old_one(self):
+        bucket = self._bucket(max_bytes=100)
+        bucket.put('a', b'small')
+        self.assertEqual(self._requests(bucket.get, 'a'), (b'small', 0))
+        bucket.put('a', b'L' * 200)
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self._requests(bucket.get, 'a'), (b'L' * 200, 1))
+        self.assertEqual(self._requests(bucket.get, 'a'), (b'L' * 200, 1))
@@ -0,0 +1,129 @@
+"""Bulk ingest against the mock server"""
+from __future__ import division, print_function
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from benchmarks.mockserver import MockServer
+from pyscdi import Scdi
+from pyscdi.cli import Checkpoint, coerce_row, coercers, ingest, main, read_rows
+
+COLUMNS = [
+    {'name': 'ts', 'type': 'timestamp'},
+    {'name': 'temp', 'type': 'double'},
+    {'name': 'count', 'type': 'int'},
+    {'name': 'ok', 'type': 'boolean'},
+    {'name': 'remark', 'type': 'varchar'},
+]
+
+
+class CoerceRowTest(unittest.TestCase):
+
+    def test_values_take_the_column_types(self):
+        coerce = coercers(COLUMNS)
+        row = coerce_row({'ts': '2017-01-01T00:00:01', 'temp': '21.5', 'count': '3',
+                          'ok': 'yes', 'remark': 12, 'other': 'x'}, coerce)
+        self.assertEqual(row, {'ts': 1483228801.0, 'temp': 21.5, 'count': 3, 'ok': True,
+                               'remark': '12', 'other': 'x'})
+        self.assertEqual(coerce_row({'ts': '1500000000.5', 'ok': 'F'}, coerce),
+                         {'ts': 1500000000.5, 'ok': False})
+
+    def test_empty_values_are_dropped(self):
+        self.assertEqual(coerce_row({'ts': '1', 'temp': '', 'remark': None},
+                                    coercers(COLUMNS)), {'ts': 1})
+
+    def test_bad_values(self):
+        for row in ({'temp': 'warm'}, {'count': '1.5'}, {'ok': 'maybe'}, {'ts': 'noon'}):
+            with self.assertRaises(ValueError):
+                coerce_row(row, coercers(COLUMNS))
+
+
+class IngestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockServer().start()
+        self.conn = Scdi(self.server.username, 'key', api_url=self.server.api_url)
+        self.conn.create_timeseries_bucket('series', COLUMNS)
+        self.tmp = tempfile.mkdtemp()
+        self.out = io.StringIO()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp)
+
+    def _path(self, name):
+        return os.path.join(self.tmp, name)
+
+    def _write_csv(self, name, start, n):
+        with open(self._path(name), 'w') as f:
+            f.write('ts,temp,remark\n')
+            for i in range(start, start + n):
+                f.write('%d,%s,r%d\n' % (i, i / 2.0 if i % 5 else '', i))
+        return self._path(name)
+
+    def _stored(self):
+        return sorted(r['ts'] for r in self.server.buckets['series'].rows)
+
+    def _ingest(self, paths, **kwargs):
+        return ingest(self.conn, 'series', paths, workers=2, progress=0, out=self.out, **kwargs)
+
+    def test_csv_and_json_inputs(self):
+        csv_path = self._write_csv('a.csv', 0, 25)
+        with gzip.open(self._path('b.jsonl.gz'), 'wt') as f:
+            for i in range(25, 35):
+                f.write(json.dumps({'ts': i, 'temp': 1.0}) + '\n\n')
+        with open(self._path('c.json'), 'w') as f:
+            json.dump([{'ts': i, 'ok': 'true'} for i in range(35, 40)], f, indent=2)
+        with open(self._path('d.json'), 'w') as f:
+            f.write(''.join(json.dumps({'ts': i}) + '\n' for i in range(40, 42)))
+        paths = [csv_path, self._path('b.jsonl.gz'), self._path('c.json'), self._path('d.json')]
+        self.assertEqual(self._ingest(paths, batch_size=7), 42)
+        self.assertEqual(self._stored(), list(range(42)))
+        rows = dict((r['ts'], r) for r in self.server.buckets['series'].rows)
+        self.assertEqual(rows[3], {'ts': 3, 'temp': 1.5, 'remark': 'r3'})
+        self.assertEqual(rows[5], {'ts': 5, 'remark': 'r5'})
+        self.assertEqual(rows[36], {'ts': 36, 'ok': True})
+
+    def test_json_array_read_incrementally(self):
+        with open(self._path('big.json'), 'w') as f:
+            json.dump([{'ts': i, 'remark': 'x' * 100} for i in range(2000)], f)
+        self.assertEqual(sum(1 for _ in read_rows([self._path('big.json')])), 2000)
+        with open(self._path('bad.json'), 'w') as f:
+            f.write('[{"ts": 1}, {"ts": 2}')
+        with self.assertRaises(ValueError):
+            list(read_rows([self._path('bad.json')]))
+
+    def test_resume_from_checkpoint(self):
+        paths = [self._write_csv('a.csv', 0, 30), self._write_csv('b.csv', 30, 20)]
+        ckpt = self._path('load.ckpt')
+        # an earlier run wrote the first three batches of ten rows
+        Checkpoint(ckpt, 'series', paths, 10).save(3)
+        self.assertEqual(self._ingest(paths, batch_size=10, checkpoint=ckpt), 20)
+        self.assertEqual(self._stored(), list(range(30, 50)))
+        self.assertIn('resuming after 3 batches', self.out.getvalue())
+        self.assertFalse(os.path.exists(ckpt))
+
+    def test_checkpoint_of_another_load_is_ignored(self):
+        paths = [self._write_csv('a.csv', 0, 30)]
+        ckpt = self._path('load.ckpt')
+        Checkpoint(ckpt, 'series', paths, 10).save(2)
+        # the same files with another batch size
+        self.assertEqual(Checkpoint(ckpt, 'series', paths, 5).load(), 0)
+        self.assertEqual(Checkpoint(ckpt, 'other', paths, 10).load(), 0)
+        self.assertEqual(Checkpoint(ckpt, 'series', paths, 10).load(), 2)
+        # the file changed since
+        self._write_csv('a.csv', 0, 31)
+        self.assertEqual(self._ingest(paths, batch_size=10, checkpoint=ckpt), 31)
+        self.assertEqual(self._stored(), list(range(31)))
+
+    def test_checkpoint_with_stdin_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self._ingest(['-'], checkpoint=self._path('load.ckpt'))
+        with self.assertRaises(SystemExit):
+            main(['--username', 'u', '--api-key', 'k', 'ingest', '--checkpoint',
+                  self._path('load.ckpt'), 'series', '-'])
+        self.assertEqual(self.server.buckets['series'].rows, [])
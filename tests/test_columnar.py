@@ -0,0 +1,82 @@
+"""Columnar query results against the mock server"""
+from __future__ import division, print_function
+import tracemalloc
+import unittest
+
+from benchmarks.mockserver import MockServer, MockServerProcess
+from pyscdi import Scdi
+from pyscdi.cache import QueryCache
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+COLUMNS = [
+    {'name': 'ts', 'type': 'timestamp'},
+    {'name': 'temp', 'type': 'double'},
+    {'name': 'remark', 'type': 'varchar'},
+]
+
+
+def _rows(start, n):
+    return [{'ts': start + i, 'temp': i * 0.5, 'remark': 'r%d' % (i % 7)} for i in range(n)]
+
+
+@unittest.skipIf(np is None, 'numpy is not installed')
+class ColumnarQueryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _bucket(self, **kwargs):
+        conn = Scdi(self.server.username, 'key', api_url=self.server.api_url, **kwargs)
+        return conn.create_timeseries_bucket('series', COLUMNS)
+
+    def test_columns_match_rows(self):
+        bucket = self._bucket()
+        bucket.add_rows(_rows(0, 100))
+        bucket.add_rows([{'ts': 100, 'extra': 'x'}, {'ts': 101, 'temp': 1.0}])
+        rows = bucket.query(fromEpoch=0)
+        columns = bucket.query(fromEpoch=0, columnar=True)
+        self.assertEqual(sorted(columns), ['extra', 'remark', 'temp', 'ts'])
+        self.assertEqual(columns['ts'].dtype, np.float64)
+        self.assertEqual(columns['ts'].tolist(), [r['ts'] for r in rows])
+        self.assertEqual(columns['temp'].tolist(), [r.get('temp') for r in rows])
+        self.assertEqual(columns['remark'].tolist(), [r.get('remark') for r in rows])
+        # a column first seen in a later row is masked before it
+        self.assertEqual(columns['extra'].tolist(), [None] * 100 + ['x', None])
+
+    def test_empty_result(self):
+        columns = self._bucket().query(fromEpoch=0, columnar=True)
+        self.assertEqual(sorted(columns), ['remark', 'temp', 'ts'])
+        self.assertEqual(len(columns['ts']), 0)
+
+    def test_cached_response(self):
+        bucket = self._bucket(query_cache=QueryCache())
+        bucket.add_rows(_rows(0, 10))
+        first = bucket.query(fromEpoch=0, toEpoch=5, columnar=True)
+        requests = self.server.requests
+        second = bucket.query(fromEpoch=0, toEpoch=5, columnar=True)
+        self.assertEqual(self.server.requests - requests, 1)  # the schema
+        self.assertEqual(second['temp'].tolist(), first['temp'].tolist())
+        self.assertEqual(second['ts'].tolist(), [0, 1, 2, 3, 4, 5])
+
+    def test_row_dicts_are_not_held(self):
+        # the server runs in its own process, so only the client is traced
+        with MockServerProcess() as server:
+            conn = Scdi(server.username, 'key', api_url=server.api_url)
+            bucket = conn.create_timeseries_bucket('series', COLUMNS)
+            for start in range(0, 50000, 10000):
+                bucket.add_rows(_rows(start, 10000))
+            peaks = []
+            for columnar in (False, True):
+                tracemalloc.start()
+                result = bucket.query(fromEpoch=0, columnar=columnar)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+                del result
+        self.assertLess(peaks[1], peaks[0] * 0.6)
@@ -0,0 +1,110 @@
+"""Thread-safety of a shared Scdi connection"""
+from __future__ import division, print_function
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from benchmarks.mockserver import MockServer
+from pyscdi import Scdi
+
+THREADS = 16
+REQUESTS = 25
+
+
+class _Capture(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self, logging.WARNING)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class SharedConnectionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockServer().start()
+        self.conn = Scdi(self.server.username, 'key', api_url=self.server.api_url,
+                         pool_maxsize=THREADS)
+        self.bucket = self.conn.create_keyvalue_bucket('shared')
+        self.capture = _Capture()
+        logging.getLogger('urllib3').addHandler(self.capture)
+
+    def tearDown(self):
+        logging.getLogger('urllib3').removeHandler(self.capture)
+        self.server.stop()
+
+    def test_threads_get_their_own_responses(self):
+        errors = []
+
+        def work(n):
+            try:
+                for i in range(REQUESTS):
+                    key = 'k%d-%d' % (n, i)
+                    value = ('%d:%d' % (n, i)).encode('utf-8') * (i + 1)
+                    self.bucket.put(key, value)
+                    got = self.bucket.get(key)
+                    if got != value:
+                        errors.append((key, got))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work, args=(n,)) for n in range(THREADS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.server.buckets['shared'].kv), THREADS * REQUESTS)
+        stats = self.conn.metrics.snapshot()
+        self.assertEqual(stats['kv_get']['requests'], THREADS * REQUESTS)
+        self.assertEqual(stats['kv_get']['errors'], 0)
+        pool_full = [m for m in self.capture.messages if 'pool is full' in m]
+        self.assertEqual(pool_full, [])
+
+    def test_headers_are_not_shared_between_calls(self):
+        headers = dict(self.conn._headers)
+        uri = self.server.api_url + self.server.username + '/shared'
+        self.conn._make_request('POST', uri, params={'key': 'h'}, data=b'x',
+                                headers={'X-Extra': '1'})
+        self.assertEqual(self.conn._headers, headers)
+
+
+class BlockingPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockServer().start()
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp)
+
+    def test_multipart_upload_on_blocking_pool(self):
+        # fewer pooled connections than workers: each part must give its
+        # connection back or the other workers wait forever
+        conn = Scdi(self.server.username, 'key', api_url=self.server.api_url,
+                    pool_maxsize=2, pool_block=True)
+        bucket = conn.create_kws_bucket('objects')
+        data = os.urandom(10 * 1000 + 123)
+        path = os.path.join(self.tmp, 'data.bin')
+        with open(path, 'wb') as f:
+            f.write(data)
+
+        result = []
+        t = threading.Thread(target=lambda: result.append(
+            bucket.put_object('data.bin', path, max_size=1000, max_workers=4)))
+        t.daemon = True
+        t.start()
+        t.join(30)
+        self.assertFalse(t.is_alive(), 'upload deadlocked on the connection pool')
+        self.assertEqual(len(result), 1)
+        self.assertEqual(self.server.buckets['objects'].objects['data.bin'][0], data)
+
+
+if __name__ == '__main__':
+    unittest.main()
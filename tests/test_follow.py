@@ -0,0 +1,90 @@
+"""Following a timeseries bucket against the mock server"""
+from __future__ import division, print_function
+import threading
+import time
+import unittest
+
+from benchmarks.mockserver import MockServer
+from pyscdi import Scdi
+
+COLUMNS = [{'name': 'ts', 'type': 'timestamp'}, {'name': 'n', 'type': 'int'}]
+
+
+def _group(ts, n, first):
+    return [{'ts': ts, 'n': first + i} for i in range(n)]
+
+
+class FollowTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockServer().start()
+        conn = Scdi(self.server.username, 'key', api_url=self.server.api_url)
+        self.bucket = conn.create_timeseries_bucket('series', COLUMNS)
+        self.stop = threading.Event()
+        self.got = []
+
+    def tearDown(self):
+        self.stop.set()
+        self.server.stop()
+
+    def _follow(self, **kwargs):
+        def run():
+            for row in self.bucket.follow(stop=self.stop, min_interval=0.01, max_interval=0.05,
+                                          ts_column='ts', **kwargs):
+                self.got.append(row)
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def _wait_for(self, n, timeout=5.0):
+        deadline = time.time() + timeout
+        while len(self.got) < n and time.time() < deadline:
+            time.sleep(0.01)
+        # polls after the last row must not repeat any
+        time.sleep(0.2)
+
+    def _check(self, expected):
+        key = lambda r: (r['ts'], r['n'])
+        self.assertEqual(sorted(self.got, key=key), sorted(expected, key=key))
+
+    def test_ties_larger_than_a_page_with_lag(self):
+        rows = []
+        for ts in range(10):
+            rows += _group(ts, 4, len(rows))
+        self.bucket.add_rows(rows)
+        thread = self._follow(fromEpoch=0, page_size=3, lag=2)
+        self._wait_for(len(rows))
+        more = []
+        for ts in range(10, 15):
+            more += _group(ts, 5, len(rows) + len(more))
+        self.bucket.add_rows(more)
+        # a row arriving late, within the lag
+        late = {'ts': 13.5, 'n': -1}
+        self.bucket.add_row(late)
+        self._wait_for(len(rows) + len(more) + 1)
+        self.stop.set()
+        thread.join()
+        self._check(rows + more + [late])
+        self.assertEqual([r['ts'] for r in self.got[:len(rows)]], [r['ts'] for r in rows])
+
+    def test_without_pages(self):
+        rows = []
+        for ts in range(5):
+            rows += _group(ts, 3, len(rows))
+        self.bucket.add_rows(rows)
+        thread = self._follow(fromEpoch=0)
+        self._wait_for(len(rows))
+        more = _group(5, 3, len(rows))
+        self.bucket.add_rows(more)
+        self._wait_for(len(rows) + len(more))
+        self.stop.set()
+        thread.join()
+        self._check(rows + more)
+
+    def test_rows_before_fromEpoch_are_skipped(self):
+        self.bucket.add_rows(_group(5, 2, 0) + _group(10, 2, 2))
+        thread = self._follow(fromEpoch=10, page_size=1)
+        self._wait_for(2)
+        self.stop.set()
+        thread.join()
+        self._check(_group(10, 2, 2))
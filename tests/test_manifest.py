@@ -0,0 +1,63 @@
+"""Upload checkpoint manifests"""
+from __future__ import division, print_function
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyscdi.manifest import UploadManifest
+
+
+class UploadManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'data.bin')
+        with open(self.path, 'wb') as f:
+            f.write(b'x' * 1000)
+        self.filename = os.path.join(self.tmp, 'data.manifest')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _manifest(self):
+        return UploadManifest(self.filename, 'bucket', 'data.bin', self.path, 100)
+
+    def _interrupted(self, tail):
+        m = self._manifest()
+        m.start()
+        m.add(1, 'aa')
+        m.add(2, 'bb')
+        m.close()
+        with open(self.filename, 'ab') as f:
+            f.write(tail)
+
+    def _resume_twice(self):
+        m = self._manifest()
+        self.assertTrue(m.load())
+        self.assertEqual(m.parts, {1: 'aa', 2: 'bb'})
+        m.resume()
+        m.add(3, 'cc')
+        m.add(4, 'dd')
+        m.close()
+        m = self._manifest()
+        self.assertTrue(m.load())
+        self.assertEqual(m.parts, {1: 'aa', 2: 'bb', 3: 'cc', 4: 'dd'})
+
+    def test_resume_after_torn_line(self):
+        self._interrupted(b'{"part": 3, "md')
+        self._resume_twice()
+
+    def test_resume_after_line_without_newline(self):
+        self._interrupted(b'{"part": 3, "md5": "cc"}')
+        self._resume_twice()
+
+    def test_resume_after_clean_stop(self):
+        self._interrupted(b'')
+        self._resume_twice()
+
+    def test_modified_file_is_not_resumed(self):
+        self._interrupted(b'')
+        with open(self.path, 'ab') as f:
+            f.write(b'y')
+        self.assertFalse(self._manifest().load())
@@ -0,0 +1,69 @@
+"""Object downloads against the mock server"""
+from __future__ import division, print_function
+import os
+import shutil
+import tempfile
+import unittest
+
+from benchmarks.mockserver import MockServer
+from pyscdi import Scdi
+
+
+class GetObjectAsFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockServer().start()
+        self.conn = Scdi(self.server.username, 'key', api_url=self.server.api_url)
+        self.bucket = self.conn.create_kws_bucket('objects')
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp)
+
+    def _store(self, name, data):
+        self.server.buckets['objects'].objects[name] = (data, 'etag')
+
+    def _download(self, name, **kwargs):
+        path = os.path.join(self.tmp, name)
+        self.bucket.get_object_as_file(name, path, **kwargs)
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_single_request(self):
+        data = os.urandom(100000)
+        self._store('a.bin', data)
+        self.assertEqual(self._download('a.bin', chunk_size=4096), data)
+
+    def test_ranges_with_workers(self):
+        # an uneven tail, more ranges than workers and a first range that
+        # is smaller than a chunk
+        data = os.urandom(10 * 3000 + 7)
+        self._store('a.bin', data)
+        for workers in (2, 4, 16):
+            requests = self.server.requests
+            self.assertEqual(self._download('a.bin', max_workers=workers, part_size=3000,
+                                            chunk_size=1024), data)
+            self.assertEqual(self.server.requests - requests, 11)
+
+    def test_object_within_first_range(self):
+        data = os.urandom(500)
+        self._store('a.bin', data)
+        self.assertEqual(self._download('a.bin', max_workers=4, part_size=3000), data)
+
+    def test_empty_object(self):
+        self._store('empty.bin', b'')
+        self.assertEqual(self._download('empty.bin'), b'')
+        self.assertEqual(self._download('empty.bin', max_workers=4, part_size=3000), b'')
+
+    def test_server_without_ranges(self):
+        self.server.ranges = False
+        data = os.urandom(10 * 3000 + 7)
+        self._store('a.bin', data)
+        requests = self.server.requests
+        self.assertEqual(self._download('a.bin', max_workers=4, part_size=3000), data)
+        self.assertEqual(self.server.requests - requests, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""Time partitioned queries against the mock server"""
+from __future__ import division, print_function
+import unittest
+
+from benchmarks.mockserver import MockServer
+from pyscdi import Scdi
+from pyscdi.main import ScdiException, _time_partitions
+
+COLUMNS = [{'name': 'ts', 'type': 'timestamp'}, {'name': 'temp', 'type': 'double'}]
+
+
+def _lt(value):
+    return {'column': 'ts', 'op': 'lt', 'value': value}
+
+
+class TimePartitionsTest(unittest.TestCase):
+
+    def test_every_partition_but_the_last_excludes_its_end(self):
+        where = [{'column': 'temp', 'op': 'gt', 'value': 0}]
+        parts = _time_partitions(0, 25, 10, where, 'ts')
+        self.assertEqual(parts, [(0, 10, where + [_lt(10)]), (10, 20, where + [_lt(20)]),
+                                 (20, 25, where)])
+        self.assertEqual(where, [{'column': 'temp', 'op': 'gt', 'value': 0}])
+        self.assertEqual(_time_partitions(0, 20, 10, None, 'ts'),
+                         [(0, 10, [_lt(10)]), (10, 20, [])])
+
+    def test_aligned(self):
+        self.assertEqual(_time_partitions(5, 25, 10, None, 'ts', align=True),
+                         [(5, 10, [_lt(10)]), (10, 20, [_lt(20)]), (20, 25, [])])
+        self.assertEqual(_time_partitions(-5, 3, 10, None, 'ts', align=True),
+                         [(-5, 0, [_lt(0)]), (0, 3, [])])
+
+    def test_single_instant_and_bad_length(self):
+        self.assertEqual(_time_partitions(7, 7, 10, None, 'ts'), [(7, 7, [])])
+        self.assertEqual(_time_partitions(7, 7, 10, None, 'ts', align=True), [(7, 7, [])])
+        with self.assertRaises(ScdiException):
+            _time_partitions(0, 10, 0, None, 'ts')
+
+
+class PartitionedQueryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockServer().start()
+        conn = Scdi(self.server.username, 'key', api_url=self.server.api_url)
+        self.bucket = conn.create_timeseries_bucket('series', COLUMNS)
+        # rows on every partition edge
+        self.rows = [{'ts': i, 'temp': float(i)} for i in range(31)]
+        self.bucket.add_rows(self.rows)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_query_iter_returns_edge_rows_once(self):
+        got = list(self.bucket.query_iter(0, 30, window=10, ts_column='ts'))
+        self.assertEqual(got, self.rows)
+        got = list(self.bucket.query_iter(5, 5, window=10, ts_column='ts'))
+        self.assertEqual(got, [self.rows[5]])
+
+    def test_query_aggregate_counts_edge_rows_once(self):
+        aggregate = [{'op': 'count', 'column': 'temp', 'as': 'n'},
+                     {'op': 'sum', 'column': 'temp', 'as': 'total'}]
+        before = self.server.requests
+        rows = self.bucket.query_aggregate(0, 30, aggregate, partition=10, ts_column='ts')
+        self.assertEqual(self.server.requests - before, 3)
+        self.assertEqual(rows, [{'n': 31, 'total': float(sum(range(31)))}])
@@ -0,0 +1,69 @@
+"""Partial aggregate planning and merging"""
+from __future__ import division, print_function
+import unittest
+
+from pyscdi.planner import AggregatePlan, NotDecomposable
+
+
+class AggregatePlanTest(unittest.TestCase):
+
+    def test_mean_is_sent_as_sum_and_count(self):
+        plan = AggregatePlan([{'op': 'avg', 'column': 'temp'}, {'op': 'sum', 'column': 'temp'}])
+        self.assertEqual(plan.partial, [{'op': 'sum', 'column': 'temp'},
+                                        {'op': 'count', 'column': 'temp'}])
+
+    def test_aliases_are_kept(self):
+        plan = AggregatePlan([{'op': 'avg', 'column': 'temp', 'as': 'mean'},
+                              {'op': 'max', 'column': 'temp', 'as': 'hi'}])
+        self.assertEqual(plan.partial, [{'op': 'sum', 'column': 'temp'},
+                                        {'op': 'count', 'column': 'temp'},
+                                        {'op': 'max', 'column': 'temp', 'as': 'hi'}])
+        rows = plan.merge([[{'sum(temp)': 6.0, 'count(temp)': 2, 'hi': 4.0}],
+                           [{'sum(temp)': 3.0, 'count(temp)': 1, 'hi': 9.0}]])
+        self.assertEqual(rows, [{'mean': 3.0, 'hi': 9.0}])
+
+    def test_result_key_formats(self):
+        aggregate = [{'op': 'avg', 'column': 'temp'}, {'op': 'min', 'column': 'temp'}]
+        for fmt in ('{fn}({col})', '{fn}_{col}', '{col}_{fn}'):
+            plan = AggregatePlan(aggregate)
+
+            def row(s, c, m):
+                return {fmt.format(fn='sum', col='temp'): s,
+                        fmt.format(fn='count', col='temp'): c,
+                        fmt.format(fn='min', col='temp'): m}
+
+            rows = plan.merge([[row(10.0, 4, 1.0)], [row(2.0, 2, -1.0)], []])
+            self.assertEqual(rows, [{fmt.format(fn='avg', col='temp'): 2.0,
+                                     fmt.format(fn='min', col='temp'): -1.0}], fmt)
+
+    def test_count_without_column(self):
+        plan = AggregatePlan([{'op': 'count'}])
+        self.assertEqual(plan.merge([[{'count(*)': 3}], [{'count(*)': 4}]]), [{'count(*)': 7}])
+        self.assertEqual(plan.merge([[{'count': 3}], [{'count': 4}]]), [{'count': 7}])
+
+    def test_groups_and_empty_partitions(self):
+        plan = AggregatePlan([{'op': 'avg', 'column': 'temp', 'as': 'mean'},
+                              {'op': 'count', 'column': 'temp', 'as': 'n'}])
+        rows = plan.merge([
+            [{'site': 'a', 'sum(temp)': 4.0, 'count(temp)': 2, 'n': 2},
+             {'site': 'b', 'sum(temp)': None, 'count(temp)': 0, 'n': 0}],
+            [{'site': 'b', 'sum(temp)': 5.0, 'count(temp)': 1, 'n': 1}],
+            [{'site': 'c', 'sum(temp)': None, 'count(temp)': 0, 'n': 0}],
+        ])
+        self.assertEqual(rows, [{'site': 'a', 'mean': 2.0, 'n': 2},
+                                {'site': 'b', 'mean': 5.0, 'n': 1},
+                                {'site': 'c', 'mean': None, 'n': 0}])
+        self.assertEqual(plan.merge([[], []]), [])
+
+    def test_unreadable_results(self):
+        plan = AggregatePlan([{'op': 'sum', 'column': 'temp'}])
+        with self.assertRaises(NotDecomposable):
+            plan.merge([[{'total': 1.0}]])
+        with self.assertRaises(NotDecomposable):
+            plan.merge([[{'sum(temp)': 1.0}], [{'sum_temp': 1.0}]])
+
+    def test_not_decomposable(self):
+        for aggregate in (None, [], [{'op': 'median', 'column': 'temp'}], ['sum(temp)'],
+                          [{'column': 'temp'}]):
+            with self.assertRaises(NotDecomposable):
+                AggregatePlan(aggregate)
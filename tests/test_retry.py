@@ -0,0 +1,160 @@
+"""Retry decisions and deadlines"""
+from __future__ import division, print_function
+import email.utils
+import time
+import unittest
+
+import requests
+
+from benchmarks.mockserver import MockServer
+from pyscdi import Scdi
+from pyscdi.retry import (RetryBudget, RetryPolicy, CONNECT_TIMEOUT, READ_TIMEOUT,
+                          CONNECTION_ERROR)
+
+URI = 'http://scdi/api/v1/user/bucket'
+
+
+class RetryPolicyTest(unittest.TestCase):
+
+    def test_idempotent_verbs(self):
+        policy = RetryPolicy(jitter=False)
+        for reason in (403, 429, 503, CONNECT_TIMEOUT):
+            for verb in ('GET', 'PUT', 'POST', 'DELETE'):
+                self.assertTrue(policy.decide(verb, URI, 0, reason).retry, (verb, reason))
+        for reason in (500, 502, 504, READ_TIMEOUT, CONNECTION_ERROR):
+            self.assertTrue(policy.decide('GET', URI, 0, reason).retry, reason)
+            self.assertTrue(policy.decide('DELETE', URI, 0, reason).retry, reason)
+            self.assertFalse(policy.decide('POST', URI, 0, reason).retry, reason)
+            self.assertFalse(policy.decide('PUT', URI, 0, reason).retry, reason)
+        for reason in (400, 404, 409):
+            self.assertFalse(policy.decide('GET', URI, 0, reason).retry, reason)
+
+    def test_max_retries(self):
+        policy = RetryPolicy(max_retries=2)
+        self.assertTrue(policy.decide('GET', URI, 1, 503).retry)
+        self.assertFalse(policy.decide('GET', URI, 2, 503).retry)
+        self.assertTrue(policy.decide('GET', URI, 2, 503, max_retries=3).retry)
+        self.assertFalse(policy.decide('GET', URI, 0, 503, max_retries=0).retry)
+
+    def test_backoff(self):
+        policy = RetryPolicy(backoff=0.5, max_backoff=3.0, jitter=False)
+        self.assertEqual([policy.decide('GET', URI, n, 503).delay for n in range(4)],
+                         [0.5, 1.0, 2.0, 3.0])
+        policy = RetryPolicy(backoff=0.5, max_backoff=3.0)
+        for n in range(10):
+            self.assertTrue(0 <= policy.decide('GET', URI, n, 503).delay <= 3.0)
+        self.assertEqual(policy.decide('GET', URI, 0, 400).delay, 0.0)
+
+    def test_retry_after_seconds(self):
+        policy = RetryPolicy(backoff=0.1, jitter=False)
+        decision = policy.decide('POST', URI, 0, 429, headers={'Retry-After': '7'})
+        self.assertTrue(decision.retry)
+        self.assertEqual(decision.delay, 7.0)
+        # the backoff wins when it is longer
+        decision = policy.decide('POST', URI, 0, 429, headers={'Retry-After': '0'})
+        self.assertEqual(decision.delay, 0.1)
+
+    def test_retry_after_date(self):
+        policy = RetryPolicy(backoff=0.1, jitter=False)
+        date = email.utils.formatdate(time.time() + 30, usegmt=True)
+        delay = policy.decide('GET', URI, 0, 503, headers={'Retry-After': date}).delay
+        self.assertTrue(28 <= delay <= 30, delay)
+        past = email.utils.formatdate(time.time() - 30, usegmt=True)
+        self.assertEqual(policy.decide('GET', URI, 0, 503, headers={'Retry-After': past}).delay,
+                         0.1)
+        self.assertEqual(policy.decide('GET', URI, 0, 503,
+                                       headers={'Retry-After': 'soon'}).delay, 0.1)
+
+    def test_deadline(self):
+        policy = RetryPolicy(backoff=1.0, jitter=False)
+        self.assertTrue(policy.decide('GET', URI, 0, 503, deadline=time.time() + 5).retry)
+        decision = policy.decide('GET', URI, 0, 503, deadline=time.time() + 0.5)
+        self.assertFalse(decision.retry)
+        self.assertEqual(decision.delay, 0.0)
+        # a Retry-After beyond the deadline also gives up
+        self.assertFalse(policy.decide('GET', URI, 0, 503, headers={'Retry-After': '10'},
+                                       deadline=time.time() + 5).retry)
+
+    def test_budget(self):
+        budget = RetryBudget(max_retries=3, window=0.2)
+        policy = RetryPolicy(budget=budget)
+        self.assertEqual([policy.decide('GET', URI, 0, 503).retry for _ in range(5)],
+                         [True, True, True, False, False])
+        # requests that are not retried do not use the budget
+        self.assertFalse(policy.decide('GET', URI, 0, 404).retry)
+        time.sleep(0.25)
+        self.assertTrue(policy.decide('GET', URI, 0, 503).retry)
+
+    def test_listeners(self):
+        decisions = []
+        policy = RetryPolicy(listeners=[decisions.append])
+        policy.decide('GET', URI, 0, 503)
+        policy.decide('POST', URI, 0, 500)
+        self.assertEqual([(d.verb, d.reason, d.retry) for d in decisions],
+                         [('GET', 503, True), ('POST', 500, False)])
+
+
+class MakeRequestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockServer(error_rate=1.0).start()
+        self.decisions = []
+        self.policy = RetryPolicy(max_retries=3, backoff=0.01, max_backoff=0.02,
+                                  listeners=[self.decisions.append])
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _conn(self, **kwargs):
+        return Scdi(self.server.username, 'key', api_url=self.server.api_url,
+                    retry_policy=self.policy, **kwargs)
+
+    def _uri(self):
+        return self.server.api_url + self.server.username
+
+    def test_retries_until_max_retries(self):
+        conn = self._conn()
+        with self.assertRaises(requests.exceptions.HTTPError):
+            conn._make_request('GET', self._uri(), op='list')
+        stats = conn.metrics.snapshot()['list']
+        self.assertEqual((stats['requests'], stats['retries'], stats['errors']), (1, 3, 1))
+        self.assertEqual(self.server.requests, 4)
+
+    def test_retries_until_success(self):
+        def recover(decision):
+            if decision.attempt == 1:
+                self.server.error_rate = 0.0
+        self.policy.add_listener(recover)
+        conn = self._conn()
+        conn._make_request('GET', self._uri(), op='list')
+        stats = conn.metrics.snapshot()['list']
+        self.assertEqual((stats['requests'], stats['retries'], stats['errors']), (1, 2, 0))
+        self.assertEqual(self.server.requests, 3)
+
+    def test_non_idempotent_request_is_not_retried(self):
+        self.server.error_status = 500
+        conn = self._conn()
+        with self.assertRaises(requests.exceptions.HTTPError):
+            conn._make_request('POST', self._uri() + '/b?batch', json=[], op='add_rows')
+        with self.assertRaises(requests.exceptions.HTTPError):
+            conn._make_request('GET', self._uri(), op='list')
+        snapshot = conn.metrics.snapshot()
+        self.assertEqual(snapshot['add_rows']['retries'], 0)
+        self.assertEqual(snapshot['list']['retries'], 3)
+
+    def test_connection_deadline(self):
+        self.policy.max_retries = 1000
+        self.policy.backoff = self.policy.max_backoff = 0.05
+        self.policy.jitter = False
+        conn = self._conn(deadline=0.3)
+        t = time.time()
+        with self.assertRaises(requests.exceptions.RequestException):
+            conn._make_request('GET', self._uri(), op='list')
+        self.assertLess(time.time() - t, 0.6)
+        stats = conn.metrics.snapshot()['list']
+        self.assertTrue(1 <= stats['retries'] <= 6, stats['retries'])
+        self.assertEqual(stats['errors'], 1)
+        # a call's own deadline overrides the connection's
+        with self.assertRaises(requests.exceptions.RequestException):
+            conn._make_request('GET', self._uri(), op='info', deadline=0.01)
+        self.assertEqual(conn.metrics.snapshot()['info']['retries'], 0)
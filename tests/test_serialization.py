@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""Incremental JSON array decoding"""
+from __future__ import division, print_function
+import json
+import unittest
+
+from pyscdi.serialization import iter_array
+
+ROWS = [
+    {'ts': 1500000000.25, 'temp': -12.5e-3, 'n': 12345, 'ok': True, 'gone': None},
+    {'ts': 1500000001, 'remark': u'café 温度 \U0001f321', 'esc': 'a"b\\c\n'},
+    [1, [2, [3, {}]], []],
+    -0.0,
+    'x',
+    False,
+    987654321,
+]
+TEXT = (u' [ %s ,\n%s , %s,%s\t,%s,  %s,%s ] \n' % tuple(json.dumps(r) for r in ROWS)).encode('utf-8')
+
+
+def _decode(data, *cuts):
+    bounds = (0,) + cuts + (len(data),)
+    return list(iter_array(data[a:b] for a, b in zip(bounds, bounds[1:])))
+
+
+class IterArrayTest(unittest.TestCase):
+
+    def test_every_split(self):
+        for i in range(len(TEXT) + 1):
+            self.assertEqual(_decode(TEXT, i), ROWS, 'split at %d' % i)
+
+    def test_every_pair_of_splits(self):
+        text = b'[1.5,"\xc3\xa9",{"a":[true,null]},-20,3e2]'
+        expected = json.loads(text.decode('utf-8'))
+        for i in range(len(text) + 1):
+            for j in range(i, len(text) + 1):
+                self.assertEqual(_decode(text, i, j), expected, 'split at %d, %d' % (i, j))
+
+    def test_single_bytes(self):
+        self.assertEqual(list(iter_array(TEXT[i:i + 1] for i in range(len(TEXT)))), ROWS)
+
+    def test_empty(self):
+        self.assertEqual(list(iter_array([])), [])
+        self.assertEqual(list(iter_array([b'', b''])), [])
+        self.assertEqual(list(iter_array([b'[', b' ]'])), [])
+
+    def test_elements_are_yielded_before_the_end(self):
+        it = iter_array(iter([b'[{"a":1},', b'{"a":2}', b']']))
+        self.assertEqual(next(it), {'a': 1})
+
+    def test_truncated(self):
+        # from the opening bracket up to before the closing one
+        for i in range(2, len(TEXT.rstrip())):
+            with self.assertRaises(ValueError, msg='truncated at %d' % i):
+                list(iter_array([TEXT[:i]]))
+
+    def test_malformed(self):
+        for text in (b'{"a":1}', b'1', b'"[1]"', b'[1,]', b'[,1]', b'[1 2]', b'[1;2]',
+                     b'[1]x', b'[1] [2]', b'[1]]', b'[tru]', b'[1.2.3]', b'[{"a":}]',
+                     b'[nan]', b'[-]', b'["\xff"]'):
+            for i in range(len(text) + 1):
+                with self.assertRaises(ValueError, msg='%r split at %d' % (text, i)):
+                    _decode(text, i)
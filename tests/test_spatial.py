@@ -0,0 +1,143 @@
+"""Tiling and the local spatial index"""
+from __future__ import division, print_function
+import random
+import time
+import unittest
+
+from benchmarks.mockserver import MockServer
+from pyscdi import Scdi
+from pyscdi.spatial import GridIndex, haversine, tiles
+
+COLUMNS = [
+    {'name': 'ts', 'type': 'timestamp'},
+    {'name': 'lat', 'type': 'double'},
+    {'name': 'lng', 'type': 'double'},
+]
+
+
+def _owner(grid, lat, lng):
+    return [t for t in grid if t[0] <= lat < t[2] and t[1] <= lng < t[3]]
+
+
+class TilesTest(unittest.TestCase):
+
+    def test_box_edges_on_tile_boundaries(self):
+        grid = tiles(0.0, 0.0, 0.3, 0.3, 0.1)
+        self.assertEqual(len(grid), 16)
+        self.assertIn((0.3, 0.3, 0.4, 0.4), grid)
+        for k in range(4):
+            for x in (k * 0.1, k / 10.0):
+                self.assertEqual(len(_owner(grid, x, x)), 1, x)
+
+    def test_negative_coordinates(self):
+        grid = tiles(-0.25, -0.3, -0.1, 0.1, 0.1)
+        self.assertEqual(sorted(set(t[0] for t in grid)), [-0.3, -0.2, -0.1])
+        self.assertEqual(sorted(set(t[1] for t in grid)), [-0.3, -0.2, -0.1, 0.0, 0.1])
+        for lat, lng in ((-0.25, -0.3), (-0.1, 0.1), (-0.2, 0.0), (-0.1, -0.1)):
+            self.assertEqual(len(_owner(grid, lat, lng)), 1, (lat, lng))
+
+    def test_every_point_has_one_tile(self):
+        rnd = random.Random(7)
+        for _ in range(200):
+            size = rnd.choice((0.1, 0.25, 0.05, 1.0))
+            lat0, lng0 = rnd.uniform(-80, 79), rnd.uniform(-170, 169)
+            box = (lat0, lng0, lat0 + rnd.uniform(0, 1), lng0 + rnd.uniform(0, 1))
+            grid = tiles(box[0], box[1], box[2], box[3], size)
+            for lat, lng in ((box[0], box[1]), (box[2], box[3]),
+                             (rnd.uniform(box[0], box[2]), rnd.uniform(box[1], box[3]))):
+                self.assertEqual(len(_owner(grid, lat, lng)), 1, (box, size))
+
+
+class GridIndexTest(unittest.TestCase):
+
+    def _rows(self, rnd, n, lat, lng, spread):
+        return [{'id': i, 'lat': rnd.uniform(lat - spread, lat + spread),
+                 'lng': rnd.uniform(lng - spread, lng + spread)} for i in range(n)]
+
+    def _brute_nearest(self, rows, lat, lng, k, max_distance=None):
+        found = sorted(((haversine(lat, lng, r['lat'], r['lng']), r['id']) for r in rows))
+        if max_distance is not None:
+            found = [f for f in found if f[0] <= max_distance]
+        return found[:k]
+
+    def test_nearest_matches_brute_force(self):
+        rnd = random.Random(11)
+        for lat, lng, spread, cell in ((13.7, 100.5, 0.5, 0.01), (-33.9, -70.6, 0.2, 0.05),
+                                       (0.0, 0.0, 1.0, 0.1), (64.1, -21.9, 0.3, 0.02),
+                                       (-78.0, 166.0, 2.0, 0.25)):
+            rows = self._rows(rnd, 400, lat, lng, spread)
+            index = GridIndex(rows, cell_size=cell)
+            for _ in range(30):
+                # query points inside, at the edge of and well outside the data
+                plat = lat + rnd.uniform(-3, 3) * spread
+                plng = lng + rnd.uniform(-3, 3) * spread
+                for k in (1, 5, 50):
+                    got = [(d, r['id']) for d, r in index.nearest(plat, plng, k=k)]
+                    want = self._brute_nearest(rows, plat, plng, k)
+                    self.assertEqual([i for _, i in got], [i for _, i in want],
+                                     (plat, plng, k, cell))
+                limit = rnd.uniform(0, spread) * 111000
+                got = [r['id'] for _, r in index.nearest(plat, plng, k=10, max_distance=limit)]
+                want = [i for _, i in self._brute_nearest(rows, plat, plng, 10, limit)]
+                self.assertEqual(got, want)
+
+    def test_far_point_searches_only_occupied_cells(self):
+        rnd = random.Random(3)
+        rows = self._rows(rnd, 200, 13.5, 100.5, 0.5)
+        index = GridIndex(rows, cell_size=0.01)
+        t = time.time()
+        got = [r['id'] for _, r in index.nearest(20.5, 107.5, k=3)]
+        self.assertLess(time.time() - t, 0.2)
+        self.assertEqual(got, [i for _, i in self._brute_nearest(rows, 20.5, 107.5, 3)])
+
+    def test_nearest_edge_cases(self):
+        self.assertEqual(GridIndex().nearest(0, 0, k=3), [])
+        index = GridIndex([{'lat': 1.0, 'lng': 1.0}, {'lat': None, 'lng': 2.0}])
+        self.assertEqual(len(index), 1)
+        self.assertEqual(index.nearest(1.0, 1.0, k=0), [])
+        self.assertEqual([d for d, _ in index.nearest(1.0, 1.0, k=5)], [0.0])
+
+    def test_within_matches_brute_force(self):
+        rnd = random.Random(5)
+        rows = self._rows(rnd, 500, -0.05, -0.05, 0.3)
+        # rows on cell edges and on the query box edges
+        rows += [{'id': 1000 + i, 'lat': i * 0.01 - 0.1, 'lng': -0.2} for i in range(21)]
+        index = GridIndex(rows, cell_size=0.01)
+        boxes = [(-0.1, -0.2, 0.1, 0.0), (-0.3, -0.3, -0.25, -0.29)]
+        for _ in range(50):
+            lat0, lng0 = rnd.uniform(-0.4, 0.2), rnd.uniform(-0.4, 0.2)
+            boxes.append((lat0, lng0, lat0 + rnd.uniform(0, 0.3), lng0 + rnd.uniform(0, 0.3)))
+        for box in boxes:
+            want = sorted(r['id'] for r in rows
+                          if box[0] <= r['lat'] <= box[2] and box[1] <= r['lng'] <= box[3])
+            self.assertEqual(sorted(r['id'] for r in index.within(*box)), want, box)
+
+
+class QueryBboxTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockServer().start()
+        conn = Scdi(self.server.username, 'key', api_url=self.server.api_url)
+        self.bucket = conn.create_geotemporal_bucket('places', COLUMNS)
+        # a grid of points, many on tile edges, with negative coordinates
+        self.rows = [{'ts': n, 'lat': i * 0.05, 'lng': j * 0.05}
+                     for n, (i, j) in enumerate((i, j) for i in range(-8, 8) for j in range(-8, 8))]
+        self.bucket.add_rows(self.rows)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_rows_on_tile_edges_are_returned_once(self):
+        for box in ((-0.2, -0.3, 0.1, 0.2), (-0.35, -0.4, -0.05, -0.1), (0.0, 0.0, 0.0, 0.0)):
+            want = [r for r in self.rows
+                    if box[0] <= r['lat'] <= box[2] and box[1] <= r['lng'] <= box[3]]
+            got = self.bucket.query_bbox(*box, tile_size=0.1, ts_column='ts')
+            self.assertEqual(got, want, box)
+
+    def test_index_and_windows(self):
+        index = self.bucket.query_bbox(-0.2, -0.2, 0.2, 0.2, fromEpoch=0, toEpoch=255,
+                                       window=50, tile_size=0.1, ts_column='ts', index=True)
+        want = [r for r in self.rows if -0.2 <= r['lat'] <= 0.2 and -0.2 <= r['lng'] <= 0.2]
+        self.assertEqual(sorted(r['ts'] for r in index), [r['ts'] for r in want])
+        d, row = index.nearest(0.01, 0.01)[0]
+        self.assertEqual((row['lat'], row['lng']), (0.0, 0.0))
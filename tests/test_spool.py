@@ -0,0 +1,85 @@
+"""Spooled timeseries writes against the mock server"""
+from __future__ import division, print_function
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from benchmarks.mockserver import MockServer
+from pyscdi import Scdi
+from pyscdi.spool import POSITION
+
+
+COLUMNS = [{'name': 'timestamp', 'type': 'timestamp'}, {'name': 'value', 'type': 'int'}]
+
+
+def _rows(start, n):
+    return [{'timestamp': start + i, 'value': i} for i in range(n)]
+
+
+class SpoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockServer().start()
+        self.conn = Scdi(self.server.username, 'key', api_url=self.server.api_url)
+        self.bucket = self.conn.create_timeseries_bucket('series', COLUMNS)
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp)
+
+    def _spool(self, **kwargs):
+        return self.bucket.spool(self.tmp, defer=True, retry_interval=0.05, **kwargs)
+
+    def _stored(self):
+        return sorted(r['timestamp'] for r in self.server.buckets['series'].rows)
+
+    def test_deferred_rows_are_replayed(self):
+        with self._spool(batch_rows=7) as spool:
+            spool.add_rows(_rows(0, 30))
+            spool.add_rows(_rows(30, 20))
+            self.assertTrue(spool.drain(10))
+        self.assertEqual(self._stored(), list(range(50)))
+        self.assertEqual(os.listdir(self.tmp), [])
+
+    def test_restart_after_drain(self):
+        with self._spool() as spool:
+            spool.add_rows(_rows(0, 50))
+            self.assertTrue(spool.drain(10))
+        with self._spool() as spool:
+            spool.add_rows(_rows(50, 50))
+            self.assertTrue(spool.drain(10))
+        self.assertEqual(self._stored(), list(range(100)))
+
+    def test_stale_position_does_not_skip_rows(self):
+        # a crash between removing a segment and clearing its position
+        with open(os.path.join(self.tmp, POSITION), 'w') as f:
+            json.dump({'segment': '%012d.seg' % 0, 'offset': 100}, f)
+        with self._spool() as spool:
+            spool.add_rows(_rows(0, 50))
+            self.assertTrue(spool.drain(10))
+        self.assertEqual(self._stored(), list(range(50)))
+
+    def test_resume_from_saved_position(self):
+        lines = [json.dumps(_rows(i * 10, 10)) + '\n' for i in range(3)]
+        with open(os.path.join(self.tmp, '%012d.seg' % 4), 'w') as f:
+            f.writelines(lines)
+        with open(os.path.join(self.tmp, POSITION), 'w') as f:
+            json.dump({'segment': '%012d.seg' % 4, 'offset': len(lines[0])}, f)
+        with self._spool() as spool:
+            self.assertTrue(spool.drain(10))
+            spool.add_rows(_rows(30, 5))
+            self.assertTrue(spool.drain(10))
+        self.assertEqual(self._stored(), list(range(10, 35)))
+
+    def test_outage_spools_until_the_server_recovers(self):
+        self.server.error_rate = 1.0
+        with self.bucket.spool(self.tmp, retry_interval=0.05, direct_deadline=1.0) as spool:
+            spool.add_rows(_rows(0, 10))
+            spool.add_rows(_rows(10, 10))
+            self.assertEqual(spool.stats()['rows_spooled'], 20)
+            self.server.error_rate = 0.0
+            self.assertTrue(spool.drain(10))
+        self.assertEqual(self._stored(), list(range(20)))
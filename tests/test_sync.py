@@ -0,0 +1,112 @@
+"""Directory sync against the mock server"""
+from __future__ import division, print_function
+import os
+import shutil
+import tempfile
+import unittest
+
+from benchmarks.mockserver import MockServer
+from pyscdi import Scdi
+from pyscdi.main import _remote_entry
+
+PART = 1000
+
+
+class SyncDirectoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockServer().start()
+        conn = Scdi(self.server.username, 'key', api_url=self.server.api_url)
+        self.bucket = conn.create_kws_bucket('objects')
+        self.tmp = tempfile.mkdtemp()
+        self.progress = []
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp)
+
+    def _write(self, rel, data):
+        path = os.path.join(self.tmp, *rel.split('/'))
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def _sync(self, **kwargs):
+        self.progress = []
+        result = self.bucket.sync_directory(
+            self.tmp, prefix='backup/', max_size=PART, max_workers=3,
+            progress=lambda *args: self.progress.append(args), **kwargs)
+        return sorted(result['uploaded']), sorted(result['skipped']), result['failed']
+
+    def _stored(self):
+        return dict((name, data) for name, (data, _) in self.server.buckets['objects'].objects.items())
+
+    def _fill(self):
+        self._write('small.txt', b'a' * 10)
+        self._write('exact.bin', b'b' * PART)  # one part of a multipart upload
+        self._write('sub/large.bin', os.urandom(3 * PART + 1))
+        self._write('sub/notes.log', b'log')
+
+    def test_unchanged_files_are_skipped(self):
+        self._fill()
+        names = ['backup/exact.bin', 'backup/small.txt', 'backup/sub/large.bin',
+                 'backup/sub/notes.log']
+        self.assertEqual(self._sync(), (names, [], {}))
+        etags = dict((name, etag) for name, (_, etag)
+                     in self.server.buckets['objects'].objects.items())
+        self.assertTrue(etags['backup/sub/large.bin'].endswith('-4'))
+        self.assertTrue(etags['backup/exact.bin'].endswith('-1'))
+        self.assertNotIn('-', etags['backup/small.txt'])
+        self.assertEqual(self._sync(), ([], names, {}))
+        self.assertEqual(sorted(p[3] for p in self.progress), ['skip'] * 4)
+        self.assertEqual(sorted(p[0] for p in self.progress), [1, 2, 3, 4])
+        self.assertEqual(set(p[1] for p in self.progress), set([4]))
+
+    def test_changed_files_of_the_same_size_are_uploaded(self):
+        self._fill()
+        self._sync()
+        self._write('small.txt', b'c' * 10)
+        large = os.urandom(3 * PART + 1)
+        self._write('sub/large.bin', large)
+        self._write('new.txt', b'new')
+        self.assertEqual(self._sync(), (
+            ['backup/new.txt', 'backup/small.txt', 'backup/sub/large.bin'],
+            ['backup/exact.bin', 'backup/sub/notes.log'], {}))
+        stored = self._stored()
+        self.assertEqual(stored['backup/small.txt'], b'c' * 10)
+        self.assertEqual(stored['backup/sub/large.bin'], large)
+
+    def test_dry_run_uploads_nothing(self):
+        self._fill()
+        uploaded, skipped, failed = self._sync(dry_run=True)
+        self.assertEqual(len(uploaded), 4)
+        self.assertEqual(self._stored(), {})
+        self.assertEqual(sorted(p[3] for p in self.progress), ['upload'] * 4)
+
+    def test_include_and_exclude(self):
+        self._fill()
+        self.assertEqual(self._sync(include=['sub/*'], exclude=['*.log']),
+                         (['backup/sub/large.bin'], [], {}))
+        self.assertEqual(self._sync(exclude=['*.bin', 'sub/*']), (['backup/small.txt'], [], {}))
+        self.assertEqual(sorted(self._stored()), ['backup/small.txt', 'backup/sub/large.bin'])
+
+
+class RemoteEntryTest(unittest.TestCase):
+
+    def test_mock_listing(self):
+        server = MockServer().start()
+        try:
+            conn = Scdi(server.username, 'key', api_url=server.api_url)
+            bucket = conn.create_kws_bucket('objects')
+            server.buckets['objects'].objects['a'] = (b'xyz', 'abc-2')
+            entry, = bucket.list_objects()
+        finally:
+            server.stop()
+        self.assertEqual(_remote_entry(entry), {'a': (3, 'abc-2')})
+
+    def test_other_spellings(self):
+        self.assertEqual(_remote_entry({'key': 'a', 'length': 3, 'ETag': '"abc"'}),
+                         {'a': (3, 'abc')})
+        self.assertEqual(_remote_entry({'objectName': 'a', 'md5': 'abc'}), {'a': (None, 'abc')})
+        self.assertEqual(_remote_entry('a'), {'a': (None, None)})
@@ -0,0 +1,97 @@
+"""Buffered timeseries writes against the mock server"""
+from __future__ import division, print_function
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from benchmarks.mockserver import MockServer
+from pyscdi import Scdi
+
+COLUMNS = [{'name': 'timestamp', 'type': 'timestamp'}, {'name': 'value', 'type': 'double'}]
+THREADS = 8
+
+
+class BufferedWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockServer().start()
+        self.conn = Scdi(self.server.username, 'key', api_url=self.server.api_url)
+        self.bucket = self.conn.create_timeseries_bucket('series', COLUMNS)
+        self.flushed = []
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _on_flush(self, rows, error):
+        self.flushed.append((len(rows), error))
+
+    def _stored(self):
+        return sorted(r['timestamp'] for r in self.server.buckets['series'].rows)
+
+    def test_batches_are_sent_as_encoded(self):
+        with self.bucket.buffered_writer(max_rows=7, on_flush=self._on_flush) as w:
+            for i in range(20):
+                w.add_row({'timestamp': i, 'value': i / 2.0})
+        self.assertEqual(self._stored(), list(range(20)))
+        self.assertEqual(self.server.buckets['series'].rows[3], {'timestamp': 3, 'value': 1.5})
+        self.assertEqual(self.flushed, [(7, None), (7, None), (6, None)])
+
+    def test_unserializable_row_is_reported(self):
+        with self.bucket.buffered_writer(on_flush=self._on_flush) as w:
+            w.add_row({'timestamp': 0, 'value': 1.0})
+            w.add_row({'timestamp': 1, 'value': object()})
+            w.add_row({'timestamp': 2, 'value': 2.0})
+        self.assertEqual(self._stored(), [0, 2])
+        self.assertEqual(w.rows_failed, 1)
+        self.assertIsInstance(self.flushed[0][1], TypeError)
+
+    def test_close_writes_rows_of_concurrent_producers(self):
+        w = self.bucket.buffered_writer(max_rows=50, max_queue=10)
+        accepted = []
+        lock = threading.Lock()
+
+        def produce(n):
+            i = 0
+            while True:
+                try:
+                    w.add_row({'timestamp': n * 100000 + i, 'value': 0.0})
+                except ValueError:
+                    return
+                with lock:
+                    accepted.append(n * 100000 + i)
+                i += 1
+
+        threads = [threading.Thread(target=produce, args=(n,)) for n in range(THREADS)]
+        for t in threads:
+            t.start()
+        while len(accepted) < 500:
+            time.sleep(0.01)
+        w.close()
+        for t in threads:
+            t.join()
+        self.assertEqual(self._stored(), sorted(accepted))
+        with self.assertRaises(ValueError):
+            w.add_row({'timestamp': 0, 'value': 0.0})
+
+    def test_flushes_follow_the_spool_backlog(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.server.error_rate = 1.0
+        spool = self.bucket.spool(tmp, retry_interval=0.05, direct_deadline=1.0)
+        with self.bucket.buffered_writer(spool=spool, on_flush=self._on_flush) as w:
+            for i in range(50):
+                w.add_row({'timestamp': i, 'value': 0.0})
+                if i % 10 == 9:
+                    w.flush()
+            self.assertEqual(w.rows_spooled, 50)
+            # only the first flush tried the server
+            self.assertEqual([e is None for _, e in self.flushed], [False] + [True] * 4)
+            self.server.error_rate = 0.0
+            self.assertTrue(spool.drain(10))
+            w.add_row({'timestamp': 50, 'value': 0.0})
+        spool.close()
+        self.assertEqual([r['timestamp'] for r in self.server.buckets['series'].rows],
+                         list(range(51)))
+        self.assertEqual(w.rows_written, 1)